@@ -13,6 +13,22 @@ DATABASES = {
     }
 }
 
+# Cache
+# https://docs.djangoproject.com/en/3.2/topics/cache/
+# It must be shared by all the processes serving the site (e.g. the workers of gunicorn): the roles of the users and the
+# versions of the weeks are kept there, and a change made by a process must be seen by all the others. The files in
+# LOCATION are shared by the processes of the same host; with more hosts, use memcached or redis.
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': os.path.join(BASE_DIR, 'cache'),
+        'OPTIONS': {
+            'MAX_ENTRIES': 100000
+        }
+    }
+}
+
 # SECURITY WARNING: keep the secret key used in production secret!
 SECRET_KEY = '+xqb9fvu^c%0cnjaqma3d(=$=&+e7l6l0qa)b#h11=qa)13gio'
 
@@ -57,6 +57,7 @@ MIDDLEWARE = [
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'timetable.middleware.SchoolRoleMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -81,6 +82,13 @@ TEMPLATES = [
 
 WSGI_APPLICATION = 'SchoolCalendar.wsgi.application'
 
+# Cache
+# https://docs.djangoproject.com/en/3.0/topics/cache/
+# It keeps the roles and the schools of the users across requests (see timetable/signals.py for the invalidation), so
+# it must be shared by all the processes (see local_settings.py).
+
+CACHES = local_settings.CACHES
+
 # Model default definitions
 
 DEFAULT_AUTO_FIELD = 'django.db.models.AutoField'
@@ -1,23 +1,44 @@
+// Everything needed to show the current week of the course (see getWeekBundle)
+let weekBundle = null;
+
 async function loadData(loadAssign=true, resetTeachers=true){
     resetTeacherState();
+    await getWeekBundle();
     if(resetTeachers){
-        await getTeachers();
+        showTeachers(weekBundle.hours_per_teacher_in_class);
     }
 
     timetable.deleteAllEvents();
     timetable.deleteAllBlocks();
-    await getBlocks();
-
-
-    let startDate = currentDate;
-    let endDate = moment(startDate).add(6, 'days').toDate();
+    showBlocks(weekBundle.hour_slots);
 
-    timetable.setDays(new Date(startDate));
+    timetable.setDays(new Date(currentDate));
 
-    await getHolidays(startDate, endDate);
-    await getStages(startDate, endDate);
+    lockPeriods(weekBundle.holidays);
+    lockPeriods(weekBundle.stages);
     if(loadAssign)
-        await getAssignments(startDate, endDate, true);
+        showAssignments(weekBundle.assignments, true);
+}
+
+async function getWeekBundle(){
+    let url = _URL['week_bundle'];
+    let data = {
+        'school_year': $('#school_year').val(),
+        'course': $('#course_section').val(),
+        'monday': formatDate(currentDate)
+    };
+    weekBundle = {
+        hour_slots: [], hours_per_teacher_in_class: [], assignments: [], teacher_assignments: {},
+        absence_blocks: {}, holidays: [], stages: []
+    };
+    if(!data.course)
+        return;
+    try{
+        weekBundle = await $.get(url, data=data);
+    }
+    catch{
+        console.log("No week bundle");
+    }
 }
 
 async function loadTeacherData(){
@@ -135,24 +156,13 @@ function createExtraBlock(date, hourStart, hourEnd, deletable=false){
     }
     return block;
 }
-async function getBlocks(){
-    let url = _URL['hour_slot'];
-    let data = {
-        'school_year': $('#school_year').val(),
-        'course': $('#course_section').val()
-    };
-    try{
-        data = await $.get(url, data=data);
-        for(let slot of data){
-            let starts_at = parseStringTime(slot.starts_at);
-            let ends_at = parseStringTime(slot.ends_at);
+function showBlocks(hourSlots){
+    for(let slot of hourSlots){
+        let starts_at = parseStringTime(slot.starts_at);
+        let ends_at = parseStringTime(slot.ends_at);
 
-            let block = new Block(slot.id, slot.hour_number + _TRANS['lecture_title'], slot.day_of_week, starts_at, ends_at);
-            timetable.addBlock(block);
-        }
-    }
-    catch{
-        console.log("No blocks");
+        let block = new Block(slot.id, slot.hour_number + _TRANS['lecture_title'], slot.day_of_week, starts_at, ends_at);
+        timetable.addBlock(block);
     }
 }
 async function getClassYears(){
@@ -194,96 +204,75 @@ async function getClassSections(){
     }
 }
 
-async function getTeachers(){
-    let url = _URL['hour_per_teacher_in_class'];
-    let data = {
-        'school_year': $('#school_year').val(),
-        'course': $('#course_section').val()
-    };
+function showTeachers(hoursPerTeacherInClass){
     $('#teachers_list').empty();
-    try{
-        data = await $.get(url, data=data);
-        for(let tea of data){
-            // Only professors that are in activity should be visualized in the right column.
-            if (tea.teacher.in_activity) {
-                let btn_bes = (tea.hours_bes > 0) ? "" : "disabled";
-                let btn_co_teaching = (tea.hours_co_teaching > 0) ? "" : "disabled";
-                let html = `
-                    <li class="list-group-item list-teachers" data-teacher-id="${tea.id}">
-                        <div class="row">
-                            <div class="col-10 teacher-search-field">
-                                <b>${tea.teacher.last_name} ${tea.teacher.first_name}</b> - ${tea.subject.name}
-                            </div>
-                            <div class="col-2 p-0">
-                                <button class="btn btn-link text-right" style="color: inherit" data-toggle="collapse" data-target="#tea-collapse-${tea.id}" aria-expanded="true" aria-controls="tea-collapse-${tea.id}">
-                                    <svg class="bi bi-caret-down-fill" width="1em" height="1em" viewBox="0 0 16 16" fill="currentColor" xmlns="http://www.w3.org/2000/svg">
-                                        <path d="M7.247 11.14L2.451 5.658C1.885 5.013 2.345 4 3.204 4h9.592a1 1 0 0 1 .753 1.659l-4.796 5.48a1 1 0 0 1-1.506 0z"/>
-                                    </svg>
-                                </button>
-                            </div>                        
+    for(let tea of hoursPerTeacherInClass){
+        // Only professors that are in activity should be visualized in the right column.
+        if (tea.teacher.in_activity) {
+            let btn_bes = (tea.hours_bes > 0) ? "" : "disabled";
+            let btn_co_teaching = (tea.hours_co_teaching > 0) ? "" : "disabled";
+            let html = `
+                <li class="list-group-item list-teachers" data-teacher-id="${tea.id}">
+                    <div class="row">
+                        <div class="col-10 teacher-search-field">
+                            <b>${tea.teacher.last_name} ${tea.teacher.first_name}</b> - ${tea.subject.name}
                         </div>
-                         
-                        <div id="tea-collapse-${tea.id}" class="collapse">
-                            <div class="row font-italic">
-                                <span class="col-9">${_TRANS['hours_teaching']}:</span>
-                                <span class="col-3 tea-hours">${tea.hours}</span>
-                            </div>
-                            <div class="row font-italic">
-                                <span class="col-9">${_TRANS['hours_bes']}</span>
-                                <span class="col-3 tea-hours_bes">${tea.hours_bes}</span>
-                            </div>
-                            <div class="row font-italic">
-                                <span class="col-9">${_TRANS['hours_co-teaching']}</span>
-                                <span class="col-3 tea-hours_bes">${tea.hours_co_teaching}</span>
-                            </div>
-                            <hr/>
-                            <div class="row font-italic">
-                                <span class="col-9">${_TRANS['missing_hours']}:</span>
-                                <span class="col-3 tea-missing_hours">${tea.missing_hours}</span>
-                            </div>
-                            <div class="row font-italic">
-                                <span class="col-9">${_TRANS['hours_bes']}</span>
-                                <span class="col-3 tea-missing_bes">${tea.missing_hours_bes}</span>
-                            </div>
-                            <div class="row font-italic">
-                                <span class="col-9">${_TRANS['hours_co-teaching']}</span>
-                                <span class="col-3 tea-missing_bes">${tea.missing_hours_co_teaching}</span>
-                            </div>
+                        <div class="col-2 p-0">
+                            <button class="btn btn-link text-right" style="color: inherit" data-toggle="collapse" data-target="#tea-collapse-${tea.id}" aria-expanded="true" aria-controls="tea-collapse-${tea.id}">
+                                <svg class="bi bi-caret-down-fill" width="1em" height="1em" viewBox="0 0 16 16" fill="currentColor" xmlns="http://www.w3.org/2000/svg">
+                                    <path d="M7.247 11.14L2.451 5.658C1.885 5.013 2.345 4 3.204 4h9.592a1 1 0 0 1 .753 1.659l-4.796 5.48a1 1 0 0 1-1.506 0z"/>
+                                </svg>
+                            </button>
+                        </div>                        
+                    </div>
+                     
+                    <div id="tea-collapse-${tea.id}" class="collapse">
+                        <div class="row font-italic">
+                            <span class="col-9">${_TRANS['hours_teaching']}:</span>
+                            <span class="col-3 tea-hours">${tea.hours}</span>
                         </div>
-                        <div class="row">
-                            <button type="button" class="col-6 btn btn-sm cal-event" onclick="teacherClick($(this).parent().parent(), ${tea.id}, ${tea.teacher.id}, ${tea.subject.id}, ${tea.school}, false, false)">${_TRANS['assign_lecture']}</button>
-                            <button type="button" class="col-6 btn btn-sm cal-event-bes" onclick="teacherClick($(this).parent().parent(), ${tea.id}, ${tea.teacher.id}, ${tea.subject.id}, ${tea.school}, true, false)" ${btn_bes}>${_TRANS['assign_bes']}</button>
-                            <button type="button" class="col-12 btn btn-sm cal-event-co-teaching mt-1" onclick="teacherClick($(this).parent().parent(), ${tea.id}, ${tea.teacher.id}, ${tea.subject.id}, ${tea.school}, false, true)" ${btn_co_teaching}>${_TRANS['assign_co-teaching']}</button>
+                        <div class="row font-italic">
+                            <span class="col-9">${_TRANS['hours_bes']}</span>
+                            <span class="col-3 tea-hours_bes">${tea.hours_bes}</span>
                         </div>
-                    </li>`;
-                $('#teachers_list').append(html);
-            }
+                        <div class="row font-italic">
+                            <span class="col-9">${_TRANS['hours_co-teaching']}</span>
+                            <span class="col-3 tea-hours_bes">${tea.hours_co_teaching}</span>
+                        </div>
+                        <hr/>
+                        <div class="row font-italic">
+                            <span class="col-9">${_TRANS['missing_hours']}:</span>
+                            <span class="col-3 tea-missing_hours">${tea.missing_hours}</span>
+                        </div>
+                        <div class="row font-italic">
+                            <span class="col-9">${_TRANS['hours_bes']}</span>
+                            <span class="col-3 tea-missing_bes">${tea.missing_hours_bes}</span>
+                        </div>
+                        <div class="row font-italic">
+                            <span class="col-9">${_TRANS['hours_co-teaching']}</span>
+                            <span class="col-3 tea-missing_bes">${tea.missing_hours_co_teaching}</span>
+                        </div>
+                    </div>
+                    <div class="row">
+                        <button type="button" class="col-6 btn btn-sm cal-event" onclick="teacherClick($(this).parent().parent(), ${tea.id}, ${tea.teacher.id}, ${tea.subject.id}, ${tea.school}, false, false)">${_TRANS['assign_lecture']}</button>
+                        <button type="button" class="col-6 btn btn-sm cal-event-bes" onclick="teacherClick($(this).parent().parent(), ${tea.id}, ${tea.teacher.id}, ${tea.subject.id}, ${tea.school}, true, false)" ${btn_bes}>${_TRANS['assign_bes']}</button>
+                        <button type="button" class="col-12 btn btn-sm cal-event-co-teaching mt-1" onclick="teacherClick($(this).parent().parent(), ${tea.id}, ${tea.teacher.id}, ${tea.subject.id}, ${tea.school}, false, true)" ${btn_co_teaching}>${_TRANS['assign_co-teaching']}</button>
+                    </div>
+                </li>`;
+            $('#teachers_list').append(html);
         }
     }
-    catch{
-        console.log("No teachers");
-    }
 }
 
 async function refreshTeachers(){
-    let url = _URL['hour_per_teacher_in_class'];
-    let data = {
-        'school_year': $('#school_year').val(),
-        'course': $('#course_section').val()
-    };
-    try{
-        data = await $.get(url, data=data);
-        for(let tea of data){
-            let teaElement = $(`#teachers_list *[data-teacher-id=${tea.id}]`);
+    // The hours of the teachers are the ones of the week bundle, reloaded by loadData
+    for(let tea of weekBundle.hours_per_teacher_in_class){
+        let teaElement = $(`#teachers_list *[data-teacher-id=${tea.id}]`);
 
-            teaElement.find('.tea-hours').text(tea.hours);
-            teaElement.find('.tea-hours_bes').text(tea.hours_bes);
-            teaElement.find('.tea-missing_hours').text(tea.missing_hours);
-            teaElement.find('.tea-missing_bes').text(tea.missing_bes);
-        }
-    }
-    catch{
-        console.log("No teachers");
+        teaElement.find('.tea-hours').text(tea.hours);
+        teaElement.find('.tea-hours_bes').text(tea.hours_bes);
+        teaElement.find('.tea-missing_hours').text(tea.missing_hours);
+        teaElement.find('.tea-missing_bes').text(tea.missing_bes);
     }
 }
 
@@ -325,93 +314,96 @@ async function getAssignmentsGeneric(url, startDate, endDate, showTeacher=true){
     timetable.deleteAllEvents();
     try{
         data = await $.get(url, data=data);
-        for(let assign of data){
-            let blockId = assign.hour_slot;
-            let blockCreated = blockId in timetable.blocks; //for room and teacher timetable, the blocks are not created (due to hourSlotsGroups)
-            if(blockId === null || !blockCreated){
-                blockId = createExtraBlock(assign.date, assign.hour_start, assign.hour_end).id;
-            }
+        showAssignments(data, showTeacher);
+    }
+    catch{
+        console.log("No assignments");
+    }
+}
+function showAssignments(assignments, showTeacher=true){
+    for(let assign of assignments){
+        let blockId = assign.hour_slot;
+        let blockCreated = blockId in timetable.blocks; //for room and teacher timetable, the blocks are not created (due to hourSlotsGroups)
+        if(blockId === null || !blockCreated){
+            blockId = createExtraBlock(assign.date, assign.hour_start, assign.hour_end).id;
+        }
 
-            let teacher = assign.teacher.first_name + " " + assign.teacher.last_name;
-            let course = assign.course.year + " " + assign.course.section;
-            let subject = assign.subject.name;
-
-            let teacherLbl = teacher;
-            if (!showTeacher)
-                teacherLbl = course;
-            if (assign.room)
-                subject = `
-                <svg width="1em" height="1em" viewBox="0 0 16 16" class="bi bi-tag-fill" fill="currentColor" xmlns="http://www.w3.org/2000/svg">
-                    <path fill-rule="evenodd" d="M2 1a1 1 0 0 0-1 1v4.586a1 1 0 0 0 .293.707l7 7a1 1 0 0 0 1.414 0l4.586-4.586a1 1 0 0 0 0-1.414l-7-7A1 1 0 0 0 6.586 1H2zm4 3.5a1.5 1.5 0 1 1-3 0 1.5 1.5 0 0 1 3 0z"/>
-                </svg> ` + subject;
-            let customEvent = new Event(assign.id, teacherLbl, subject);
-            let clickEvent = async (event) => {
-                $('#modal-lecture-date').text(assign.date);
-                $('#modal-lecture-hours').text(`${assign.hour_start} - ${assign.hour_end}`);
-                $('#modal-lecture-course').text(course);
-                $('#modal-lecture-teacher').text(teacher);
-                $('#modal-lecture-subject').text(assign.subject.name);
-                $('#modal-lecture-bes').html(`<i class="fa ${assign.bes ? 'fa-check' : 'fa-times'}"></i>`);
-                $('#modal-lecture-coteaching').html(`<i class="fa ${assign.co_teaching ? 'fa-check' : 'fa-times'}"></i>`);
-                $('#modal-lecture-absent').html(`<i class="fa ${assign.absent ? 'fa-check' : 'fa-times'}"></i>`);
-                $('#modal-lecture-substitution').html(`<i class="fa ${assign.substitution ? 'fa-check' : 'fa-times'}"></i>`);
-                $('#modal-lecture-free-substitution').html(`<i class="fa ${assign.free_substitution ? 'fa-check' : 'fa-times'}"></i>`);
+        let teacher = assign.teacher.first_name + " " + assign.teacher.last_name;
+        let course = assign.course.year + " " + assign.course.section;
+        let subject = assign.subject.name;
+
+        let teacherLbl = teacher;
+        if (!showTeacher)
+            teacherLbl = course;
+        if (assign.room)
+            subject = `
+            <svg width="1em" height="1em" viewBox="0 0 16 16" class="bi bi-tag-fill" fill="currentColor" xmlns="http://www.w3.org/2000/svg">
+                <path fill-rule="evenodd" d="M2 1a1 1 0 0 0-1 1v4.586a1 1 0 0 0 .293.707l7 7a1 1 0 0 0 1.414 0l4.586-4.586a1 1 0 0 0 0-1.414l-7-7A1 1 0 0 0 6.586 1H2zm4 3.5a1.5 1.5 0 1 1-3 0 1.5 1.5 0 0 1 3 0z"/>
+            </svg> ` + subject;
+        let customEvent = new Event(assign.id, teacherLbl, subject);
+        let clickEvent = async (event) => {
+            $('#modal-lecture-date').text(assign.date);
+            $('#modal-lecture-hours').text(`${assign.hour_start} - ${assign.hour_end}`);
+            $('#modal-lecture-course').text(course);
+            $('#modal-lecture-teacher').text(teacher);
+            $('#modal-lecture-subject').text(assign.subject.name);
+            $('#modal-lecture-bes').html(`<i class="fa ${assign.bes ? 'fa-check' : 'fa-times'}"></i>`);
+            $('#modal-lecture-coteaching').html(`<i class="fa ${assign.co_teaching ? 'fa-check' : 'fa-times'}"></i>`);
+            $('#modal-lecture-absent').html(`<i class="fa ${assign.absent ? 'fa-check' : 'fa-times'}"></i>`);
+            $('#modal-lecture-substitution').html(`<i class="fa ${assign.substitution ? 'fa-check' : 'fa-times'}"></i>`);
+            $('#modal-lecture-free-substitution').html(`<i class="fa ${assign.free_substitution ? 'fa-check' : 'fa-times'}"></i>`);
+
+            let roomSelect = $('#modal-lecture-room');
+            let schoolId = assign.subject.school;
+            let rooms = await addAvailableRoomsToSelect(roomSelect, schoolId, assign.date, assign.hour_start, assign.hour_end);
+
+            if(assign.room) {
+                roomSelect.val(assign.room.id);
+            }
+            roomSelect.prop('disabled', !showTeacher);
 
+            $('#btn-modal-lecture-save').unbind("click");
+            //attach click event to the confirmation button
+            $('#btn-modal-lecture-save').click(() => {
                 let roomSelect = $('#modal-lecture-room');
-                let schoolId = assign.subject.school;
-                let rooms = await addAvailableRoomsToSelect(roomSelect, schoolId, assign.date, assign.hour_start, assign.hour_end);
-
-                if(assign.room) {
-                    roomSelect.val(assign.room.id);
-                }
-                roomSelect.prop('disabled', !showTeacher);
-
-                $('#btn-modal-lecture-save').unbind("click");
-                //attach click event to the confirmation button
-                $('#btn-modal-lecture-save').click(() => {
-                    let roomSelect = $('#modal-lecture-room');
-                    updateAssignmentRoom(assign.id, roomSelect.val());
-                });
-
-                $('#modalLecture').modal('show');
-            };
-            let deleteEvent = showTeacher ? deleteAssignment : null;
-            timetable.addEvent(customEvent, blockId, clickEvent, deleteEvent);
-
-            if(assign.bes){
-                customEvent.htmlElement.addClass('cal-event-bes');
-            }
-            else if(assign.co_teaching){
-                customEvent.htmlElement.addClass('cal-event-co-teaching');
-            }
-            else if(assign.absent){
-                customEvent.htmlElement.addClass('cal-event-absent');
-            }
-            else if(assign.substitution){
-                customEvent.htmlElement.addClass('cal-event-substitution');
-            }
-            else{
-                customEvent.htmlElement.css('background-color', assign.subject.color);
-            }
+                updateAssignmentRoom(assign.id, roomSelect.val());
+            });
+
+            $('#modalLecture').modal('show');
+        };
+        let deleteEvent = showTeacher ? deleteAssignment : null;
+        timetable.addEvent(customEvent, blockId, clickEvent, deleteEvent);
 
-            let lbl_room = '';
-            if (assign.room)
-                lbl_room = 'Room: ' + assign.room.name;
-            customEvent.htmlElement.tooltip({
-                title: `
-                    <b>${teacher}</b><br/>
-                    ${subject}<br/>
-                    ${course}<br/>
-                    ${lbl_room}<br/>
-                    ${assign.hour_start.slice(0, -3)} - ${assign.hour_end.slice(0, -3)}
-                `,
-                html: true,
-                boundary: 'window'
-            })
+        if(assign.bes){
+            customEvent.htmlElement.addClass('cal-event-bes');
         }
-    }
-    catch{
-        console.log("No assignments");
+        else if(assign.co_teaching){
+            customEvent.htmlElement.addClass('cal-event-co-teaching');
+        }
+        else if(assign.absent){
+            customEvent.htmlElement.addClass('cal-event-absent');
+        }
+        else if(assign.substitution){
+            customEvent.htmlElement.addClass('cal-event-substitution');
+        }
+        else{
+            customEvent.htmlElement.css('background-color', assign.subject.color);
+        }
+
+        let lbl_room = '';
+        if (assign.room)
+            lbl_room = 'Room: ' + assign.room.name;
+        customEvent.htmlElement.tooltip({
+            title: `
+                <b>${teacher}</b><br/>
+                ${subject}<br/>
+                ${course}<br/>
+                ${lbl_room}<br/>
+                ${assign.hour_start.slice(0, -3)} - ${assign.hour_end.slice(0, -3)}
+            `,
+            html: true,
+            boundary: 'window'
+        })
     }
 }
 
@@ -440,41 +432,22 @@ async function getHolidays(startDate, endDate){
     };
     try{
         data = await $.get(url, data=data);
-        for(let day of data){
-            let start = moment(day.start);
-            let end = moment(day.end);
-            while(start <= end) {
-                timetable.lockDay(start.day() - 1, day.name);
-                start.add(1, 'days');
-            }
-        }    
+        lockPeriods(data);
     }
     catch{
         console.log("No holidays");
     }
 }
-async function getStages(startDate, endDate){
-    let url = _URL['stage'];
-    let data = {
-        'school_year': $('#school_year').val(),
-        'course': $('#course_section').val(),
-        'from_date': formatDate(startDate),
-        'to_date': formatDate(endDate)
-    };
-    try{
-        data = await $.get(url, data=data);
-        for(let day of data){
-            let start = moment(day.start);
-            let end = moment(day.end);
-            while(start <= end) {
-                timetable.lockDay(start.day() - 1, day.name);
-                start.add(1, 'days');
-            }
+function lockPeriods(periods){
+    // Lock the days of the holidays or stages (start and end are already limited to the week shown)
+    for(let day of periods){
+        let start = moment(day.start);
+        let end = moment(day.end);
+        while(start <= end) {
+            timetable.lockDay(start.day() - 1, day.name);
+            start.add(1, 'days');
         }
     }
-    catch{
-        console.log("No stages");
-    }
 }
 
 async function teacherClick(btn, teaId, teacherId, subjId, schoolId, bes, co_teaching){
@@ -491,6 +464,7 @@ async function teacherClick(btn, teaId, teacherId, subjId, schoolId, bes, co_tea
 
         await setLockedBlocksTeacher(teacherId);
         await setLockedBlocksAbsenceTeacher(teacherId);
+        await setLockedBlocksDropTargets(teacherId, bes, co_teaching);
     }
     else{
         btn.removeClass('active');
@@ -500,70 +474,63 @@ async function teacherClick(btn, teaId, teacherId, subjId, schoolId, bes, co_tea
 }
 
 async function setLockedBlocksTeacher(teacherId){
-    let school_year = $('#school_year').val();
-    let startDate = currentDate;
-    let endDate = moment(startDate).add(6, 'days').toDate();
-
-    let url = _URL['teacher_assignments']
-        .replace("12345", teacherId).replace("99999", school_year);
-    let data = {
-        'school_year': school_year,
-        'from_date': formatDate(startDate),
-        'to_date': formatDate(endDate)
-    };
-    try{
-        data = await $.get(url, data=data);
-        for(let assign of data){
-            for(let blockId of assign.conflicting_hour_slots){
-                if(blockId in timetable.blocks) {
-                    timetable.getBlock(blockId).setState('conflict');
-                    timetable.getBlock(blockId).setOnClick();
-                }
+    // The assignments of the teachers of the course in the week are in the week bundle
+    for(let assign of weekBundle.teacher_assignments[teacherId] || []){
+        for(let blockId of assign.conflicting_hour_slots){
+            if(blockId in timetable.blocks) {
+                timetable.getBlock(blockId).setState('conflict');
+                timetable.getBlock(blockId).setOnClick();
             }
-            if(assign.hour_slot === null){ // it's an extra hour_slot
-                //TODO: we should manage time conflicts in extra hour_slots
-                if(extraBlockExists(assign.date, assign.hour_start, assign.hour_end)){
-                    timetable.getBlock(assign.hour_slot).setState('conflict');
-                    timetable.getBlock(assign.hour_slot).setOnClick();
-                }
+        }
+        if(assign.hour_slot === null){ // it's an extra hour_slot
+            //TODO: we should manage time conflicts in extra hour_slots
+            if(extraBlockExists(assign.date, assign.hour_start, assign.hour_end)){
+                timetable.getBlock(assign.hour_slot).setState('conflict');
+                timetable.getBlock(assign.hour_slot).setOnClick();
             }
-        }    
-    }
-    catch{
-        console.log("No locked blocks for teacher");
+        }
     }
 }
 
 async function setLockedBlocksAbsenceTeacher(teacherId){
-    let school_year = $('#school_year').val();
-    let startDate = currentDate;
-    let endDate = moment(startDate).add(6, 'days').toDate();
+    // The absence blocks of the teachers of the course are in the week bundle
+    for(let block of weekBundle.absence_blocks[teacherId] || []){
+        let blockId = block.hour_slot;
+        let create = true;
+        if(blockId === null){
+            if(!extraBlockExists(block.date, block.hour_start, block.hour_end))
+                create = false;
+        }
+
+        if(create){
+            timetable.getBlock(blockId).setState('absence');
+            timetable.getBlock(blockId).setOnClick();
+        }
+    }
+}
 
-    let url = _URL['teacher_absence_blocks']
-        .replace("12345", teacherId).replace("99999", school_year);
+async function setLockedBlocksDropTargets(teacherId, bes, co_teaching){
+    // All the hour slots of the course where the lecture can't be held (e.g. the course has already a lecture there)
+    let url = _URL['drop_targets'].replace('12345', $('#school_year').val()).replace('0000-00-00', formatDate(currentDate));
     let data = {
-        'school_year': school_year,
-        'from_date': formatDate(startDate),
-        'to_date': formatDate(endDate)
+        teacher: teacherId,
+        course: $('#course_section').val(),
+        bes: bes,
+        co_teaching: co_teaching
     };
+    let res;
     try{
-        data = await $.get(url, data=data);
-        for(let block of data){
-            let blockId = block.hour_slot;
-            let create = true;
-            if(blockId === null){
-                if(!extraBlockExists(block.date, block.hour_start, block.hour_end))
-                    create = false; 
-            }
-
-            if(create){
-                timetable.getBlock(blockId).setState('absence');
-                timetable.getBlock(blockId).setOnClick();
-            }
-        }    
+        res = await $.get(url, data=data);
     }
     catch{
-        console.log("No absence blocks for teacher");
+        console.log("No drop targets");
+        return;
+    }
+    for(let target of res.targets){
+        if(target.conflicts.length > 0 && target.hour_slot in timetable.blocks){
+            timetable.getBlock(target.hour_slot).setState(target.conflicts.includes('absence_block') ? 'absence' : 'conflict');
+            timetable.getBlock(target.hour_slot).setOnClick();
+        }
     }
 }
 
@@ -656,7 +623,7 @@ function deleteAssignment(assign){
             },
             success: function(result) {
                 console.log(result, "OK");
-                getTeachers();
+                loadData();
             }
         });
     }
@@ -3,3 +3,9 @@ from django.apps import AppConfig
 
 class TimetableConfig(AppConfig):
     name = 'timetable'
+
+    def ready(self):
+        # Connect the signals invalidating the cache
+        import timetable.signals  # noqa: F401
+        # Register the checks of the settings
+        import timetable.checks  # noqa: F401
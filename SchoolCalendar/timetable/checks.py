@@ -0,0 +1,26 @@
+from django.conf import settings
+from django.core.checks import Warning, register
+
+
+# Backends whose entries are seen only by the process that wrote them.
+PROCESS_LOCAL_CACHES = (
+    'django.core.cache.backends.locmem.LocMemCache',
+)
+
+
+@register()
+def check_shared_cache(app_configs, **kwargs):
+    """
+    The versions of the weeks (and the roles of the users) are kept in the default cache: with a cache local to the
+    process, a change made by a worker is never seen by the others, which keep serving the old weeks (see
+    utils.get_week_versions).
+    """
+    backend = settings.CACHES.get('default', {}).get('BACKEND')
+    if backend in PROCESS_LOCAL_CACHES:
+        return [Warning(
+            'The default cache is local to every process.',
+            hint='Use a cache shared by all the processes (e.g. file based, memcached or redis): the versions of the '
+                 'weeks and the roles of the users are kept there.',
+            id='timetable.W001',
+        )]
+    return []
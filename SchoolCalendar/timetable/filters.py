@@ -3,9 +3,10 @@ from rest_framework.filters import BaseFilterBackend
 from django_filters import FilterSet, DateFilter, ChoiceFilter, NumberFilter, TimeFilter
 from django.db.models import Q, Count, Subquery
 
-from datetime import datetime
+from datetime import datetime, timedelta
 
 from timetable import utils
+from timetable.room_occupancy import get_room_occupancy
 from timetable.utils import get_school_from_user, convert_weekday_into_0_6_format
 from timetable.models import Holiday, Stage, AbsenceBlock, Teacher, AdminSchool, HourSlot, HoursPerTeacherInClass, \
     Course, Assignment, Subject, Room, TeachersYearlyLoad, CoursesYearlyLoad, HourSlotsGroup
@@ -127,7 +128,7 @@ class HoursPerTeacherInClassFilter(FilterSet):
     school_year = NumberFilter(field_name='school_year', method='school_year_filter')
 
     def school_year_filter(self, queryset, name, value):
-        return queryset.filter(course__hour_slots_group__school_year__id=value)
+        return queryset.filter(school_year=value)
 
     class Meta:
         model = HoursPerTeacherInClass
@@ -162,7 +163,7 @@ class AssignmentFilter(FilterSet):
     school_year = NumberFilter(field_name='school_year', method='school_year_filter')
 
     def school_year_filter(self, queryset, name, value):
-        return queryset.filter(course__hour_slots_group__school_year__id=value)
+        return queryset.filter(school_year=value)
 
     class Meta:
         model = Assignment
@@ -193,35 +194,17 @@ class RoomFilter(FilterSet):
         course = self.request.GET.get('course', None)
 
         if date:
-            date = datetime.strptime(date, '%Y-%m-%d')
+            date = datetime.strptime(date, '%Y-%m-%d').date()
         if hour_start and hour_end:
-            hour_start = datetime.strptime(hour_start, '%H:%M')
-            hour_end = datetime.strptime(hour_end, '%H:%M')
-
-        if school_year and hour_start and hour_end and date:
-            # Search assignments with an intersection in time but in a different course (in this way we allow to assign
-            # more teachers in the same course, in the same hour_slot and in the same room. Useful for co-teaching)
-            # and we group them by room, course
-            grouped_used_rooms = Assignment.objects.filter(school=school,
-                                                           school_year=school_year,
-                                                           date=date,
-                                                           room__isnull=False) \
-                .exclude(course=course) \
-                .filter(Q(hour_start__lte=hour_start, hour_end__gt=hour_start) |
-                        Q(hour_start__lt=hour_end, hour_end__gte=hour_end))\
-                .values('room', 'course', 'room__capacity').distinct()
-
-            # Unfortunately, it looks like with django it is extremely cumbersome to count grouping by rooms and courses
-            # Hence, we do it by hand using the set used_room.
-            used_rooms = {}
-            for el in grouped_used_rooms:
-                if el['room'] not in used_rooms:
-                    used_rooms[el['room']] = {'total': 0, 'capacity': el['room__capacity']}
-                used_rooms[el['room']]['total'] += 1  # Counter of conflicts.
-            rooms_id = []
-            # We remove from the returned rooms all the rooms that have already reached the maximum capacity.   
-            for key, room in used_rooms.items():
-                if room['total'] >= room['capacity']:
-                    rooms_id.append(key)
-            return queryset.exclude(id__in=rooms_id)
+            hour_start = datetime.strptime(hour_start, '%H:%M').time()
+            hour_end = datetime.strptime(hour_end, '%H:%M').time()
+
+        if school is not None and school_year and hour_start and hour_end and date:
+            # The lectures with an intersection in time but in a different course take a place in the room (in this
+            # way we allow to assign more teachers in the same course, in the same hour_slot and in the same room.
+            # Useful for co-teaching). They are looked up in the occupancy of the week, which is kept in the cache.
+            occupancy = get_room_occupancy(school.id, int(school_year), date - timedelta(days=date.weekday()))
+            full_rooms = occupancy.get_full_rooms(date, hour_start, hour_end, int(course) if course else None)
+            # We remove from the returned rooms all the rooms that have already reached the maximum capacity.
+            return queryset.exclude(id__in=full_rooms)
         return queryset
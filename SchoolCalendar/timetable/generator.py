@@ -0,0 +1,474 @@
+import datetime
+import math
+import multiprocessing
+import random
+import time
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import django
+from django.db import transaction
+from django.utils.translation import gettext as _
+
+from timetable.models import Assignment, HourSlot, HoursPerTeacherInClass, AbsenceBlock, Room
+from timetable.replication import get_blocked_dates
+from timetable.utils import bump_assignment_versions
+
+
+# The hours of HoursPerTeacherInClass are yearly: the lectures of a week are hours / WEEKS_PER_SCHOOL_YEAR.
+WEEKS_PER_SCHOOL_YEAR = 33
+
+# Hard constraints (a teacher, a course or a room in two places at once, a teacher with an absence block) cost
+# HARD_WEIGHT each, the soft ones cost 1 each: a timetable with a conflict is always worse than any without.
+HARD_WEIGHT = 100
+
+# A course should not have more than MAX_SUBJECT_LECTURES_PER_DAY lectures of the same subject in a day (soft).
+MAX_SUBJECT_LECTURES_PER_DAY = 2
+
+DEFAULT_ITERATIONS = 200000
+
+# A search with a time limit reads the clock every TIME_CHECK_ITERATIONS moves.
+TIME_CHECK_ITERATIONS = 1000
+
+
+class TimetableData:
+    """
+    Snapshot of the data needed to generate the weekly timetable of a school year: the lectures to place (from
+    HoursPerTeacherInClass), the hour slots of every HourSlotsGroup, the absence blocks and the rooms.
+    It is read with a query per model, and it only holds plain values (ids, times and lists), so it can be shared
+    among many searches.
+    """
+
+    def __init__(self, school_id, school_year_id, weeks=WEEKS_PER_SCHOOL_YEAR, with_rooms=True):
+        """
+        :param weeks: number of weeks of lectures in the school year (see WEEKS_PER_SCHOOL_YEAR)
+        :param with_rooms: when False, the lectures are not given a room
+        """
+        self.school_id = school_id
+        self.school_year_id = school_year_id
+
+        # Hour slots: list of (id, hour_slots_group, day_of_week, starts_at, ends_at)
+        self.slots = list(HourSlot.objects.filter(hour_slots_group__school=school_id,
+                                                  hour_slots_group__school_year=school_year_id)
+                          .values_list('id', 'hour_slots_group', 'day_of_week', 'starts_at', 'ends_at')
+                          .order_by('day_of_week', 'starts_at', 'id'))
+        slot_index = {slot[0]: i for i, slot in enumerate(self.slots)}
+        self.group_slots = defaultdict(list)
+        for i, (_, group, _, _, _) in enumerate(self.slots):
+            self.group_slots[group].append(i)
+        # For every hour slot, the hour slots (of any group, itself included) held at the same time
+        self.overlaps = [[j for j, other in enumerate(self.slots)
+                          if other[2] == slot[2] and other[3] < slot[4] and slot[3] < other[4]]
+                         for slot in self.slots]
+
+        # Lectures of a week: parallel lists, one element per lecture
+        self.teacher_ids, self.course_ids = [], []
+        teacher_index, course_index = {}, {}
+        self.course_group = []
+        self.lecture_teacher, self.lecture_course, self.lecture_subject = [], [], []
+        self.lecture_bes, self.lecture_co_teaching = [], []
+        for teacher, course, group, subject, hours, hours_bes, hours_co_teaching in HoursPerTeacherInClass.objects \
+                .filter(course__hour_slots_group__school=school_id,
+                        course__hour_slots_group__school_year=school_year_id) \
+                .values_list('teacher', 'course', 'course__hour_slots_group', 'subject', 'hours', 'hours_bes',
+                             'hours_co_teaching').order_by('id'):
+            if not self.group_slots[group]:
+                # The course has no hour slots where to place its lectures.
+                continue
+            if teacher not in teacher_index:
+                teacher_index[teacher] = len(self.teacher_ids)
+                self.teacher_ids.append(teacher)
+            if course not in course_index:
+                course_index[course] = len(self.course_ids)
+                self.course_ids.append(course)
+                self.course_group.append(group)
+            for count, bes, co_teaching in ((hours, False, False), (hours_bes, True, False),
+                                            (hours_co_teaching, False, True)):
+                for _ in range(round(count / weeks)):
+                    self.lecture_teacher.append(teacher_index[teacher])
+                    self.lecture_course.append(course_index[course])
+                    self.lecture_subject.append(subject)
+                    self.lecture_bes.append(bes)
+                    self.lecture_co_teaching.append(co_teaching)
+
+        # Rooms: list of (id, capacity). The lectures held at the same time can't be more than the seats of the rooms.
+        self.rooms = list(Room.objects.filter(school=school_id).values_list('id', 'capacity').order_by('id')) \
+            if with_rooms else []
+        self.capacity = sum(capacity for _, capacity in self.rooms)
+        # The hours of a day are split at the beginning and at the end of every hour slot: every hour slot covers some
+        # of these segments of time, which are shared with the hour slots overlapping it (of any group). The seats are
+        # counted per segment.
+        bounds = defaultdict(set)
+        for _, _, day_of_week, starts_at, ends_at in self.slots:
+            bounds[day_of_week] |= {starts_at, ends_at}
+        segments = {}
+        self.slot_segments = [[segments.setdefault((day_of_week, bound), len(segments))
+                               for bound in sorted(bounds[day_of_week]) if starts_at <= bound < ends_at]
+                              for _, _, day_of_week, starts_at, ends_at in self.slots]
+        self.n_segments = len(segments)
+
+        # (teacher, hour slot) where the teacher can't teach, since it has an absence block at that time
+        self.blocked = set()
+        for teacher, hour_slot in AbsenceBlock.objects.filter(hour_slot__in=slot_index,
+                                                              teacher__in=teacher_index) \
+                .values_list('teacher', 'hour_slot'):
+            for j in self.overlaps[slot_index[hour_slot]]:
+                self.blocked.add((teacher_index[teacher], j))
+
+    def __len__(self):
+        return len(self.lecture_teacher)
+
+    def is_normal(self, lecture):
+        """
+        :return: True when the lecture is neither BES nor co-teaching: only the normal lectures occupy the course
+                 (the BES and co-teaching ones are held during the lectures of the course) and a room.
+        """
+        return not (self.lecture_bes[lecture] or self.lecture_co_teaching[lecture])
+
+
+class TimetableSolution:
+    """
+    A weekly timetable: the hour slot (index in data.slots) of every lecture, with its cost and the seed of the search
+    that found it.
+    """
+
+    def __init__(self, slots, hard_violations, soft_cost, seed=None):
+        self.slots = slots
+        self.hard_violations = hard_violations
+        self.soft_cost = soft_cost
+        self.seed = seed
+
+    @property
+    def cost(self):
+        return self.hard_violations * HARD_WEIGHT + self.soft_cost
+
+
+class TimetableSearch:
+    """
+    Simulated annealing on the weekly timetable. A move changes the hour slot of a lecture, or swaps the hour slots of
+    two lectures of the same course. The cost is evaluated incrementally: the occupancy of every teacher and course
+    per hour slot is kept in counters, so a move costs O(overlapping hour slots) rather than a new evaluation of the
+    whole timetable.
+    Hard constraints: a teacher teaches a lecture at a time and never during its absence blocks, a course has a
+    normal lecture at a time, the normal lectures held at the same time fit in the rooms (which are given afterwards,
+    see assign_rooms).
+    Soft constraint: at most MAX_SUBJECT_LECTURES_PER_DAY lectures of a subject per day in a course.
+    """
+
+    def __init__(self, data, seed=None):
+        """
+        :param data: the TimetableData of the school year
+        :param seed: seed of the random generator, to repeat a search
+        """
+        self.data = data
+        self.seed = seed
+        self.random = random.Random(seed)
+        n_slots = len(data.slots)
+        self.teacher_at = [[0] * n_slots for _ in data.teacher_ids]
+        self.course_at = [[0] * n_slots for _ in data.course_ids]
+        self.segment_load = [0] * data.n_segments
+        self.subject_day = defaultdict(int)
+        self.course_lectures = defaultdict(list)
+        for i, course in enumerate(data.lecture_course):
+            self.course_lectures[course].append(i)
+        self.slots = [None] * len(data)
+        self.hard_violations = 0
+        self.soft_cost = 0
+
+    @property
+    def cost(self):
+        return self.hard_violations * HARD_WEIGHT + self.soft_cost
+
+    def _add(self, i):
+        """
+        Place the lecture i in self.slots[i], updating the counters and the cost.
+        """
+        data = self.data
+        s = self.slots[i]
+        teacher = data.lecture_teacher[i]
+        teacher_at = self.teacher_at[teacher]
+        self.hard_violations += sum(teacher_at[j] for j in data.overlaps[s])
+        teacher_at[s] += 1
+        if (teacher, s) in data.blocked:
+            self.hard_violations += 1
+        if not data.is_normal(i):
+            return
+        course = data.lecture_course[i]
+        self.hard_violations += self.course_at[course][s]
+        self.course_at[course][s] += 1
+        if data.rooms:
+            for segment in data.slot_segments[s]:
+                if self.segment_load[segment] >= data.capacity:
+                    self.hard_violations += 1
+                self.segment_load[segment] += 1
+        key = (course, data.lecture_subject[i], data.slots[s][2])
+        if self.subject_day[key] >= MAX_SUBJECT_LECTURES_PER_DAY:
+            self.soft_cost += 1
+        self.subject_day[key] += 1
+
+    def _remove(self, i):
+        """
+        Remove the lecture i from its hour slot, updating the counters and the cost (the inverse of _add).
+        """
+        data = self.data
+        s = self.slots[i]
+        teacher = data.lecture_teacher[i]
+        teacher_at = self.teacher_at[teacher]
+        teacher_at[s] -= 1
+        self.hard_violations -= sum(teacher_at[j] for j in data.overlaps[s])
+        if (teacher, s) in data.blocked:
+            self.hard_violations -= 1
+        if not data.is_normal(i):
+            return
+        course = data.lecture_course[i]
+        self.course_at[course][s] -= 1
+        self.hard_violations -= self.course_at[course][s]
+        if data.rooms:
+            for segment in data.slot_segments[s]:
+                self.segment_load[segment] -= 1
+                if self.segment_load[segment] >= data.capacity:
+                    self.hard_violations -= 1
+        key = (course, data.lecture_subject[i], data.slots[s][2])
+        self.subject_day[key] -= 1
+        if self.subject_day[key] >= MAX_SUBJECT_LECTURES_PER_DAY:
+            self.soft_cost -= 1
+
+    def initial_solution(self):
+        """
+        Place the lectures one at a time, the ones of the busiest teachers first, each in the hour slot of minimum cost.
+        """
+        data = self.data
+        load = defaultdict(int)
+        for teacher in data.lecture_teacher:
+            load[teacher] += 1
+        lectures = sorted(range(len(data)), key=lambda i: (-load[data.lecture_teacher[i]], not data.is_normal(i), i))
+        for i in lectures:
+            best, best_cost = None, None
+            candidates = data.group_slots[data.course_group[data.lecture_course[i]]][:]
+            self.random.shuffle(candidates)
+            for s in candidates:
+                before = self.cost
+                self.slots[i] = s
+                self._add(i)
+                cost = self.cost - before
+                self._remove(i)
+                if best_cost is None or cost < best_cost:
+                    best, best_cost = s, cost
+                    if cost == 0:
+                        break
+            self.slots[i] = best
+            self._add(i)
+
+    def _move(self):
+        """
+        Apply a random move.
+        :return: the list of the (lecture, previous hour slot) changed, to revert the move
+        """
+        data = self.data
+        i = self.random.randrange(len(data))
+        course_lectures = self.course_lectures[data.lecture_course[i]]
+        if self.random.random() < 0.5:
+            # Swap the hour slots of two lectures of the same course
+            j = self.random.choice(course_lectures)
+            changes = [(i, self.slots[i]), (j, self.slots[j])] if self.slots[j] != self.slots[i] else []
+            new_slots = [self.slots[j], self.slots[i]]
+        else:
+            changes = [(i, self.slots[i])]
+            new_slots = [self.random.choice(data.group_slots[data.course_group[data.lecture_course[i]]])]
+        self._apply(changes, new_slots)
+        return changes
+
+    def _apply(self, changes, new_slots):
+        for lecture, _ in changes:
+            self._remove(lecture)
+        for (lecture, _), s in zip(changes, new_slots):
+            self.slots[lecture] = s
+        for lecture, _ in changes:
+            self._add(lecture)
+
+    def run(self, iterations=DEFAULT_ITERATIONS, temperature_start=2.0, temperature_end=0.05, time_limit=None):
+        """
+        :param iterations: number of moves tried (the search stops earlier when a timetable of cost 0 is found)
+        :param temperature_start: temperature of the annealing at the beginning, decreasing geometrically...
+        :param temperature_end: ...to this one at the end
+        :param time_limit: when given, the search stops after these seconds, whatever the moves left
+        :return: the best TimetableSolution found
+        """
+        deadline = time.monotonic() + time_limit if time_limit is not None else None
+        self.initial_solution()
+        best = TimetableSolution(self.slots[:], self.hard_violations, self.soft_cost, self.seed)
+        if not len(self.data):
+            return best
+        cooling = (temperature_end / temperature_start) ** (1 / max(iterations, 1))
+        temperature = temperature_start
+        for n in range(iterations):
+            if best.cost == 0:
+                break
+            # The clock is read every TIME_CHECK_ITERATIONS moves only
+            if deadline is not None and n % TIME_CHECK_ITERATIONS == 0 and time.monotonic() >= deadline:
+                break
+            before = self.cost
+            changes = self._move()
+            delta = self.cost - before
+            if delta > 0 and self.random.random() >= math.exp(-delta / temperature):
+                self._apply(changes, [s for _, s in changes])
+            elif self.cost < best.cost:
+                best = TimetableSolution(self.slots[:], self.hard_violations, self.soft_cost, self.seed)
+            temperature *= cooling
+        return best
+
+
+def assign_rooms(data, solution):
+    """
+    Give a room to the normal lectures of the timetable: every course has a home room (the rooms are shared in turn
+    when they are fewer than the courses), and its lectures are held there unless it is full, then in any room with
+    free seats. The seats of a room are taken for all the segments of time of the hour slot (see TimetableData), so
+    the lectures of overlapping hour slots of different groups share them.
+    :return: a list with the room (index in data.rooms, or None) of every lecture
+    """
+    rooms = [None] * len(data)
+    if not data.rooms:
+        return rooms
+    # (room, segment of time) -> seats taken
+    taken = defaultdict(int)
+
+    def is_free(r, s):
+        return all(taken[(r, segment)] < data.rooms[r][1] for segment in data.slot_segments[s])
+
+    def take(i, r):
+        rooms[i] = r
+        for segment in data.slot_segments[solution.slots[i]]:
+            taken[(r, segment)] += 1
+
+    homeless = []
+    for i in range(len(data)):
+        if not data.is_normal(i):
+            continue
+        home = data.lecture_course[i] % len(data.rooms)
+        if is_free(home, solution.slots[i]):
+            take(i, home)
+        else:
+            homeless.append(i)
+    for i in homeless:
+        r = next((r for r in range(len(data.rooms)) if is_free(r, solution.slots[i])), None)
+        if r is not None:
+            take(i, r)
+    return rooms
+
+
+def get_lectures_without_room(data, rooms):
+    """
+    :param rooms: the rooms of the lectures (see assign_rooms)
+    :return: the list of the normal lectures left without a room, since all the rooms were full at their time (always
+             empty when the school has no rooms)
+    """
+    if not data.rooms:
+        return []
+    return [i for i, r in enumerate(rooms) if r is None and data.is_normal(i)]
+
+
+# Snapshot of the school data shared (read-only) by the processes of search_best_timetable, when they are forked.
+_shared_data = None
+
+
+def _run_search(seed, iterations, data=None):
+    """
+    A search of search_best_timetable, run in a process of the pool.
+    """
+    return TimetableSearch(data if data is not None else _shared_data, seed).run(iterations)
+
+
+def search_best_timetable(data, restarts, iterations=DEFAULT_ITERATIONS, processes=None, seed=0):
+    """
+    Run many independent searches (with the seeds seed, seed + 1, ...) and keep the best timetable. The searches run in
+    a pool of processes: when they are forked, the snapshot of the data is inherited rather than copied to every
+    process, otherwise it is sent with every search. The searches not started yet are cancelled as soon as one finds
+    a timetable of cost 0.
+    :param data: the TimetableData of the school year
+    :param restarts: number of searches
+    :param processes: size of the pool (the number of CPUs by default); with 1 the searches run in this process
+    :return: the best TimetableSolution (the one of the lowest seed among the ones of the same cost)
+    """
+    global _shared_data
+    seeds = range(seed, seed + restarts)
+    if processes == 1 or restarts <= 1:
+        solutions = []
+        for s in seeds:
+            solutions.append(_run_search(s, iterations, data))
+            if solutions[-1].cost == 0:
+                break
+    else:
+        if 'fork' in multiprocessing.get_all_start_methods():
+            context, initializer, shared = multiprocessing.get_context('fork'), None, None
+            _shared_data = data
+        else:
+            # The new processes have to set up Django before reading the snapshot
+            context, initializer, shared = None, django.setup, data
+        solutions = []
+        try:
+            with ProcessPoolExecutor(max_workers=processes, mp_context=context, initializer=initializer) as pool:
+                futures = [pool.submit(_run_search, s, iterations, shared) for s in seeds]
+                for future in as_completed(futures):
+                    solutions.append(future.result())
+                    if solutions[-1].cost == 0:
+                        for other in futures:
+                            other.cancel()
+                        break
+        finally:
+            _shared_data = None
+    return min(solutions, key=lambda solution: (solution.cost, solution.seed))
+
+
+def generate_timetable(school_id, school_year_id, iterations=DEFAULT_ITERATIONS, seed=0, restarts=1, processes=None,
+                       **kwargs):
+    """
+    :param kwargs: passed to TimetableData
+    :return: a tuple (TimetableData, best TimetableSolution) for the school year (see search_best_timetable)
+    """
+    data = TimetableData(school_id, school_year_id, **kwargs)
+    return data, search_best_timetable(data, restarts, iterations=iterations, processes=processes, seed=seed)
+
+
+@transaction.atomic
+def write_assignments(data, solution, monday, replace=False, rooms=None):
+    """
+    Write the timetable as the assignments of the week starting on monday (skipping the holidays and the stages).
+    :param replace: when True, the assignments of the courses already present in the week are deleted
+    :param rooms: the rooms of the lectures (assign_rooms when missing)
+    :return: the list of the created assignments
+    :raise ValueError: when the timetable has conflicts (hard violations) or normal lectures without a room, or when
+                       the courses already have assignments in the week and replace is False
+    """
+    if solution.hard_violations > 0:
+        raise ValueError(_("The timetable has {} conflicts: it is not written.").format(solution.hard_violations))
+    if rooms is None:
+        rooms = assign_rooms(data, solution)
+    without_room = get_lectures_without_room(data, rooms)
+    if without_room:
+        raise ValueError(_("{} lectures have no free room: the timetable is not written.").format(len(without_room)))
+    sunday = monday + datetime.timedelta(days=6)
+    present = Assignment.objects.filter(course__in=data.course_ids, date__gte=monday, date__lte=sunday)
+    if replace:
+        present.delete()
+    elif present.exists():
+        raise ValueError(_("The courses already have lectures in the week of {}.").format(monday))
+
+    assignments = []
+    for i, (s, r) in enumerate(zip(solution.slots, rooms)):
+        day_of_week, starts_at, ends_at = data.slots[s][2:]
+        assignments.append(Assignment(teacher_id=data.teacher_ids[data.lecture_teacher[i]],
+                                      course_id=data.course_ids[data.lecture_course[i]],
+                                      subject_id=data.lecture_subject[i],
+                                      room_id=data.rooms[r][0] if r is not None else None,
+                                      date=monday + datetime.timedelta(days=day_of_week),
+                                      hour_start=starts_at,
+                                      hour_end=ends_at,
+                                      bes=data.lecture_bes[i],
+                                      co_teaching=data.lecture_co_teaching[i],
+                                      school_id=data.school_id,
+                                      school_year_id=data.school_year_id))
+    blocked_dates = get_blocked_dates(assignments, monday, sunday)
+    created = Assignment.objects.bulk_create([a for a in assignments if a.date not in blocked_dates[a.course_id]])
+    # bulk_create sends no signals: change the versions of the week here
+    bump_assignment_versions(created)
+    return created
@@ -0,0 +1,75 @@
+from bisect import bisect_right
+from collections import defaultdict
+
+from timetable.models import HourSlot
+
+
+def is_hour_slot_conflicting(starts_at, ends_at, hour_start, hour_end):
+    """
+    :return: True when the hour slot [starts_at, ends_at] can create a school conflict with a lecture
+             held in [hour_start, hour_end].
+    """
+    return (starts_at <= hour_start < ends_at) or \
+        (starts_at < hour_end <= ends_at) or \
+        (hour_start < starts_at and ends_at < hour_end)  # the hour_slot's time is included in the assignment's time
+
+
+class HourSlotsIndex:
+    """
+    In-memory index of the hour slots of the schools and school years of a list of assignments.
+    All the hour slots are loaded at once (a single query, whatever the number of assignments), then they are indexed by
+    (school, school_year, day_of_week) and sorted by starts_at, so that every assignment only looks at the hour slots
+    of its day of the week which start before the end of the lecture.
+    """
+
+    def __init__(self, assignments):
+        """
+        :param assignments: list of assignments
+        """
+        # hour_slots_group_id -> (school, school_year)
+        self.groups = {a.course.hour_slots_group_id: (a.school_id, a.school_year_id) for a in assignments}
+
+        # (hour_slots_group, day_of_week, starts_at, ends_at) -> id of the hour slot
+        self.hour_slots = {}
+        # (school, school_year, day_of_week) -> list of (starts_at, ends_at, id), sorted by starts_at
+        self.by_day = defaultdict(list)
+        self.starts = {}
+        if not self.groups:
+            return
+        hour_slots = HourSlot.objects.filter(
+            hour_slots_group__school__in={school for school, _ in self.groups.values()},
+            hour_slots_group__school_year__in={school_year for _, school_year in self.groups.values()}
+        ).values('id', 'hour_slots_group', 'hour_slots_group__school', 'hour_slots_group__school_year',
+                 'day_of_week', 'starts_at', 'ends_at').order_by('id')
+        for hs in hour_slots:
+            self.hour_slots.setdefault((hs['hour_slots_group'], hs['day_of_week'], hs['starts_at'], hs['ends_at']),
+                                       hs['id'])
+            self.by_day[(hs['hour_slots_group__school'], hs['hour_slots_group__school_year'], hs['day_of_week'])] \
+                .append((hs['starts_at'], hs['ends_at'], hs['id']))
+        # Keep the starts_at of every day apart, to bisect the hour slots of the day
+        for day, slots in self.by_day.items():
+            slots.sort()
+            self.starts[day] = [starts_at for starts_at, _, _ in slots]
+
+    def get_hour_slot(self, assignment):
+        """
+        :return: the id of the hour slot of the hour_slots_group of the course, in which the assignment is held
+                 (if it exists), otherwise None
+        """
+        return self.hour_slots.get((assignment.course.hour_slots_group_id, assignment.date.weekday(),
+                                    assignment.hour_start, assignment.hour_end))
+
+    def get_conflicting_hour_slots(self, assignment):
+        """
+        :return: the ids of all the hour slots of the school that can create a school conflict with the assignment
+                 (from every hour_slots_group)
+        """
+        school, school_year = self.groups[assignment.course.hour_slots_group_id]
+        day = (school, school_year, assignment.date.weekday())
+        if day not in self.by_day:
+            return []
+        slots = self.by_day[day]
+        # Only the hour slots starting before the end of the lecture can be conflicting
+        last = bisect_right(self.starts[day], assignment.hour_end)
+        return sorted(hs_id for starts_at, ends_at, hs_id in slots[:last]
+                      if is_hour_slot_conflicting(starts_at, ends_at, assignment.hour_start, assignment.hour_end))
@@ -0,0 +1,185 @@
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+
+from timetable.models import *
+
+import random
+import datetime
+import statistics
+import time
+
+HOUR_SLOT_LIST = [
+    ((7, 55), (8, 45)),
+    ((8, 45), (9, 35)),
+    ((9, 35), (10, 25)),
+    ((10, 35), (11, 25)),
+    ((11, 25), (12, 15))
+]
+
+
+class Command(BaseCommand):
+    help = 'Benchmark the hot queries on the assignments, with and without the indexes declared on Assignment. ' \
+           'A realistic school year is created in a transaction, which is rolled back at the end, so the command ' \
+           'can be run on any database (python manage.py benchmark_indexes --courses 40 --weeks 34)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--courses', type=int, default=40, help='Number of courses of the school')
+        parser.add_argument('--teachers', type=int, default=80, help='Number of teachers of the school')
+        parser.add_argument('--rooms', type=int, default=40, help='Number of rooms of the school')
+        parser.add_argument('--weeks', type=int, default=34, help='Number of weeks of lectures')
+        parser.add_argument('--absences', type=float, default=0.03,
+                            help='Fraction of the lectures where the teacher is absent and substituted')
+        parser.add_argument('--repeat', type=int, default=50, help='Number of runs of every query')
+        parser.add_argument('--plans', action='store_true', help='Print the query plans')
+
+    def create_school_year(self, options):
+        """
+        Create a school with its teachers, courses and rooms, and all the lectures of the weeks of the school year.
+        :return: an assignment in the middle of the school year, whose teacher, course and room are used in the queries
+        """
+        rnd = random.Random(0)
+        school = School(name='Benchmark school')
+        school.save()
+        school_year = SchoolYear(year_start=2020, date_start=datetime.date(year=2020, month=8, day=31))
+        school_year.save()
+        hour_slots_group = HourSlotsGroup(name='Benchmark week', school=school, school_year=school_year)
+        hour_slots_group.save()
+        HourSlot.objects.bulk_create([
+            HourSlot(hour_number=i + 1,
+                     starts_at=datetime.time(hour=el[0][0], minute=el[0][1]),
+                     ends_at=datetime.time(hour=el[1][0], minute=el[1][1]),
+                     day_of_week=day_of_week,
+                     legal_duration=datetime.timedelta(hours=1),
+                     hour_slots_group=hour_slots_group)
+            for day_of_week in range(0, 6) for i, el in enumerate(HOUR_SLOT_LIST)])
+
+        subject = Subject(name='Mathematics', school=school)
+        subject.save()
+        teachers = []
+        for i in range(options['teachers']):
+            teacher = Teacher(username='benchmark_teacher_{}'.format(i), school=school,
+                              first_name='Teacher', last_name=str(i))
+            teacher.save()
+            teachers.append(teacher)
+        Room.objects.bulk_create([Room(name='Room {}'.format(i), capacity=1, school=school)
+                                  for i in range(options['rooms'])])
+        rooms = list(Room.objects.filter(school=school).order_by('id'))
+        for i in range(options['courses']):
+            Course(year=i % 5 + 1, section='B{}'.format(i), hour_slots_group=hour_slots_group).save()
+        courses = list(Course.objects.filter(hour_slots_group=hour_slots_group).order_by('id'))
+
+        first_monday = datetime.date(year=2020, month=9, day=14)
+        assignments = []
+        absent = []
+        for week in range(options['weeks']):
+            for day_of_week in range(0, 6):
+                date = first_monday + datetime.timedelta(days=7 * week + day_of_week)
+                for hour, (start, end) in enumerate(HOUR_SLOT_LIST):
+                    for i, course in enumerate(courses):
+                        assignment = Assignment(teacher=teachers[(i + hour) % len(teachers)], course=course,
+                                                subject=subject, room=rooms[i % len(rooms)], date=date,
+                                                hour_start=datetime.time(hour=start[0], minute=start[1]),
+                                                hour_end=datetime.time(hour=end[0], minute=end[1]))
+                        if rnd.random() < options['absences']:
+                            assignment.absent = True
+                            absent.append(assignment)
+                        assignments.append(assignment)
+        Assignment.objects.bulk_create(assignments, batch_size=1000)
+
+        # bulk_create doesn't return the ids on every database: read them back to link the substitutions
+        ids = {(a['course'], a['date'], a['hour_start']): a['id']
+               for a in Assignment.objects.filter(school=school, absent=True)
+                   .values('id', 'course', 'date', 'hour_start')}
+        Assignment.objects.bulk_create([
+            Assignment(teacher=rnd.choice(teachers), course=a.course, subject=subject, room=a.room, date=a.date,
+                       hour_start=a.hour_start, hour_end=a.hour_end, substitution=True,
+                       substituted_assignment_id=ids[(a.course_id, a.date, a.hour_start)])
+            for a in absent], batch_size=1000)
+
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE')
+        middle = first_monday + datetime.timedelta(days=7 * (options['weeks'] // 2) + 2)
+        return Assignment.objects.filter(school=school, date=middle, absent=True).first() or \
+            Assignment.objects.filter(school=school, date=middle).first()
+
+    def get_queries(self, assignment):
+        """
+        :return: list of (name, queryset) of the hot queries on the assignments, as done by the views and the forms.
+        """
+        week_start = assignment.date - datetime.timedelta(days=assignment.date.weekday())
+        week_end = week_start + datetime.timedelta(days=6)
+        return [
+            ('Timetable of a teacher in a week',
+             Assignment.objects.filter(teacher=assignment.teacher_id, date__range=(week_start, week_end))),
+            ('Timetable of a course in a week',
+             Assignment.objects.filter(course=assignment.course_id, date__range=(week_start, week_end))),
+            ('Timetable of a room in a week',
+             Assignment.objects.filter(room=assignment.room_id, date__range=(week_start, week_end))),
+            ('Teacher conflicts (AssignmentForm.clean)',
+             Assignment.objects.filter(teacher=assignment.teacher_id, school_year=assignment.school_year_id,
+                                       date=assignment.date, hour_start=assignment.hour_start,
+                                       hour_end=assignment.hour_end)),
+            ('Room conflicts (AssignmentForm.clean)',
+             Assignment.objects.filter(room=assignment.room_id, school_year=assignment.school_year_id,
+                                       date=assignment.date, hour_start=assignment.hour_start,
+                                       hour_end=assignment.hour_end)),
+            ('Busy teachers (get_available_teachers)',
+             Assignment.objects.filter(school=assignment.school_id, school_year=assignment.school_year_id,
+                                       date=assignment.date, hour_start=assignment.hour_start,
+                                       hour_end=assignment.hour_end).values_list('teacher')),
+            ('Used rooms (RoomFilter)',
+             Assignment.objects.filter(school=assignment.school_id, school_year=assignment.school_year_id,
+                                       date=assignment.date, room__isnull=False)
+                .filter(Q(hour_start__lte=assignment.hour_start, hour_end__gt=assignment.hour_start) |
+                        Q(hour_start__lt=assignment.hour_end, hour_end__gte=assignment.hour_end))
+                .values('room', 'course').distinct()),
+            ('Substitutions of a week',
+             Assignment.objects.filter(substitution=True, date__range=(week_start, week_end))),
+            ('Absences of a teacher in a week',
+             Assignment.objects.filter(absent=True, teacher=assignment.teacher_id,
+                                       date__range=(week_start, week_end))),
+            ('Substitutes of an assignment',
+             Assignment.objects.filter(substituted_assignment=assignment.id)),
+        ]
+
+    def run_queries(self, queries, repeat):
+        """
+        :return: list of (median time in milliseconds, query plan) of the queries
+        """
+        results = []
+        for name, queryset in queries:
+            timings = []
+            for _ in range(repeat):
+                start = time.perf_counter()
+                list(queryset.all())  # .all() clones the queryset, so that the rows are fetched every time
+                timings.append((time.perf_counter() - start) * 1000)
+            results.append((statistics.median(timings), queryset.explain()))
+        return results
+
+    def handle(self, *args, **options):
+        indexes = Assignment._meta.indexes
+        with transaction.atomic():
+            self.stdout.write('Creating the lectures of {} courses in {} weeks...'.format(options['courses'],
+                                                                                        options['weeks']))
+            assignment = self.create_school_year(options)
+            self.stdout.write('{} assignments'.format(Assignment.objects.filter(school=assignment.school_id).count()))
+            queries = self.get_queries(assignment)
+
+            with_indexes = self.run_queries(queries, options['repeat'])
+            # Drop the indexes of Assignment: the schema changes are rolled back with the rest of the transaction.
+            with connection.cursor() as cursor:
+                schema_editor = connection.schema_editor(atomic=False)
+                for index in indexes:
+                    cursor.execute(str(index.remove_sql(Assignment, schema_editor)))
+                cursor.execute('ANALYZE')
+            without_indexes = self.run_queries(queries, options['repeat'])
+            transaction.set_rollback(True)
+
+        self.stdout.write('{:<45} {:>12} {:>12} {:>8}'.format('Query', 'Before (ms)', 'After (ms)', 'Speedup'))
+        for (name, _), (before, _), (after, _) in zip(queries, without_indexes, with_indexes):
+            self.stdout.write('{:<45} {:>12.3f} {:>12.3f} {:>7.1f}x'.format(
+                name, before, after, before / after if after else 0))
+        if options['plans']:
+            for (name, _), (_, plan_before), (_, plan_after) in zip(queries, without_indexes, with_indexes):
+                self.stdout.write('\n{}\n  Before:\n    {}\n  After:\n    {}'.format(
+                    name, plan_before.replace('\n', '\n    '), plan_after.replace('\n', '\n    ')))
@@ -0,0 +1,49 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from timetable.generator import generate_timetable, write_assignments, WEEKS_PER_SCHOOL_YEAR, DEFAULT_ITERATIONS
+
+import datetime
+import time
+
+
+class Command(BaseCommand):
+    help = 'Generate the weekly timetable of a school year from the hours of the teachers in the courses, the hour ' \
+           'slots, the absence blocks and the rooms, and write it as the assignments of a week ' \
+           '(python manage.py generate_timetable 1 2 --monday 2020-09-14)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('school', type=int, help='Id of the school')
+        parser.add_argument('school_year', type=int, help='Id of the school year')
+        parser.add_argument('--monday', type=lambda d: datetime.datetime.strptime(d, '%Y-%m-%d').date(),
+                            help='Monday of the week where the timetable is written (yyyy-mm-dd). '
+                                 'When missing, the timetable is only generated')
+        parser.add_argument('--iterations', type=int, default=DEFAULT_ITERATIONS, help='Number of moves tried')
+        parser.add_argument('--seed', type=int, default=0, help='Seed of the first search')
+        parser.add_argument('--restarts', type=int, default=1,
+                            help='Number of independent searches, the best timetable is kept')
+        parser.add_argument('--processes', type=int, default=None,
+                            help='Number of processes running the searches (the number of CPUs by default)')
+        parser.add_argument('--weeks', type=int, default=WEEKS_PER_SCHOOL_YEAR,
+                            help='Number of weeks of lectures in the school year')
+        parser.add_argument('--without-rooms', action='store_true', help='Do not give a room to the lectures')
+        parser.add_argument('--replace', action='store_true',
+                            help='Delete the assignments of the courses already present in the week')
+
+    def handle(self, *args, **options):
+        if options['monday'] is not None and options['monday'].weekday() != 0:
+            raise CommandError('{} is not a Monday'.format(options['monday']))
+        start = time.perf_counter()
+        data, solution = generate_timetable(options['school'], options['school_year'],
+                                            iterations=options['iterations'], seed=options['seed'],
+                                            restarts=options['restarts'], processes=options['processes'],
+                                            weeks=options['weeks'], with_rooms=not options['without_rooms'])
+        self.stdout.write('{} lectures of {} courses placed in {:.1f}s: {} conflicts, soft cost {} (seed {})'.format(
+            len(data), len(data.course_ids), time.perf_counter() - start, solution.hard_violations,
+            solution.soft_cost, solution.seed))
+
+        if options['monday'] is not None:
+            try:
+                created = write_assignments(data, solution, options['monday'], replace=options['replace'])
+            except ValueError as e:
+                raise CommandError(str(e))
+            self.stdout.write('{} assignments created'.format(len(created)))
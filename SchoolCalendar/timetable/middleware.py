@@ -0,0 +1,18 @@
+from timetable import utils
+
+
+class SchoolRoleMiddleware:
+    """
+    Resolves once per request the role of the logged user (Teacher, AdminSchool or Secretary) and its school,
+    exposing them as request.role and request.school.
+    The helpers in utils (get_school_from_user, is_adminschool, is_teacher and is_secretary) read them from the same
+    memoized values, so that they don't run any further query during the request.
+    It must be placed after the AuthenticationMiddleware.
+    """
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        request.role = utils.get_role_from_user(request.user)
+        request.school = utils.get_school_from_user(request.user)
+        return self.get_response(request)
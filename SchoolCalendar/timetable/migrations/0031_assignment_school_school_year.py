@@ -0,0 +1,53 @@
+# Generated by Django 3.2.6 on 2026-10-18 18:00
+
+from django.db import migrations, models
+from django.db.models import OuterRef, Subquery
+import django.db.models.deletion
+
+
+def fill_school_and_school_year(apps, schema_editor):
+    """
+    Copy the school and the school_year of the hour slots group of the course into every assignment.
+    """
+    db_alias = schema_editor.connection.alias
+    Assignment = apps.get_model("timetable", "Assignment")
+    HourSlotsGroup = apps.get_model("timetable", "HourSlotsGroup")
+
+    hour_slots_group = HourSlotsGroup.objects.using(db_alias).filter(course=OuterRef('course'))
+    Assignment.objects.using(db_alias).update(school=Subquery(hour_slots_group.values('school')[:1]),
+                                              school_year=Subquery(hour_slots_group.values('school_year')[:1]))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('timetable', '0030_secretary'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='assignment',
+            name='school',
+            field=models.ForeignKey(editable=False, null=True, on_delete=django.db.models.deletion.CASCADE,
+                                    to='timetable.school', verbose_name='school'),
+        ),
+        migrations.AddField(
+            model_name='assignment',
+            name='school_year',
+            field=models.ForeignKey(editable=False, null=True, on_delete=django.db.models.deletion.CASCADE,
+                                    to='timetable.schoolyear', verbose_name='school year'),
+        ),
+        migrations.RunPython(fill_school_and_school_year, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='assignment',
+            name='school',
+            field=models.ForeignKey(editable=False, on_delete=django.db.models.deletion.CASCADE,
+                                    to='timetable.school', verbose_name='school'),
+        ),
+        migrations.AlterField(
+            model_name='assignment',
+            name='school_year',
+            field=models.ForeignKey(editable=False, on_delete=django.db.models.deletion.CASCADE,
+                                    to='timetable.schoolyear', verbose_name='school year'),
+        ),
+    ]
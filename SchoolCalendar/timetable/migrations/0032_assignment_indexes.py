@@ -0,0 +1,39 @@
+# Generated by Django 3.2.6 on 2026-10-18 18:30
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('timetable', '0031_assignment_school_school_year'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='assignment',
+            index=models.Index(fields=['teacher', 'date', 'hour_start'], name='assignment_teacher_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='assignment',
+            index=models.Index(fields=['course', 'date'], name='assignment_course_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='assignment',
+            index=models.Index(fields=['room', 'date', 'hour_start'], name='assignment_room_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='assignment',
+            index=models.Index(fields=['date', 'hour_start', 'hour_end'], name='assignment_date_hours_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='assignment',
+            index=models.Index(condition=models.Q(('substitution', True)), fields=['date'],
+                               name='assignment_substitution_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='assignment',
+            index=models.Index(condition=models.Q(('absent', True)), fields=['teacher', 'date'],
+                               name='assignment_absent_idx'),
+        ),
+    ]
@@ -0,0 +1,63 @@
+# Generated by Django 3.2.13 on 2026-10-18 19:15
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('timetable', '0032_assignment_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RecurringAssignment',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day_of_week', models.IntegerField(choices=[(0, 'Monday'), (1, 'Tuesday'), (2, 'Wednesday'), (3, 'Thursday'), (4, 'Friday'), (5, 'Saturday'), (6, 'Sunday')], verbose_name='day of the week')),
+                ('hour_start', models.TimeField(verbose_name='start hour')),
+                ('hour_end', models.TimeField(verbose_name='end hour')),
+                ('bes', models.BooleanField(default=False, verbose_name='BES')),
+                ('co_teaching', models.BooleanField(default=False, verbose_name='Co-teaching')),
+                ('date_start', models.DateField(verbose_name='start date')),
+                ('date_end', models.DateField(verbose_name='end date')),
+                ('course', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='timetable.course', verbose_name='course')),
+                ('room', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, to='timetable.room', verbose_name='room')),
+                ('school', models.ForeignKey(editable=False, on_delete=django.db.models.deletion.CASCADE, to='timetable.school', verbose_name='school')),
+                ('school_year', models.ForeignKey(editable=False, on_delete=django.db.models.deletion.CASCADE, to='timetable.schoolyear', verbose_name='school year')),
+                ('subject', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='timetable.subject', verbose_name='subject')),
+                ('teacher', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='timetable.teacher', verbose_name='teacher')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='RecurringAssignmentException',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField(verbose_name='date')),
+                ('kind', models.CharField(choices=[('cancelled', 'Cancelled'), ('substituted', 'Substituted'), ('changed', 'Changed')], max_length=16, verbose_name='kind')),
+                ('hour_start', models.TimeField(blank=True, null=True, verbose_name='start hour')),
+                ('hour_end', models.TimeField(blank=True, null=True, verbose_name='end hour')),
+                ('free_substitution', models.BooleanField(default=False, verbose_name='free substitution')),
+                ('recurring_assignment', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='exceptions', to='timetable.recurringassignment', verbose_name='recurring assignment')),
+                ('room', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, to='timetable.room', verbose_name='room')),
+                ('subject', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, to='timetable.subject', verbose_name='subject')),
+                ('teacher', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, to='timetable.teacher', verbose_name='teacher')),
+            ],
+            options={
+                'unique_together': {('recurring_assignment', 'date')},
+            },
+        ),
+        migrations.AddIndex(
+            model_name='recurringassignment',
+            index=models.Index(fields=['course', 'date_end'], name='recurring_course_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='recurringassignment',
+            index=models.Index(fields=['teacher', 'date_end'], name='recurring_teacher_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='recurringassignment',
+            index=models.Index(fields=['school', 'school_year', 'day_of_week'], name='recurring_school_idx'),
+        ),
+    ]
@@ -1,4 +1,11 @@
+import datetime
+import hashlib
+
 from django.contrib.auth.mixins import UserPassesTestMixin
+from django.core.cache import cache
+from django.utils.cache import get_conditional_response, patch_cache_control, quote_etag
+from django.utils.http import http_date
+from rest_framework.response import Response
 
 from timetable import utils
 
@@ -41,4 +48,98 @@ class SuperUserPermissionMixin(UserPassesTestMixin):
     Only logged super user can pass the test
     """
     def test_func(self):
-        return self.request.user and self.request.user.is_superuser
\ No newline at end of file
+        return self.request.user and self.request.user.is_superuser
+
+
+class EagerLoadingMixin:
+    """
+    For the REST viewsets: load at once the related objects needed by the serializer of the viewset,
+    as declared by the serializer in its select_related_fields and prefetch_related_fields attributes.
+    In this way the number of queries of a list doesn't depend on the number of objects in the page.
+    """
+    def filter_queryset(self, queryset):
+        queryset = super(EagerLoadingMixin, self).filter_queryset(queryset)
+        serializer_class = self.get_serializer_class()
+        return queryset.select_related(*getattr(serializer_class, 'select_related_fields', [])) \
+            .prefetch_related(*getattr(serializer_class, 'prefetch_related_fields', []))
+
+
+class WeekCacheMixin:
+    """
+    For the REST viewsets listing the assignments of an interval (from_date and to_date parameters), using the versions
+    of the weeks of the school in the interval (see utils.get_week_versions), which change whenever the assignments,
+    holidays, stages or hour slots of those weeks do:
+    - the responses have ETag and Last-Modified: when the client already has the current version, a 304 is returned
+      without reading the assignments;
+    - the serialized assignments of a single week are kept in the cache, per school, school year, course, teacher or
+      room and Monday, and they are used as long as the versions they were computed with are the current ones.
+    The versions are per course, teacher and room too, so that a lecture that changes only invalidates the lists that
+    can contain it.
+    """
+    def get_week_scope(self, request):
+        """
+        :return: a tuple (scope, id) of the assignments listed, among utils.WEEK_SCOPES
+        """
+        for scope in (utils.COURSE, utils.TEACHER):
+            value = request.GET.get(scope)
+            if value and value.isdigit():
+                return scope, int(value)
+        return utils.ALL_ASSIGNMENTS, None
+
+    def get_week_versions(self, request):
+        """
+        :return: a dict with the school, the interval and the scope of the list requested, and the current versions,
+                 None when it can't be versioned.
+        """
+        school = utils.get_school_from_user(request.user)
+        try:
+            from_date = datetime.date.fromisoformat(request.GET.get('from_date', ''))
+            to_date = datetime.date.fromisoformat(request.GET.get('to_date', ''))
+        except ValueError:
+            return None
+        if school is None or from_date > to_date:
+            return None
+        scope, scope_id = self.get_week_scope(request)
+        versions = utils.get_week_versions(school.id, from_date, to_date, scope, scope_id)
+        if versions is None:
+            return None
+        versions, last_modified = versions
+        return dict(school=school.id, from_date=from_date, to_date=to_date, scope=scope, scope_id=scope_id,
+                    versions=versions, last_modified=last_modified)
+
+    def get_week_payload_cache_key(self, request, week):
+        """
+        :return: the key of the serialized assignments in the cache, None when the interval is longer than a week.
+        """
+        mondays = utils.get_mondays(week['from_date'], week['to_date'])
+        if len(mondays) != 1:
+            return None
+        return utils.get_week_payload_cache_key(week['school'], request.GET.get('school_year'), week['scope'],
+                                                week['scope_id'], mondays[0], request.get_full_path())
+
+    def list(self, request, *args, **kwargs):
+        week = self.get_week_versions(request)
+        if week is None:
+            return super(WeekCacheMixin, self).list(request, *args, **kwargs)
+        # The list depends on the same values as its entry in the cache: the parameters, the school and the scope
+        # (e.g. the timetable of the logged teacher), so that the users sharing an entry share its ETag too.
+        key = '\n'.join([request.get_full_path(), str(week['school']), week['scope'], str(week['scope_id'])] +
+                        week['versions'])
+        etag = quote_etag(hashlib.md5(key.encode()).hexdigest())
+        response = get_conditional_response(request, etag=etag, last_modified=int(week['last_modified'].timestamp()))
+        if response is None:
+            payload_key = self.get_week_payload_cache_key(request, week)
+            payload = cache.get(payload_key) if payload_key else None
+            if payload is not None and payload[0] == week['versions']:
+                response = Response(payload[1])
+            else:
+                response = super(WeekCacheMixin, self).list(request, *args, **kwargs)
+                # Only a whole list is kept: a page depends on the pagination parameters and it's a dict.
+                if payload_key and response.status_code == 200 and isinstance(response.data, list):
+                    # The entry of an older version is replaced, rather than waiting for it to expire
+                    cache.set(payload_key, (week['versions'], list(response.data)), utils.WEEK_PAYLOAD_CACHE_TIMEOUT)
+        response['ETag'] = etag
+        response['Last-Modified'] = http_date(week['last_modified'].timestamp())
+        # The browsers must always ask whether the week changed, rather than guessing how long it stays the same.
+        patch_cache_control(response, private=True, no_cache=True)
+        return response
@@ -1,10 +1,14 @@
+from datetime import timedelta
+
 from colorfield.fields import ColorField
 from django.db import models
 from django.contrib.auth.models import User, UserManager, AbstractUser
-from django.db.models import Q
+from django.db.models import Q, F, OuterRef, Subquery, DateField, DurationField, ExpressionWrapper
+from django.db.models.functions import Coalesce, ExtractIsoWeekDay
 from django.utils.translation import gettext_lazy as _
 from queryable_properties.managers import QueryablePropertiesManager
 from queryable_properties.properties import queryable_property, SetterMixin, QueryableProperty
+from queryable_properties.properties.mixins import AnnotationMixin
 
 # Create your models here.
 
@@ -97,6 +101,74 @@ class SchoolFromTeacherProperty(SetterMixin, QueryableProperty):
         return Q(teacher__school=value)
 
 
+class LegalDurationProperty(AnnotationMixin, QueryableProperty):
+    """
+    The legal duration of an Assignment, computed in the database.
+    The assignment is joined (left outer join fashion) with the HourSlot of the hour_slots_group of its course,
+    with the same day of the week, starts_at and ends_at: where there is such hour slot, then we use its
+    'legal_duration', otherwise we use the actual duration of the assignment (hour_end - hour_start).
+    Since it is an annotation, the total hours of any grouping of assignments are a single SUM, e.g.
+    Assignment.objects.values('teacher').annotate(total=Sum('legal_duration'))
+    """
+    def get_value(self, obj):
+        if obj.pk is not None:
+            return type(obj).objects.select_properties(self.name).values_list(self.name, flat=True).get(pk=obj.pk)
+        hour_slot = HourSlot.objects.filter(hour_slots_group=obj.course.hour_slots_group,
+                                            day_of_week=obj.date.weekday(),
+                                            starts_at=obj.hour_start,
+                                            ends_at=obj.hour_end).first()
+        if hour_slot:
+            return hour_slot.legal_duration
+        return timedelta(hours=obj.hour_end.hour - obj.hour_start.hour,
+                         minutes=obj.hour_end.minute - obj.hour_start.minute)
+
+    def get_annotation(self, cls):
+        hour_slots = HourSlot.objects.filter(hour_slots_group=OuterRef('course__hour_slots_group'),
+                                             # day_of_week goes from 0 (Monday) to 6, iso_week_day from 1 to 7
+                                             day_of_week=ExtractIsoWeekDay(
+                                                 ExpressionWrapper(OuterRef('date'), output_field=DateField())) - 1,
+                                             starts_at=OuterRef('hour_start'),
+                                             ends_at=OuterRef('hour_end')).order_by('id')
+        return Coalesce(Subquery(hour_slots.values('legal_duration')[:1], output_field=DurationField()),
+                        ExpressionWrapper(F('hour_end') - F('hour_start'), output_field=DurationField()))
+
+
+class LoadedValuesMixin:
+    """
+    Remembers the values of the fields of an instance as they were loaded from the database (or last saved), so that
+    its previous version is known without reading the row again.
+    """
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super(LoadedValuesMixin, cls).from_db(db, field_names, values)
+        instance._loaded_values = dict(zip(field_names, values))
+        return instance
+
+    def save(self, *args, **kwargs):
+        super(LoadedValuesMixin, self).save(*args, **kwargs)
+        update_fields = kwargs.get('update_fields')
+        if update_fields is None or not hasattr(self, '_loaded_values'):
+            self._loaded_values = {field.attname: getattr(self, field.attname)
+                                   for field in self._meta.concrete_fields}
+        else:
+            for name in update_fields:
+                attname = self._meta.get_field(name).attname
+                self._loaded_values[attname] = getattr(self, attname)
+
+    def get_previous_version(self):
+        """
+        :return: an instance (not saved) with the values in the database, None when they are the same of this instance.
+                 The row is read only when the loaded values are not known (e.g. some fields were deferred).
+        """
+        loaded = getattr(self, '_loaded_values', None)
+        if loaded is None or len(loaded) != len(self._meta.concrete_fields):
+            return type(self).objects.filter(pk=self.pk).first()
+        if all(getattr(self, attname) == value for attname, value in loaded.items()):
+            return None
+        return type(self)(**loaded)
+
+
 class School(models.Model):
     """
     This allows to keep more schools on the same db.
@@ -272,7 +344,7 @@ class AbsenceBlock(models.Model):
         return "{}, {}, {}".format(str(self.teacher), str(self.hour_slot), str(self.school_year))
 
 
-class Holiday(models.Model):
+class Holiday(LoadedValuesMixin, models.Model):
     """
     Days when teachers don't have lectures
     """
@@ -290,7 +362,7 @@ class Holiday(models.Model):
         return _("{}: from {} to {}").format(self.name, self.date_start, self.date_end)
 
 
-class Stage(models.Model):
+class Stage(LoadedValuesMixin, models.Model):
     """
     During a stage, a class doesn't have teachers assigned (it is like an holiday, but specific for a given class).
     """
@@ -396,7 +468,21 @@ class HoursPerTeacherInClass(models.Model):
         return str(self.teacher) + " - " + str(self.course) + " " + self.subject.name
 
 
-class Assignment(models.Model):
+class AssignmentManager(QueryablePropertiesManager):
+    """
+    Fills the denormalized school and school_year of the assignments created in bulk (no save() is called).
+    """
+    def bulk_create(self, objs, *args, **kwargs):
+        objs = list(objs)
+        # Load the courses of all the assignments at once
+        courses = Course.objects.select_related('hour_slots_group').in_bulk({a.course_id for a in objs})
+        for a in objs:
+            a.course = courses[a.course_id]
+        Assignment.fill_school_and_school_year(objs)
+        return super(AssignmentManager, self).bulk_create(objs, *args, **kwargs)
+
+
+class Assignment(LoadedValuesMixin, models.Model):
     """
     Assignment for a teacher in a class.
     Every hour has a different assignment.
@@ -423,10 +509,59 @@ class Assignment(models.Model):
     # it means that the substitution should not be considered when counting the total hours of substitutions
     free_substitution = models.BooleanField(null=False, blank=False, default=False, verbose_name=_("free substitution"))
 
-    school = SchoolFromCourseProperty()
-    school_year = SchoolYearFromCourseProperty()
+    # Denormalized from course.hour_slots_group, to filter the assignments without joining three tables.
+    # They are kept consistent on save, bulk_create and when a course (or its hour slots group) moves.
+    school = models.ForeignKey(School, on_delete=models.CASCADE, null=False, blank=False, editable=False,
+                               verbose_name=_("school"))
+    school_year = models.ForeignKey(SchoolYear, on_delete=models.CASCADE, null=False, blank=False, editable=False,
+                                    verbose_name=_("school year"))
+    legal_duration = LegalDurationProperty()
 
-    objects = QueryablePropertiesManager()
+    objects = AssignmentManager()
+
+    class Meta:
+        # The assignments are almost always looked up in a day (or a week) of a teacher, a course or a room,
+        # or in a time interval of a day (conflicts and substitutions).
+        # substituted_assignment is a foreign key, hence it is already indexed.
+        indexes = [
+            models.Index(fields=['teacher', 'date', 'hour_start'], name='assignment_teacher_date_idx'),
+            models.Index(fields=['course', 'date'], name='assignment_course_date_idx'),
+            models.Index(fields=['room', 'date', 'hour_start'], name='assignment_room_date_idx'),
+            models.Index(fields=['date', 'hour_start', 'hour_end'], name='assignment_date_hours_idx'),
+            # Substitutions and absences are a small fraction of the assignments
+            models.Index(fields=['date'], condition=Q(substitution=True), name='assignment_substitution_idx'),
+            models.Index(fields=['teacher', 'date'], condition=Q(absent=True), name='assignment_absent_idx'),
+        ]
+
+    @staticmethod
+    def fill_school_and_school_year(assignments):
+        """
+        Set the school and the school_year of the assignments (or of the recurring assignments), from the hour slots
+        group of their courses.
+        The courses (with their hour slots groups) already loaded in the assignments are used, and the assignments
+        loaded from the database keep their values while their course doesn't change; the others are read with a
+        single query.
+        :param assignments: list of assignments
+        """
+        to_read = []
+        for assignment in assignments:
+            course = assignment.course if assignment._meta.get_field('course').is_cached(assignment) else None
+            if course is not None and course.pk == assignment.course_id and Course.hour_slots_group.is_cached(course):
+                assignment.school_id = course.hour_slots_group.school_id
+                assignment.school_year_id = course.hour_slots_group.school_year_id
+            elif assignment.school_id is None or assignment.school_year_id is None or \
+                    getattr(assignment, '_loaded_values', {}).get('course_id') != assignment.course_id:
+                to_read.append(assignment)
+        if to_read:
+            schools = {course: (school, school_year) for course, school, school_year in Course.objects.filter(
+                id__in={a.course_id for a in to_read}).values_list('id', 'hour_slots_group__school',
+                                                                   'hour_slots_group__school_year')}
+            for assignment in to_read:
+                assignment.school_id, assignment.school_year_id = schools.get(assignment.course_id, (None, None))
+
+    def save(self, *args, **kwargs):
+        Assignment.fill_school_and_school_year([self])
+        super(Assignment, self).save(*args, **kwargs)
 
     def __str__(self):
         return "{}; {}; {}; {}; {} - {}".format(
@@ -437,3 +572,100 @@ class Assignment(models.Model):
             self.hour_start,
             self.hour_end
         )
+
+
+class RecurringAssignmentQuerySet(models.QuerySet):
+    def valid_in(self, date_start, date_end):
+        """
+        :return: the recurring assignments whose validity range intersects the interval [date_start, date_end]
+        """
+        return self.filter(date_start__lte=date_end, date_end__gte=date_start)
+
+
+class RecurringAssignment(models.Model):
+    """
+    Weekly template of a lecture: it is held every week, in the same day of the week and hours,
+    from date_start to date_end inclusive (except for holidays and stages of the course).
+    Instead of one Assignment per date, a lecture of the whole school year is a single row; the dates when it doesn't
+    follow the template (it is cancelled, substituted or changed) are RecurringAssignmentException.
+    The concrete lectures of any interval are computed by timetable.recurring.get_occurrences.
+    """
+    teacher = models.ForeignKey(Teacher, on_delete=models.CASCADE, null=False, blank=False, verbose_name=_("teacher"))
+    course = models.ForeignKey(Course, null=False, blank=False, on_delete=models.CASCADE, verbose_name=_("course"))
+    subject = models.ForeignKey(Subject, null=False, blank=False, on_delete=models.CASCADE, verbose_name=_("subject"))
+    room = models.ForeignKey(Room, null=True, blank=True, on_delete=models.CASCADE, verbose_name=_("room"))
+
+    day_of_week = models.IntegerField(choices=DAYS_OF_WEEK, null=False, blank=False, verbose_name=_("day of the week"))
+    hour_start = models.TimeField(null=False, blank=False, verbose_name=_("start hour"))
+    hour_end = models.TimeField(null=False, blank=False, verbose_name=_("end hour"))
+    bes = models.BooleanField(null=False, blank=False, default=False, verbose_name=_("BES"))
+    co_teaching = models.BooleanField(null=False, blank=False, default=False, verbose_name=_("Co-teaching"))
+
+    # Validity range of the template
+    date_start = models.DateField(null=False, blank=False, verbose_name=_("start date"))
+    date_end = models.DateField(null=False, blank=False, verbose_name=_("end date"))
+
+    # Denormalized from course.hour_slots_group, as in Assignment.
+    school = models.ForeignKey(School, on_delete=models.CASCADE, null=False, blank=False, editable=False,
+                               verbose_name=_("school"))
+    school_year = models.ForeignKey(SchoolYear, on_delete=models.CASCADE, null=False, blank=False, editable=False,
+                                    verbose_name=_("school year"))
+
+    objects = RecurringAssignmentQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['course', 'date_end'], name='recurring_course_idx'),
+            models.Index(fields=['teacher', 'date_end'], name='recurring_teacher_idx'),
+            models.Index(fields=['school', 'school_year', 'day_of_week'], name='recurring_school_idx'),
+        ]
+
+    def save(self, *args, **kwargs):
+        Assignment.fill_school_and_school_year([self])
+        super(RecurringAssignment, self).save(*args, **kwargs)
+
+    def __str__(self):
+        return "{}; {}; {}; {}; {} - {}".format(
+            self.teacher,
+            self.course,
+            self.room if self.room is not None else _("No room"),
+            self.get_day_of_week_display(),
+            self.hour_start,
+            self.hour_end
+        )
+
+
+class RecurringAssignmentException(models.Model):
+    """
+    A date when a recurring assignment doesn't follow its template:
+    - CANCELLED: the lecture is not held;
+    - SUBSTITUTED: the teacher is absent, and teacher is the substitute;
+    - CHANGED: the lecture is held with the teacher, subject, room or hours given (when not null).
+    """
+    CANCELLED = 'cancelled'
+    SUBSTITUTED = 'substituted'
+    CHANGED = 'changed'
+    KINDS = (
+        (CANCELLED, _('Cancelled')),
+        (SUBSTITUTED, _('Substituted')),
+        (CHANGED, _('Changed')),
+    )
+
+    recurring_assignment = models.ForeignKey(RecurringAssignment, on_delete=models.CASCADE, null=False, blank=False,
+                                             related_name='exceptions', verbose_name=_("recurring assignment"))
+    date = models.DateField(null=False, blank=False, verbose_name=_("date"))
+    kind = models.CharField(max_length=16, choices=KINDS, null=False, blank=False, verbose_name=_("kind"))
+
+    teacher = models.ForeignKey(Teacher, on_delete=models.CASCADE, null=True, blank=True, verbose_name=_("teacher"))
+    subject = models.ForeignKey(Subject, null=True, blank=True, on_delete=models.CASCADE, verbose_name=_("subject"))
+    room = models.ForeignKey(Room, null=True, blank=True, on_delete=models.CASCADE, verbose_name=_("room"))
+    hour_start = models.TimeField(null=True, blank=True, verbose_name=_("start hour"))
+    hour_end = models.TimeField(null=True, blank=True, verbose_name=_("end hour"))
+    # Only for substitutions, as in Assignment.
+    free_substitution = models.BooleanField(null=False, blank=False, default=False, verbose_name=_("free substitution"))
+
+    class Meta:
+        unique_together = ('recurring_assignment', 'date',)
+
+    def __str__(self):
+        return "{}; {}; {}".format(self.recurring_assignment, self.date, self.get_kind_display())
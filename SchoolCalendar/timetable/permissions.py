@@ -2,7 +2,7 @@ from django.contrib.auth.mixins import UserPassesTestMixin
 from rest_framework.permissions import BasePermission
 from rest_framework import permissions
 
-from timetable.models import Teacher, AdminSchool
+from timetable import utils
 
 
 class SchoolAdminCanWriteDelete(BasePermission):
@@ -17,7 +17,7 @@ class SchoolAdminCanWriteDelete(BasePermission):
         else:
             # Check permissions for write request
             # Only if the logged in user is an admin.
-            return AdminSchool.objects.filter(id=request.user.id).exists()
+            return utils.is_adminschool(request.user)
 
 
 class TeacherCanView(BasePermission):
@@ -29,4 +29,4 @@ class TeacherCanView(BasePermission):
             # A teacher can only see things, without creating, modifying or deleting anything
             # Some user need to be authenticated
             return False
-        return Teacher.objects.filter(id=request.user.id).exists()
+        return utils.is_teacher(request.user)
@@ -0,0 +1,154 @@
+import datetime
+from collections import defaultdict
+
+from django.db import transaction
+
+from timetable.models import Assignment, RecurringAssignment, RecurringAssignmentException
+from timetable.replication import get_blocked_dates
+
+
+# Fields that identify the same lecture in different weeks: they are turned into a single recurring assignment.
+RECURRING_LECTURE_FIELDS = ('teacher_id', 'course_id', 'subject_id', 'room_id', 'hour_start', 'hour_end', 'bes',
+                            'co_teaching')
+
+
+def _make_occurrence(recurring_assignment, date, **fields):
+    """
+    :return: an Assignment (not saved) with the lecture of the recurring assignment held in the date, where the given
+             fields replace the ones of the template.
+    """
+    values = dict(teacher=recurring_assignment.teacher,
+                  course=recurring_assignment.course,
+                  subject=recurring_assignment.subject,
+                  room=recurring_assignment.room,
+                  hour_start=recurring_assignment.hour_start,
+                  hour_end=recurring_assignment.hour_end,
+                  bes=recurring_assignment.bes,
+                  co_teaching=recurring_assignment.co_teaching,
+                  school_id=recurring_assignment.school_id,
+                  school_year_id=recurring_assignment.school_year_id,
+                  date=date)
+    values.update(fields)
+    occurrence = Assignment(**values)
+    occurrence.recurring_assignment = recurring_assignment
+    return occurrence
+
+
+def _expand_exception(recurring_assignment, date, exception):
+    """
+    :return: the list of the occurrences of the recurring assignment in a date when it doesn't follow the template.
+    """
+    if exception.kind == RecurringAssignmentException.CANCELLED:
+        return []
+    if exception.kind == RecurringAssignmentException.SUBSTITUTED:
+        absent = _make_occurrence(recurring_assignment, date, absent=True)
+        if exception.teacher_id is None:
+            # The teacher is absent, and nobody has been found yet.
+            return [absent]
+        substitution = _make_occurrence(recurring_assignment, date, teacher=exception.teacher, substitution=True,
+                                        substituted_assignment=absent,
+                                        free_substitution=exception.free_substitution)
+        return [absent, substitution]
+    changes = {field: getattr(exception, field) for field in ('teacher', 'subject', 'room', 'hour_start', 'hour_end')
+               if getattr(exception, field) is not None}
+    return [_make_occurrence(recurring_assignment, date, **changes)]
+
+
+def get_occurrences(recurring_assignments, date_start, date_end):
+    """
+    Expand lazily the recurring assignments into the concrete lectures held in the interval [date_start, date_end],
+    skipping the holidays of the school and the stages of the courses, and applying the exceptions.
+    Only the templates and the exceptions of the interval are read (4 queries, whatever the length of the interval),
+    and nothing is read until the first occurrence is requested.
+    :param recurring_assignments: queryset of recurring assignments
+    :param date_start: date of beginning of interval
+    :param date_end: date of end of interval
+    :return: a generator of Assignment instances (not saved), ordered by date and hour_start. Every occurrence has the
+             attribute recurring_assignment; the substitutions are linked to the absent occurrence they substitute.
+    """
+    recurring_assignments = list(recurring_assignments.valid_in(date_start, date_end)
+                                 .select_related('teacher', 'course', 'subject', 'room')
+                                 .order_by('hour_start', 'id'))
+    if not recurring_assignments:
+        return
+
+    by_weekday = defaultdict(list)
+    for ra in recurring_assignments:
+        by_weekday[ra.day_of_week].append(ra)
+
+    exceptions = {}
+    for exception in RecurringAssignmentException.objects.filter(recurring_assignment__in=recurring_assignments,
+                                                                 date__gte=date_start, date__lte=date_end) \
+            .select_related('teacher', 'subject', 'room'):
+        exceptions[(exception.recurring_assignment_id, exception.date)] = exception
+
+    blocked_dates = get_blocked_dates(recurring_assignments, date_start, date_end)
+
+    date = date_start
+    while date <= date_end:
+        for ra in by_weekday.get(date.weekday(), []):
+            if not ra.date_start <= date <= ra.date_end or date in blocked_dates[ra.course_id]:
+                continue
+            exception = exceptions.get((ra.id, date))
+            if exception is None:
+                yield _make_occurrence(ra, date)
+            else:
+                yield from _expand_exception(ra, date, exception)
+        date += datetime.timedelta(days=1)
+
+
+def extend_recurring_assignments(recurring_assignments, date_end):
+    """
+    Replicate the recurring assignments until date_end: this is a single UPDATE of their validity range, whatever the
+    number of weeks (the holidays and the stages are skipped when the occurrences are computed).
+    :param recurring_assignments: queryset of recurring assignments
+    :param date_end: the new end of the validity range
+    :return: the number of recurring assignments extended
+    """
+    return recurring_assignments.filter(date_end__lt=date_end).update(date_end=date_end)
+
+
+@transaction.atomic
+def create_recurring_assignments(assignments, date_end):
+    """
+    Turn a week of assignments into recurring assignments, valid from the date of every assignment to date_end.
+    Substitutions are one-off changes, hence they are not turned into templates (but the lecture of the absent teacher
+    is). Lectures equal to a recurring assignment that is already valid in that date are skipped.
+    :param assignments: queryset of assignments (usually of one week)
+    :param date_end: end of the validity range of the recurring assignments
+    :return: the list of the created recurring assignments
+    """
+    assignments = list(assignments.filter(substitution=False, date__lte=date_end).order_by('date', 'hour_start'))
+    if not assignments:
+        return []
+
+    def key(el, day_of_week):
+        return (day_of_week,) + tuple(getattr(el, field) for field in RECURRING_LECTURE_FIELDS)
+
+    # key -> validity ranges of the recurring assignments already present
+    present = defaultdict(list)
+    for ra in RecurringAssignment.objects.filter(course__in={a.course_id for a in assignments}) \
+            .valid_in(min(a.date for a in assignments), date_end):
+        present[key(ra, ra.day_of_week)].append((ra.date_start, ra.date_end))
+
+    new_recurring_assignments = {}
+    for a in assignments:
+        k = key(a, a.date.weekday())
+        if k in new_recurring_assignments or any(start <= a.date <= end for start, end in present[k]):
+            continue
+        new_recurring_assignments[k] = RecurringAssignment(
+            teacher_id=a.teacher_id,
+            course_id=a.course_id,
+            subject_id=a.subject_id,
+            room_id=a.room_id,
+            day_of_week=a.date.weekday(),
+            hour_start=a.hour_start,
+            hour_end=a.hour_end,
+            bes=a.bes,
+            co_teaching=a.co_teaching,
+            date_start=a.date,
+            date_end=date_end,
+            school_id=a.school_id,
+            school_year_id=a.school_year_id
+        )
+    return RecurringAssignment.objects.bulk_create(list(new_recurring_assignments.values()))
@@ -0,0 +1,287 @@
+import datetime
+from collections import defaultdict
+
+from django.db import transaction
+
+from timetable.models import Assignment, Holiday, Stage
+from timetable.utils import bump_assignment_versions
+
+
+# Fields that identify a lecture as "the same lecture" of an assignment being replicated (the room is not among them).
+EQUIVALENT_LECTURE_FIELDS = ('course_id', 'teacher_id', 'subject_id', 'hour_start', 'hour_end', 'bes',
+                             'co_teaching', 'absent', 'substitution')
+
+# Fields that identify an assignment as a duplicate of another one (all of them but the id).
+DUPLICATE_ASSIGNMENT_FIELDS = ('teacher_id', 'course_id', 'subject_id', 'room_id', 'date', 'hour_start', 'hour_end',
+                               'bes', 'co_teaching', 'substitution', 'substituted_assignment_id', 'absent',
+                               'free_substitution')
+
+
+class ReplicationConflictEngine:
+    """
+    Computes the course, teacher and room conflicts that the replication of a set of assignments would cause
+    in a given interval of dates.
+    The whole candidate window (all the assignments in the interval, for the schools involved) is loaded once,
+    and then it is indexed by (school, school_year, weekday, hour_start) and teacher, course or room, so that every
+    replicated assignment only looks at the lectures that are held in the same weekday and hour.
+    Hence the number of queries depends neither on the number of assignments nor on the length of the interval.
+    """
+
+    def __init__(self, assignments_qs, from_date, to_date):
+        """
+        :param assignments_qs: queryset of assignments that are going to be replicated
+        :param from_date: date of beginning of interval
+        :param to_date: date of end of interval
+        """
+        self.assignments = list(assignments_qs.select_related('room'))
+        self.from_date = from_date
+        self.to_date = to_date
+
+    @staticmethod
+    def _lecture_key(school, school_year, weekday, el):
+        """
+        :return: the key used to detect whether two assignments are the same lecture in the same weekday.
+        """
+        return (school, school_year, weekday) + tuple(el[field] for field in EQUIVALENT_LECTURE_FIELDS)
+
+    def _load_candidates(self):
+        """
+        :return: the assignments in the interval, in the schools of the replicated assignments, as dicts.
+        """
+        schools = {a.school_id for a in self.assignments}
+        return Assignment.objects.filter(date__gte=self.from_date,
+                                         date__lte=self.to_date,
+                                         school__in=schools) \
+            .values('id', 'date', 'room_id', 'school_id', 'school_year_id', *EQUIVALENT_LECTURE_FIELDS)
+
+    def get_conflicts(self, check_course_conflicts):
+        """
+        Applies the same rules of WeekReplicationConflictWrapperView.get_course_teacher_room_conflict:
+        room capacity is counted by distinct courses, and copies of the replicated lectures are not conflicts.
+
+        :param check_course_conflicts: bool to decide if course conflicts should be reported or not
+        :return: the three sets of ids of the course, teacher and room conflicts.
+        """
+        course_conflicts, teacher_conflicts, room_conflicts = set(), set(), set()
+        if not self.assignments:
+            return course_conflicts, teacher_conflicts, room_conflicts
+
+        # Lectures equivalent to the ones that we want to replicate aren't conflicts,
+        # but the same lecture already defined by the user
+        replicated_lectures = set()
+        for a in self.assignments:
+            el = {field: getattr(a, field) for field in EQUIVALENT_LECTURE_FIELDS}
+            replicated_lectures.add(self._lecture_key(a.school_id, a.school_year_id, a.date.weekday(), el))
+
+        # Index all the possible conflicts by the slot (school, school_year, weekday, hour_start) in which they are
+        # held, together with their course, teacher or room.
+        by_course, by_teacher = defaultdict(set), defaultdict(set)
+        # For the rooms we keep, per date, the courses in the room and the assignments held there.
+        by_room = defaultdict(lambda: defaultdict(lambda: (set(), [])))
+        for el in self._load_candidates():
+            weekday = el['date'].weekday()
+            school, school_year = el['school_id'], el['school_year_id']
+            if self._lecture_key(school, school_year, weekday, el) in replicated_lectures:
+                continue
+            slot = (school, school_year, weekday, el['hour_start'])
+            by_course[slot + (el['course_id'],)].add(el['id'])
+            by_teacher[slot + (el['teacher_id'],)].add(el['id'])
+            if el['room_id'] is not None and not el['substitution']:
+                courses, room_assignments = by_room[slot + (el['room_id'],)][el['date']]
+                courses.add(el['course_id'])
+                room_assignments.append(el['id'])
+
+        for a in self.assignments:
+            slot = (a.school_id, a.school_year_id, a.date.weekday(), a.hour_start)
+            if check_course_conflicts:
+                course_conflicts |= by_course.get(slot + (a.course_id,), set())
+            teacher_conflicts |= by_teacher.get(slot + (a.teacher_id,), set())
+
+            if a.room_id is None:
+                continue
+            for courses, room_assignments in by_room.get(slot + (a.room_id,), {}).values():
+                if a.course_id not in courses and len(courses) >= a.room.capacity:
+                    # The course is not one of the already present in the room
+                    # and the capacity of the room is filled, then: mark the room conflict.
+                    room_conflicts.update(room_assignments)
+
+        return course_conflicts, teacher_conflicts, room_conflicts
+
+
+def get_blocked_dates(assignments, from_date, to_date):
+    """
+    Precompute the dates of the interval when the courses of the given assignments don't have lectures,
+    either because of a Holiday (of their school and school_year) or of a Stage (of the course).
+    It runs two queries, whatever the number of assignments and the length of the interval.
+    :param assignments: list of assignments
+    :param from_date: date of beginning of interval
+    :param to_date: date of end of interval
+    :return: a dict course_id -> set of blocked dates
+    """
+    courses = {a.course_id: (a.school_id, a.school_year_id) for a in assignments}
+    blocked_dates = {course: set() for course in courses}
+    if not courses:
+        return blocked_dates
+
+    def dates_between(date_start, date_end):
+        d = max(date_start, from_date)
+        while d <= min(date_end, to_date):
+            yield d
+            d += datetime.timedelta(days=1)
+
+    holidays_per_group = defaultdict(set)
+    holidays = Holiday.objects.filter(school__in={school for school, _ in courses.values()},
+                                      school_year__in={school_year for _, school_year in courses.values()},
+                                      date_start__lte=to_date,
+                                      date_end__gte=from_date).values('school', 'school_year',
+                                                                      'date_start', 'date_end')
+    for h in holidays:
+        holidays_per_group[(h['school'], h['school_year'])].update(dates_between(h['date_start'], h['date_end']))
+    for course, school_and_school_year in courses.items():
+        blocked_dates[course] |= holidays_per_group[school_and_school_year]
+
+    stages = Stage.objects.filter(course__in=courses.keys(),
+                                  date_start__lte=to_date,
+                                  date_end__gte=from_date).values('course', 'date_start', 'date_end')
+    for st in stages:
+        blocked_dates[st['course']].update(dates_between(st['date_start'], st['date_end']))
+    return blocked_dates
+
+
+class ReplicationWriter:
+    """
+    Creates the copies of a week of assignments in every week of a given interval, skipping holidays, stages and
+    the assignments already present.
+    The pipeline runs with a constant number of queries:
+    - the blocked dates of every course are precomputed once (see get_blocked_dates);
+    - the duplicate detection is a set-membership lookup against the keys of the assignments already present;
+    - the copies of the substitutions are linked to the copies of the substituted assignments through the pks
+      of the created rows.
+    """
+
+    def __init__(self, assignments_qs, from_date, to_date, without_substitutions):
+        """
+        :param assignments_qs: queryset of assignments that are going to be replicated
+        :param from_date: date of beginning of interval
+        :param to_date: date of end of interval
+        :param without_substitutions: when True, substitutions are not replicated and copies are never absent
+        """
+        # Iterate only over non substitutions.
+        # In case we want to replicate them, then both substituted and substitution is going to be created
+        self.assignments = list(assignments_qs.exclude(substitution=True))
+        self.from_date = from_date
+        self.to_date = to_date
+        self.without_substitutions = without_substitutions
+
+    @staticmethod
+    def _key(assignment):
+        return tuple(getattr(assignment, field) for field in DUPLICATE_ASSIGNMENT_FIELDS)
+
+    def _load_present_assignments(self):
+        """
+        :return: a dict key -> id of the assignments of the replicated courses already present in the interval.
+        """
+        present = Assignment.objects.filter(course__in={a.course_id for a in self.assignments},
+                                            date__gte=self.from_date,
+                                            date__lte=self.to_date).values('id', *DUPLICATE_ASSIGNMENT_FIELDS)
+        return {tuple(el[field] for field in DUPLICATE_ASSIGNMENT_FIELDS): el['id'] for el in present}
+
+    def _load_substitutions(self):
+        """
+        :return: a dict substituted_assignment_id -> the (first) substitution of the replicated assignments.
+        """
+        substitutions = {}
+        if self.without_substitutions:
+            return substitutions
+        for sub in Assignment.objects.filter(substituted_assignment__in=self.assignments).order_by('-id'):
+            substitutions[sub.substituted_assignment_id] = sub
+        return substitutions
+
+    def _dates_to_replicate(self, a, blocked_dates):
+        """
+        :return: the days of the interval with the same weekday of the assignment, where it can be replicated.
+        """
+        d = self.from_date + datetime.timedelta(days=(a.date.weekday() - self.from_date.weekday()) % 7)
+        while d <= self.to_date:
+            if d != a.date and d not in blocked_dates[a.course_id]:
+                yield d
+            d += datetime.timedelta(days=7)
+
+    @transaction.atomic
+    def replicate(self):
+        """
+        Create the copies of the assignments.
+        :return: the list of the created assignments.
+        """
+        blocked_dates = get_blocked_dates(self.assignments, self.from_date, self.to_date)
+        present = self._load_present_assignments()
+        substitutions = self._load_substitutions()
+
+        new_assignments = []
+        # Substitutions, together with the substituted assignment: either its index in new_assignments
+        # (when it is created now) or its pk (when it was already present).
+        new_substitutions = []
+        for a in self.assignments:
+            for d in self._dates_to_replicate(a, blocked_dates):
+                # First we create the "substituted" or normal hour
+                new_a = Assignment(
+                    teacher_id=a.teacher_id,
+                    course_id=a.course_id,
+                    subject_id=a.subject_id,
+                    room_id=a.room_id,
+                    hour_start=a.hour_start,
+                    hour_end=a.hour_end,
+                    bes=a.bes,
+                    co_teaching=a.co_teaching,
+                    substitution=a.substitution,
+                    substituted_assignment_id=a.substituted_assignment_id,
+                    absent=(False if self.without_substitutions else a.absent),
+                    date=d
+                )
+                # Add the new assignment only if is not already present
+                is_new = self._key(new_a) not in present
+                if is_new:
+                    substituted = len(new_assignments)
+                    new_assignments.append(new_a)
+                else:
+                    substituted = present[self._key(new_a)]
+
+                substitution = substitutions.get(a.id)
+                if substitution is not None:
+                    # If we want to replicate even the substitutions, then do it:
+                    new_substitution = Assignment(
+                        teacher_id=substitution.teacher_id,
+                        course_id=substitution.course_id,
+                        subject_id=substitution.subject_id,
+                        room_id=substitution.room_id,
+                        hour_start=substitution.hour_start,
+                        hour_end=substitution.hour_end,
+                        bes=substitution.bes,
+                        co_teaching=substitution.co_teaching,
+                        substitution=True,
+                        absent=substitution.absent,
+                        date=d
+                    )
+                    new_substitutions.append((new_substitution, substituted, is_new))
+
+        # Create in blocks: in the first one the new assignments that could even be substituted,
+        # while in the second one only substitutions assignments. Divided in two due to reference constraints.
+        created = Assignment.objects.bulk_create(new_assignments)
+        if new_substitutions and any(a.pk is None for a in created):
+            # The database backend doesn't return the pks of the created rows (e.g. SQLite): read them back at once.
+            created_ids = self._load_present_assignments()
+            for a in created:
+                a.pk = created_ids[self._key(a)]
+
+        substitutions_to_create = []
+        for new_substitution, substituted, is_new in new_substitutions:
+            new_substitution.substituted_assignment_id = created[substituted].pk if is_new else substituted
+            # Add the new substitution only if is not already present
+            if is_new or self._key(new_substitution) not in present:
+                substitutions_to_create.append(new_substitution)
+        created += Assignment.objects.bulk_create(substitutions_to_create)
+        # bulk_create sends no signals: change the versions of the weeks here (and of the substituted teachers, whose
+        # lists show the substitutes)
+        substituted = {s.substituted_assignment_id for s in substitutions_to_create} - {a.pk for a in created}
+        bump_assignment_versions(created + list(Assignment.objects.filter(id__in=substituted)))
+        return created
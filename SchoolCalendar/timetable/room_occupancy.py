@@ -0,0 +1,113 @@
+import datetime
+from bisect import bisect_left
+from collections import defaultdict
+
+from django.core.cache import cache
+
+from timetable.models import Assignment, Room
+from timetable import utils
+
+
+class DayOccupancy:
+    """
+    The lectures held in a room in a date, as an interval index: the lectures are sorted by hour_start, and every
+    position keeps the latest hour_end of the lectures up to it, so the lectures overlapping an interval are found
+    with a binary search plus a walk back that stops as soon as no earlier lecture can reach the interval.
+    """
+
+    def __init__(self, lectures):
+        """
+        :param lectures: iterable of (hour_start, hour_end, room, course)
+        """
+        self.lectures = sorted(lectures)
+        self.starts = [hour_start for hour_start, _, _, _ in self.lectures]
+        self.max_ends = []
+        for _, hour_end, _, _ in self.lectures:
+            self.max_ends.append(max(hour_end, self.max_ends[-1]) if self.max_ends else hour_end)
+
+    def overlapping(self, hour_start, hour_end):
+        """
+        :return: the (hour_start, hour_end, room, course) of the lectures that overlap [hour_start, hour_end)
+        """
+        i = bisect_left(self.starts, hour_end) - 1
+        while i >= 0 and self.max_ends[i] > hour_start:
+            if self.lectures[i][1] > hour_start:
+                yield self.lectures[i]
+            i -= 1
+
+
+class RoomOccupancy:
+    """
+    Occupancy of the rooms of a school in a week: for every date, the courses that have a lecture in a room at a given
+    time. A room is full when it hosts as many courses as its capacity (the lectures of the same course don't count
+    twice: more teachers can be in the same course and room at the same time, e.g. for co-teaching).
+    """
+
+    def __init__(self, monday, rooms, lectures):
+        """
+        :param monday: first day of the week
+        :param rooms: dict id of the room -> capacity
+        :param lectures: iterable of (date, hour_start, hour_end, room, course) of the lectures held in a room
+        """
+        self.monday = monday
+        self.capacity = rooms
+        days = defaultdict(list)
+        for date, *lecture in lectures:
+            days[date].append(lecture)
+        self.days = {date: DayOccupancy(day_lectures) for date, day_lectures in days.items()}
+
+    @classmethod
+    def load(cls, school_id, school_year_id, monday):
+        """
+        Read the occupancy of a week from the database, with a query for the rooms and one for the assignments.
+        """
+        return cls(monday,
+                   dict(Room.objects.filter(school=school_id).values_list('id', 'capacity')),
+                   Assignment.objects.filter(school=school_id, school_year=school_year_id, date__gte=monday,
+                                             date__lte=monday + datetime.timedelta(days=6), room__isnull=False)
+                   .values_list('date', 'hour_start', 'hour_end', 'room', 'course'))
+
+    def get_full_rooms(self, date, hour_start, hour_end, course=None):
+        """
+        :param course: the course of the lecture, whose lectures don't take a place in the rooms
+        :return: the set of the ids of the rooms that are full at some time in [hour_start, hour_end) of the date
+        """
+        day = self.days.get(date)
+        if day is None:
+            return set()
+        courses = defaultdict(set)
+        for _, _, room, lecture_course in day.overlapping(hour_start, hour_end):
+            if lecture_course != course:
+                courses[room].add(lecture_course)
+        return {room for room, room_courses in courses.items() if len(room_courses) >= self.capacity.get(room, 1)}
+
+    def get_free_rooms(self, date, hour_start, hour_end, course=None):
+        """
+        :return: the sorted list of the ids of the rooms that have a place in [hour_start, hour_end) of the date
+        """
+        full_rooms = self.get_full_rooms(date, hour_start, hour_end, course)
+        return sorted(room for room in self.capacity if room not in full_rooms)
+
+    def get_week_free_rooms(self, hour_slots, course=None):
+        """
+        :param hour_slots: iterable of (day_of_week, starts_at, ends_at)
+        :return: a list of (date, hour_start, hour_end, list of the free rooms) for every hour slot of the week
+        """
+        return [(self.monday + datetime.timedelta(days=day_of_week), hour_start, hour_end,
+                 self.get_free_rooms(self.monday + datetime.timedelta(days=day_of_week), hour_start, hour_end, course))
+                for day_of_week, hour_start, hour_end in sorted(set(hour_slots))]
+
+
+def get_room_occupancy(school_id, school_year_id, monday):
+    """
+    :return: the RoomOccupancy of the week starting on monday, from the cache as long as the assignments and the rooms
+             of the week don't change (see utils.get_week_versions), otherwise it is read again.
+    """
+    versions, _ = utils.get_week_versions(school_id, monday, monday)
+    key = utils.get_room_occupancy_cache_key(school_id, school_year_id, monday)
+    cached = cache.get(key)
+    if cached is not None and cached[0] == versions:
+        return cached[1]
+    occupancy = RoomOccupancy.load(school_id, school_year_id, monday)
+    cache.set(key, (versions, occupancy), utils.WEEK_STATE_CACHE_TIMEOUT)
+    return occupancy
@@ -0,0 +1,67 @@
+import numpy as np
+import pandas as pd
+
+from timetable.models import Assignment, HourSlot, Holiday, Room
+
+
+def get_days_per_weekday(school_id, school_year_id, date_start, date_end):
+    """
+    :return: an array with the number of days of every day of the week (Monday is 0) in the interval
+             [date_start, date_end] that are not holidays of the school.
+    """
+    dates = pd.date_range(date_start, date_end)
+    school_days = np.ones(len(dates), dtype=bool)
+    for holiday_start, holiday_end in Holiday.objects.filter(school=school_id, school_year=school_year_id,
+                                                             date_start__lte=date_end, date_end__gte=date_start) \
+            .values_list('date_start', 'date_end'):
+        school_days &= (dates < pd.Timestamp(holiday_start)) | (dates > pd.Timestamp(holiday_end))
+    return np.bincount(dates.weekday[school_days], minlength=7)
+
+
+class RoomUsage:
+    """
+    Usage of the rooms of a school in an interval of dates, for every time of the week (day of the week, hour_start,
+    hour_end) of the hour slots of the school year (and of the lectures held at other times):
+    - occupancy: the fraction of the school days when the room is used at that time;
+    - pressure: the fraction of the capacity of the room taken at that time, on average over the school days (the
+      courses in the room; the lectures of the same course count once, as in RoomFilter).
+    The lectures are read with a single query, and aggregated as a whole with pandas.
+    Both matrices are DataFrames with a row for every room (by id) and a column for every time of the week.
+    """
+
+    def __init__(self, school_id, school_year_id, date_start, date_end):
+        self.date_start, self.date_end = date_start, date_end
+        self.rooms = pd.DataFrame.from_records(
+            list(Room.objects.filter(school=school_id).order_by('name', 'id').values_list('id', 'name', 'capacity')),
+            columns=['id', 'name', 'capacity'], index='id')
+        self.days = get_days_per_weekday(school_id, school_year_id, date_start, date_end)
+
+        lectures = pd.DataFrame.from_records(
+            list(Assignment.objects.filter(school=school_id, school_year=school_year_id, date__gte=date_start,
+                                           date__lte=date_end, room__isnull=False)
+                 .values_list('room', 'course', 'date', 'hour_start', 'hour_end')),
+            columns=['room', 'course', 'date', 'hour_start', 'hour_end'])
+        lectures = lectures.drop_duplicates()
+        lectures['day_of_week'] = pd.to_datetime(lectures['date']).dt.weekday
+        # Number of courses in a room at a time of a date, then the dates are aggregated for every time of the week.
+        courses = lectures.groupby(['room', 'date', 'day_of_week', 'hour_start', 'hour_end']).size()
+        times = ['day_of_week', 'hour_start', 'hour_end']
+        per_time = courses.groupby(['room'] + times).agg(['size', 'sum'])
+
+        hour_slots = HourSlot.objects.filter(hour_slots_group__school=school_id,
+                                             hour_slots_group__school_year=school_year_id) \
+            .values_list('day_of_week', 'starts_at', 'ends_at').distinct()
+        self.times = pd.MultiIndex.from_tuples(
+            sorted(set(hour_slots) | set(per_time.index.droplevel('room'))), names=times)
+
+        def to_matrix(column):
+            return per_time[column].unstack(times).reindex(index=self.rooms.index, columns=self.times, fill_value=0) \
+                .fillna(0).to_numpy(dtype=float)
+
+        days = self.days[self.times.get_level_values('day_of_week')].astype(float)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            occupancy = np.where(days > 0, to_matrix('size') / days, 0.)
+            capacity = np.maximum(self.rooms['capacity'].to_numpy(), 1)[:, None]
+            pressure = np.where(days > 0, to_matrix('sum') / (days * capacity), 0.)
+        self.occupancy = pd.DataFrame(occupancy, index=self.rooms.index, columns=self.times)
+        self.pressure = pd.DataFrame(pressure, index=self.rooms.index, columns=self.times)
@@ -1,16 +1,20 @@
 from django.contrib.auth.models import User
-from django.db.models import Q
+from django.db.models import Manager, Prefetch, prefetch_related_objects
 from django.http import JsonResponse
 from django.utils.translation import gettext as _
 
 from rest_framework.serializers import HyperlinkedModelSerializer, ModelSerializer, Serializer, IntegerField, CharField, \
-    DateField, SerializerMethodField, ValidationError, PrimaryKeyRelatedField, BooleanField
+    DateField, SerializerMethodField, ValidationError, PrimaryKeyRelatedField, BooleanField, ListSerializer
 
 import datetime
 
 from timetable.models import Teacher, Holiday, Stage, AbsenceBlock, Assignment, HoursPerTeacherInClass, HourSlot, \
     Course, Subject, Room, TeachersYearlyLoad, CoursesYearlyLoad, HourSlotsGroup
 from timetable import utils
+from timetable.hour_slots import HourSlotsIndex
+from timetable.substitutions import SubstitutionScores
+from timetable.summaries import compute_teachers_summary, compute_hours_per_teacher_in_class_done, \
+    filter_assignments_in_period, total_hours
 
 
 class CourseYearOnlySerializer(Serializer):
@@ -40,13 +44,23 @@ class AbstractTimePeriodSerializer(ModelSerializer):
     start = SerializerMethodField()
     end = SerializerMethodField()
 
+    def get_filtered_date(self, name):
+        """
+        :param name: 'from_date' or 'to_date'
+        :return: the extreme of the filtered period, as given in the context or in the url (if any)
+        """
+        if name in self.context:
+            return self.context[name]
+        if self.context['request'].GET.get(name):
+            return datetime.datetime.strptime(self.context['request'].GET.get(name), '%Y-%m-%d').date()
+        return None
+
     def get_start(self, obj, *args, **kwargs):
         """
         :return: the maximum value among the beginning of the holiday, and the beginning of the filtered period
         """
-        if self.context['request'].GET.get('from_date'):
-            start = datetime.datetime.strptime(self.context['request'].GET.get('from_date'), '%Y-%m-%d').date()
-        else:
+        start = self.get_filtered_date('from_date')
+        if start is None:
             # No filter applied
             return obj.date_start
         start = start if start > obj.date_start else obj.date_start
@@ -56,9 +70,8 @@ class AbstractTimePeriodSerializer(ModelSerializer):
         """
         :return: the minimum value among the end of the holiday, and the end of the filtered period
         """
-        if self.context['request'].GET.get('to_date'):
-            end = datetime.datetime.strptime(self.context['request'].GET.get('to_date'), '%Y-%m-%d').date()
-        else:
+        end = self.get_filtered_date('to_date')
+        if end is None:
             # No filter applied
             return obj.date_end
         end = end if end < obj.date_end else obj.date_end
@@ -69,7 +82,7 @@ class TeacherSerializer(ModelSerializer):
     full_name = SerializerMethodField(read_only=True)
 
     def get_full_name(self, obj, *args, **kwargs):
-        return obj.teacher.last_name + ' ' + obj.teacher.first_name
+        return obj.last_name + ' ' + obj.first_name
 
     class Meta:
         model = Teacher
@@ -77,6 +90,17 @@ class TeacherSerializer(ModelSerializer):
                   'in_activity', 'notes']
 
 
+class TeacherSummaryListSerializer(ListSerializer):
+    """
+    Computes the summaries of all the teachers of the list at once, and hands them to the child serializer.
+    """
+    def to_representation(self, data):
+        teachers = data.all() if isinstance(data, Manager) else data
+        teachers = list(teachers)
+        self.child.summaries = self.child.compute_summaries(teachers)
+        return super(TeacherSummaryListSerializer, self).to_representation(teachers)
+
+
 class TeacherSummarySerializer(ModelSerializer):
     hours_done = SerializerMethodField()  # normal hours done in the given date period
     hours_bes_done = SerializerMethodField()  # bes hours done in the given date period
@@ -90,138 +114,48 @@ class TeacherSummarySerializer(ModelSerializer):
         model = Teacher
         fields = ['id', 'first_name', 'last_name', 'hours_done', 'hours_bes_done', 'hours_co_teaching_done',
                   'total_hours', 'total_hours_bes', 'total_hours_co_teaching', 'hours_substitution_done']
+        list_serializer_class = TeacherSummaryListSerializer
 
-    def get_hours_done(self, obj, *args, **kwargs):
-        # Get start_date and end_date parameters from url
-        start_date = self.context.get('request').query_params.get('start_date')
-        end_date = self.context.get('request').query_params.get('end_date')
+    def __init__(self, *args, **kwargs):
+        super(TeacherSummarySerializer, self).__init__(*args, **kwargs)
+        self.summaries = {}
 
-        school_year = self.context.get('request').query_params.get('school_year')
+    def compute_summaries(self, teachers):
+        """
+        :return: the summaries of the given teachers, in the period and school year given in the url.
+        """
+        query_params = self.context.get('request').query_params
+        return compute_teachers_summary(teachers,
+                                        school_year=query_params.get('school_year'),
+                                        start_date=query_params.get('start_date'),
+                                        end_date=query_params.get('end_date'))
+
+    def get_summary(self, obj):
+        if obj.id not in self.summaries:
+            # Not computed by the list serializer (e.g., when retrieving a single teacher)
+            self.summaries.update(self.compute_summaries([obj]))
+        return self.summaries[obj.id]
 
-        assignments = Assignment.objects.filter(teacher=obj.id,
-                                                school=obj.school,
-                                                school_year=school_year,
-                                                substitution=False,
-                                                bes=False).values('date__week_day', 'hour_start', 'hour_end')
-        # Filter in a time interval
-        if start_date and utils.is_date_string_valid(start_date):
-            assignments = assignments.filter(date__gte=start_date)
-        if end_date and utils.is_date_string_valid(end_date):
-            assignments = assignments.filter(date__lte=end_date)
-
-        for el in assignments:
-            el['date__week_day'] = utils.convert_weekday_into_0_6_format(el['date__week_day'])
-
-        hours_slots = HourSlot.objects.filter(school=obj.school,
-                                              school_year=school_year).values("day_of_week", "starts_at",
-                                                                              "ends_at", "legal_duration")
-        total = utils.compute_total_hours_assignments(assignments, hours_slots)
-        return total
+    def get_hours_done(self, obj, *args, **kwargs):
+        return self.get_summary(obj)['hours_done']
 
     def get_hours_bes_done(self, obj, *args, **kwargs):
-        # Get start_date and end_date parameters from url
-        start_date = self.context.get('request').query_params.get('start_date')
-        end_date = self.context.get('request').query_params.get('end_date')
-
-        school_year = self.context.get('request').query_params.get('school_year')
-
-        assignments = Assignment.objects.filter(teacher=obj.id,
-                                                school=obj.school,
-                                                school_year=school_year,
-                                                bes=True).values('date__week_day', 'hour_start', 'hour_end')
-        # Filter in a time interval
-        if start_date and utils.is_date_string_valid(start_date):
-            assignments = assignments.filter(date__gte=start_date)
-        if end_date and utils.is_date_string_valid(end_date):
-            assignments = assignments.filter(date__lte=end_date)
-
-        for el in assignments:
-            el['date__week_day'] = utils.convert_weekday_into_0_6_format(el['date__week_day'])
-
-        hours_slots = HourSlot.objects.filter(school=obj.school,
-                                              school_year=school_year).values("day_of_week", "starts_at",
-                                                                              "ends_at", "legal_duration")
-        total = utils.compute_total_hours_assignments(assignments, hours_slots)
-        return total
+        return self.get_summary(obj)['hours_bes_done']
 
     def get_hours_co_teaching_done(self, obj, *args, **kwargs):
-        # Get start_date and end_date parameters from url
-        start_date = self.context.get('request').query_params.get('start_date')
-        end_date = self.context.get('request').query_params.get('end_date')
-
-        school_year = self.context.get('request').query_params.get('school_year')
-
-        assignments = Assignment.objects.filter(teacher=obj.id,
-                                                school=obj.school,
-                                                school_year=school_year,
-                                                co_teaching=True).values('date__week_day', 'hour_start', 'hour_end')
-        # Filter in a time interval
-        if start_date and utils.is_date_string_valid(start_date):
-            assignments = assignments.filter(date__gte=start_date)
-        if end_date and utils.is_date_string_valid(end_date):
-            assignments = assignments.filter(date__lte=end_date)
-
-        for el in assignments:
-            el['date__week_day'] = utils.convert_weekday_into_0_6_format(el['date__week_day'])
-
-        hours_slots = HourSlot.objects.filter(school=obj.school,
-                                              school_year=school_year).values("day_of_week", "starts_at",
-                                                                              "ends_at", "legal_duration")
-        total = utils.compute_total_hours_assignments(assignments, hours_slots)
-        return total
+        return self.get_summary(obj)['hours_co_teaching_done']
 
     def get_hours_substitution_done(self, obj, *args, **kwargs):
-        # Get start_date and end_date parameters from url
-        start_date = self.context.get('request').query_params.get('start_date')
-        end_date = self.context.get('request').query_params.get('end_date')
-
-        school_year = self.context.get('request').query_params.get('school_year')
-
-        assignments = Assignment.objects.filter(teacher=obj.id,
-                                                school=obj.school,
-                                                school_year=school_year,
-                                                substitution=True).values('date__week_day', 'hour_start', 'hour_end')
-        # Filter in a time interval
-        if start_date and utils.is_date_string_valid(start_date):
-            assignments = assignments.filter(date__gte=start_date)
-        if end_date and utils.is_date_string_valid(end_date):
-            assignments = assignments.filter(date__lte=end_date)
-
-        for el in assignments:
-            el['date__week_day'] = utils.convert_weekday_into_0_6_format(el['date__week_day'])
-
-        hours_slots = HourSlot.objects.filter(school=obj.school,
-                                              school_year=school_year).values("day_of_week", "starts_at",
-                                                                              "ends_at", "legal_duration")
-        total = utils.compute_total_hours_assignments(assignments, hours_slots)
-        return total
+        return self.get_summary(obj)['hours_substitution_done']
 
     def get_total_hours(self, obj, *args, **kwargs):
-        school_year = self.context.get('request').query_params.get('school_year')
-
-        yearly_load = TeachersYearlyLoad.objects.filter(teacher=obj.id,
-                                                        school_year=school_year)
-        if yearly_load:
-            return yearly_load.first().yearly_load
-        return 0
+        return self.get_summary(obj)['total_hours']
 
     def get_total_hours_bes(self, obj, *args, **kwargs):
-        school_year = self.context.get('request').query_params.get('school_year')
-
-        yearly_load = TeachersYearlyLoad.objects.filter(teacher=obj.id,
-                                                        school_year=school_year)
-        if yearly_load:
-            return yearly_load.first().yearly_load_bes
-        return 0
+        return self.get_summary(obj)['total_hours_bes']
 
     def get_total_hours_co_teaching(self, obj, *args, **kwargs):
-        school_year = self.context.get('request').query_params.get('school_year')
-
-        yearly_load = TeachersYearlyLoad.objects.filter(teacher=obj.id,
-                                                        school_year=school_year)
-        if yearly_load:
-            return yearly_load.first().yearly_load_co_teaching
-        return 0
+        return self.get_summary(obj)['total_hours_co_teaching']
 
 
 class CourseSummarySerializer(ModelSerializer):
@@ -247,20 +181,10 @@ class CourseSummarySerializer(ModelSerializer):
                                                 school=obj.school,
                                                 school_year=school_year,
                                                 substitution=False,
-                                                bes=False).values('date__week_day', 'hour_start', 'hour_end')
+                                                bes=False)
         # Filter in a time interval
-        if start_date and utils.is_date_string_valid(start_date):
-            assignments = assignments.filter(date__gte=start_date)
-        if end_date and utils.is_date_string_valid(end_date):
-            assignments = assignments.filter(date__lte=end_date)
-
-        for el in assignments:
-            el['date__week_day'] = utils.convert_weekday_into_0_6_format(el['date__week_day'])
-
-        hours_slots = HourSlot.objects.filter(school=obj.school,
-                                              school_year=school_year).values("day_of_week", "starts_at",
-                                                                              "ends_at", "legal_duration")
-        total = utils.compute_total_hours_assignments(assignments, hours_slots)
+        assignments = filter_assignments_in_period(assignments, start_date, end_date)
+        total = total_hours(assignments)
         return total
 
     def get_hours_bes_done(self, obj, *args, **kwargs):
@@ -273,20 +197,10 @@ class CourseSummarySerializer(ModelSerializer):
         assignments = Assignment.objects.filter(course=obj.id,
                                                 school=obj.school,
                                                 school_year=school_year,
-                                                bes=True).values('date__week_day', 'hour_start', 'hour_end')
+                                                bes=True)
         # Filter in a time interval
-        if start_date and utils.is_date_string_valid(start_date):
-            assignments = assignments.filter(date__gte=start_date)
-        if end_date and utils.is_date_string_valid(end_date):
-            assignments = assignments.filter(date__lte=end_date)
-
-        for el in assignments:
-            el['date__week_day'] = utils.convert_weekday_into_0_6_format(el['date__week_day'])
-
-        hours_slots = HourSlot.objects.filter(school=obj.school,
-                                              school_year=school_year).values("day_of_week", "starts_at",
-                                                                              "ends_at", "legal_duration")
-        total = utils.compute_total_hours_assignments(assignments, hours_slots)
+        assignments = filter_assignments_in_period(assignments, start_date, end_date)
+        total = total_hours(assignments)
         return total
 
     def get_hours_substitution_done(self, obj, *args, **kwargs):
@@ -299,20 +213,10 @@ class CourseSummarySerializer(ModelSerializer):
         assignments = Assignment.objects.filter(course=obj.id,
                                                 school=obj.school,
                                                 school_year=school_year,
-                                                substitution=True).values('date__week_day', 'hour_start', 'hour_end')
+                                                substitution=True)
         # Filter in a time interval
-        if start_date and utils.is_date_string_valid(start_date):
-            assignments = assignments.filter(date__gte=start_date)
-        if end_date and utils.is_date_string_valid(end_date):
-            assignments = assignments.filter(date__lte=end_date)
-
-        for el in assignments:
-            el['date__week_day'] = utils.convert_weekday_into_0_6_format(el['date__week_day'])
-
-        hours_slots = HourSlot.objects.filter(school=obj.school,
-                                              school_year=school_year).values("day_of_week", "starts_at",
-                                                                              "ends_at", "legal_duration")
-        total = utils.compute_total_hours_assignments(assignments, hours_slots)
+        assignments = filter_assignments_in_period(assignments, start_date, end_date)
+        total = total_hours(assignments)
         return total
 
     def get_total_hours(self, obj, *args, **kwargs):
@@ -343,6 +247,8 @@ class CourseSerializer(ModelSerializer):
 class TeachersYearlyLoadSerializer(ModelSerializer):
     teacher = TeacherSerializer()
 
+    select_related_fields = ['teacher']
+
     class Meta:
         model = TeachersYearlyLoad
         fields = ['id', 'teacher', 'yearly_load', 'yearly_load_bes', 'yearly_load_co_teaching', 'school_year']
@@ -351,6 +257,8 @@ class TeachersYearlyLoadSerializer(ModelSerializer):
 class CoursesYearlyLoadSerializer(ModelSerializer):
     course = CourseSerializer()
 
+    select_related_fields = ['course']
+
     class Meta:
         model = CoursesYearlyLoad
         fields = ['id', 'course', 'yearly_load', 'yearly_load_bes']
@@ -378,6 +286,8 @@ class StageSerializer(AbstractTimePeriodSerializer):
     """
     course = CourseSerializer()
 
+    select_related_fields = ['course']
+
     class Meta:
         model = Stage
         fields = ['id', 'start', 'end', 'date_start', 'date_end', 'name', 'course']
@@ -403,6 +313,18 @@ class HourSlotsGroupSerializer(ModelSerializer):
         fields = ['id', 'name', 'school_year']
 
 
+class HoursPerTeacherInClassListSerializer(ListSerializer):
+    """
+    Computes the hours planned of all the HoursPerTeacherInClass of the list at once,
+    and hands them to the child serializer.
+    """
+    def to_representation(self, data):
+        hours_per_teacher_in_class = data.all() if isinstance(data, Manager) else data
+        hours_per_teacher_in_class = list(hours_per_teacher_in_class)
+        self.child.hours_done = self.child.compute_hours_done(hours_per_teacher_in_class)
+        return super(HoursPerTeacherInClassListSerializer, self).to_representation(hours_per_teacher_in_class)
+
+
 class HoursPerTeacherInClassSerializer(ModelSerializer):
     """
     Serializer for teachers
@@ -414,10 +336,33 @@ class HoursPerTeacherInClassSerializer(ModelSerializer):
     subject = SubjectSerializer()
     course = CourseSerializer()
 
+    select_related_fields = ['teacher', 'subject', 'course']
+
     class Meta:
         model = HoursPerTeacherInClass
         fields = ['id', 'teacher', 'course', 'subject', 'hours', 'hours_bes', 'hours_co_teaching',
                   'missing_hours', 'missing_hours_bes', 'missing_hours_co_teaching']
+        list_serializer_class = HoursPerTeacherInClassListSerializer
+
+    def __init__(self, *args, **kwargs):
+        super(HoursPerTeacherInClassSerializer, self).__init__(*args, **kwargs)
+        self.hours_done = {}
+
+    def compute_hours_done(self, hours_per_teacher_in_class):
+        """
+        :return: the hours planned of the given HoursPerTeacherInClass, in the period given in the url.
+        """
+        query_params = self.context.get('request').query_params
+        return compute_hours_per_teacher_in_class_done(hours_per_teacher_in_class,
+                                                       start_date=query_params.get('start_date'),
+                                                       end_date=query_params.get('end_date'))
+
+    def get_hours_done(self, obj):
+        key = (obj.teacher_id, obj.course_id, obj.subject_id)
+        if key not in self.hours_done:
+            # Not computed by the list serializer (e.g., when retrieving a single instance)
+            self.hours_done.update(self.compute_hours_done([obj]))
+        return self.hours_done[key]
 
     def get_missing_hours(self, obj, *args, **kwargs):
         """
@@ -428,32 +373,7 @@ class HoursPerTeacherInClassSerializer(ModelSerializer):
         :param kwargs:
         :return:
         """
-        # Get start_date and end_date parameters from url
-        start_date = self.context.get('request').query_params.get('start_date')
-        end_date = self.context.get('request').query_params.get('end_date')
-        assignments = Assignment.objects.filter(teacher=obj.teacher,
-                                                course=obj.course,
-                                                subject=obj.subject,
-                                                school=obj.school,
-                                                bes=False,
-                                                co_teaching=False).values('date__week_day', 'hour_start', 'hour_end')
-        # Filter in a time interval
-        if start_date and utils.is_date_string_valid(start_date):
-            assignments = assignments.filter(date__gte=start_date)
-        if end_date and utils.is_date_string_valid(end_date):
-            assignments = assignments.filter(date__lte=end_date)
-
-        for el in assignments:
-            el['date__week_day'] = utils.convert_weekday_into_0_6_format(el['date__week_day'])
-
-        hours_slots = HourSlot.objects.filter(school=obj.school,
-                                              school_year=obj.school_year
-                                              ).values("day_of_week",
-                                                       "starts_at",
-                                                       "ends_at",
-                                                       "legal_duration")
-        total = utils.compute_total_hours_assignments(assignments, hours_slots)
-        return obj.hours - total
+        return obj.hours - self.get_hours_done(obj)['hours']
 
     def get_missing_hours_bes(self, obj, *args, **kwargs):
         """
@@ -464,34 +384,7 @@ class HoursPerTeacherInClassSerializer(ModelSerializer):
             :param kwargs:
             :return:
             """
-        start_date = self.context.get('request').query_params.get('start_date')
-        end_date = self.context.get('request').query_params.get('end_date')
-
-        assignments = Assignment.objects.filter(teacher=obj.teacher,
-                                                course=obj.course,
-                                                subject=obj.subject,
-                                                school=obj.school,
-                                                bes=True,
-                                                co_teaching=False).values('date__week_day', 'hour_start', 'hour_end')
-
-        # Filter in a time interval
-        if start_date and utils.is_date_string_valid(start_date):
-            assignments = assignments.filter(date__gte=start_date)
-        if end_date and utils.is_date_string_valid(end_date):
-            assignments = assignments.filter(date__lte=end_date)
-
-        for el in assignments:
-            el['date__week_day'] = utils.convert_weekday_into_0_6_format(el['date__week_day'])
-
-        hours_slots = HourSlot.objects.filter(school=obj.school,
-                                              school_year=obj.school_year
-                                              ).values("day_of_week",
-                                                       "starts_at",
-                                                       "ends_at",
-                                                       "legal_duration")
-        total = utils.compute_total_hours_assignments(assignments, hours_slots)
-
-        return obj.hours_bes - total
+        return obj.hours_bes - self.get_hours_done(obj)['hours_bes']
 
     def get_missing_hours_co_teaching(self, obj, *args, **kwargs):
         """
@@ -502,33 +395,33 @@ class HoursPerTeacherInClassSerializer(ModelSerializer):
             :param kwargs:
             :return:
             """
-        start_date = self.context.get('request').query_params.get('start_date')
-        end_date = self.context.get('request').query_params.get('end_date')
-
-        assignments = Assignment.objects.filter(teacher=obj.teacher,
-                                                course=obj.course,
-                                                subject=obj.subject,
-                                                school=obj.school,
-                                                co_teaching=True).values('date__week_day', 'hour_start', 'hour_end')
+        return obj.hours_co_teaching - self.get_hours_done(obj)['hours_co_teaching']
 
-        # Filter in a time interval
-        if start_date and utils.is_date_string_valid(start_date):
-            assignments = assignments.filter(date__gte=start_date)
-        if end_date and utils.is_date_string_valid(end_date):
-            assignments = assignments.filter(date__lte=end_date)
 
-        for el in assignments:
-            el['date__week_day'] = utils.convert_weekday_into_0_6_format(el['date__week_day'])
+def prefetch_substitutes(assignments):
+    """
+    Load at once the substitutions of the absent assignments, following the reverse of the substituted_assignment FK.
+    The substitutions (with their teacher) of every absent assignment are stored in its 'substitutes' attribute.
+    :param assignments: list of assignments
+    """
+    prefetch_related_objects([a for a in assignments if a.absent],
+                             Prefetch('assignment_set',
+                                      queryset=Assignment.objects.filter(substitution=True, absent=False)
+                                      .select_related('teacher').order_by('id'),
+                                      to_attr='substitutes'))
 
-        hours_slots = HourSlot.objects.filter(school=obj.school,
-                                              school_year=obj.school_year
-                                              ).values("day_of_week",
-                                                       "starts_at",
-                                                       "ends_at",
-                                                       "legal_duration")
-        total = utils.compute_total_hours_assignments(assignments, hours_slots)
 
-        return obj.hours_co_teaching - total
+class AssignmentListSerializer(ListSerializer):
+    """
+    Loads the hour slots and the substitutes needed by all the assignments of the list at once,
+    and hands them to the child serializer.
+    """
+    def to_representation(self, data):
+        assignments = data.all() if isinstance(data, Manager) else data
+        assignments = list(assignments)
+        self.child.hour_slots_index = HourSlotsIndex(assignments)
+        prefetch_substitutes(assignments)
+        return super(AssignmentListSerializer, self).to_representation(assignments)
 
 
 class AssignmentSerializer(ModelSerializer):
@@ -548,28 +441,32 @@ class AssignmentSerializer(ModelSerializer):
     room = RoomSerializer(read_only=True)
     eventual_substitute = SerializerMethodField(read_only=True)
 
+    select_related_fields = ['teacher', 'subject', 'course', 'room']
+
     def __init__(self, *args, **kwargs):
         super(AssignmentSerializer, self).__init__(*args, **kwargs)
         self.user = self.context['request'].user
+        self.hour_slots_index = None
+
+    def get_hour_slots_index(self, obj):
+        """
+        :return: the index of the hour slots, built by the list serializer for all the assignments at once.
+        """
+        if self.hour_slots_index is None or obj.course.hour_slots_group_id not in self.hour_slots_index.groups:
+            # Not built by the list serializer (e.g., when retrieving a single assignment)
+            self.hour_slots_index = HourSlotsIndex([obj])
+        return self.hour_slots_index
 
     def get_hour_slot(self, obj, *args, **kwargs):
         """
         OLDTODO: should better add the hour slot as as a FK in the Assignment model
         RESP: No, otherwise we could not support lecture extra from the standard hour_slots
         Per each Assignment, it returns the corresponding HourSlot (if it exists), otherwise None
-        The problem is that it makes a query for each instance of assignment!
+        The hour slots are resolved from an index loaded once for all the serialized assignments.
         :param obj: the assignment instance
         :return:
         """
-        el = HourSlot.objects.filter(
-            day_of_week=obj.date.weekday(),
-            starts_at=obj.hour_start,
-            ends_at=obj.hour_end,
-            hour_slots_group=obj.course.hour_slots_group  # TODO add property to Assignment model
-        )
-        if el:
-            return el[0].id
-        return None
+        return self.get_hour_slots_index(obj).get_hour_slot(obj)
 
     def get_conflicting_hour_slots(self, obj, *args, **kwargs):
         """
@@ -577,34 +474,18 @@ class AssignmentSerializer(ModelSerializer):
         :param obj: the assignment instance
         :return:
         """
-        conflicts = HourSlot.objects.filter(
-            day_of_week=obj.date.weekday(),
-            school=obj.school,
-            school_year=obj.school_year
-        ).filter(Q(starts_at__lte=obj.hour_start, ends_at__gt=obj.hour_start) |
-                 Q(starts_at__lt=obj.hour_end, ends_at__gte=obj.hour_end) |
-                 Q(starts_at__gt=obj.hour_start, ends_at__lt=obj.hour_end))  # the hour_slot's time is included in the assignment's time
-        return [x for x in conflicts.values_list('id', flat=True)]
+        return self.get_hour_slots_index(obj).get_conflicting_hour_slots(obj)
 
     def get_eventual_substitute(self, obj, *args, **kwargs):
         """
         If the teacher assignment is absent this returns the substitute teacher
         """
         if obj.absent:
-            assignment = Assignment.objects.filter(
-                course=obj.course,
-                subject=obj.subject,
-                room=obj.room,
-                date=obj.date,
-                hour_start=obj.hour_start,
-                hour_end=obj.hour_end,
-                bes=obj.bes,
-                co_teaching=obj.co_teaching,
-                substitution=True,
-                absent=False
-            ).first()
-            if assignment:
-                return TeacherSerializer(assignment.teacher, context=self.context).data
+            if not hasattr(obj, 'substitutes'):
+                # Not prefetched by the list serializer (e.g., when retrieving a single assignment)
+                prefetch_substitutes([obj])
+            if obj.substitutes:
+                return TeacherSerializer(obj.substitutes[0].teacher, context=self.context).data
         return None
 
     def validate(self, attrs):
@@ -687,12 +568,16 @@ class AssignmentSerializer(ModelSerializer):
         fields = ['id', 'teacher', 'teacher_id', 'course', 'course_id', 'subject', 'subject_id', 'room', 'room_id',
                   'date', 'hour_start', 'hour_end', 'bes', 'co_teaching', 'substitution', 'absent', 'free_substitution',
                   'hour_slot', 'conflicting_hour_slots', 'eventual_substitute']
+        list_serializer_class = AssignmentListSerializer
 
 
 class AbsenceBlockSerializer(ModelSerializer):
     teacher = TeacherSerializer()
     hour_slot_text = SerializerMethodField(read_only=True)
 
+    # The text of the hour slot shows its school year
+    select_related_fields = ['teacher', 'hour_slot__hour_slots_group__school_year']
+
     def get_hour_slot_text(self, obj, *args, **kwargs):
         return str(obj.hour_slot)
 
@@ -701,6 +586,17 @@ class AbsenceBlockSerializer(ModelSerializer):
         fields = ['teacher', 'hour_slot', 'hour_slot_text', 'id']
 
 
+class TeacherSubstitutionListSerializer(ListSerializer):
+    """
+    Computes the scores of all the candidate substitutes of the list at once, and hands them to the child serializer.
+    """
+    def to_representation(self, data):
+        teachers = data.all() if isinstance(data, Manager) else data
+        teachers = list(teachers)
+        self.child.scores = self.child.compute_scores(teachers)
+        return super(TeacherSubstitutionListSerializer, self).to_representation(teachers)
+
+
 class TeacherSubstitutionSerializer(ModelSerializer):
     has_hour_before = SerializerMethodField()
     has_hour_after = SerializerMethodField()
@@ -709,79 +605,50 @@ class TeacherSubstitutionSerializer(ModelSerializer):
     def __init__(self, *args, **kwargs):
         super(TeacherSubstitutionSerializer, self).__init__(*args, **kwargs)
         self.user = self.context['request'].user
-        # We have already checked in view .get_queryset whether the Assignment exists.
-        self.assignment_to_substitute = Assignment.objects.get(id=self.context['request'].assignment_pk)
+        self.scores = {}
 
     class Meta:
         model = Teacher
         fields = ['school', 'notes', 'has_hour_before', 'has_hour_after', 'substitutions_made_so_far', 'first_name',
                   'last_name', 'id']
+        list_serializer_class = TeacherSubstitutionListSerializer
+
+    def compute_scores(self, teachers):
+        """
+        :return: the scores of the given teachers as substitutes of the assignment. They are taken from the context
+                 when the view has already computed them for all the candidates.
+        """
+        scores = self.context.get('substitution_scores', {})
+        if all(t.id in scores for t in teachers):
+            return scores
+        assignment = self.context.get('assignment')
+        if assignment is None:
+            # We have already checked in view .get_queryset whether the Assignment exists.
+            assignment = Assignment.objects.get(id=self.context['request'].assignment_pk)
+        return SubstitutionScores(assignment).get_scores(teachers)
+
+    def get_score(self, obj):
+        if obj.id not in self.scores:
+            # Not computed by the list serializer (e.g., when serializing a single teacher)
+            self.scores.update(self.compute_scores([obj]))
+        return self.scores[obj.id]
 
     def get_substitutions_made_so_far(self, obj, *args, **kwargs):
-        return Assignment.objects.filter(teacher=obj.id,
-                                         school=obj.school,
-                                         school_year=self.assignment_to_substitute.school_year,
-                                         substitution=True).count()
+        return self.get_score(obj)['substitutions_made_so_far']
 
     def get_has_hour_after(self, obj, *args, **kwargs):
-        related_hour_slot = HourSlot.objects.filter(starts_at=self.assignment_to_substitute.hour_start,
-                                                    ends_at=self.assignment_to_substitute.hour_end,
-                                                    day_of_week=self.assignment_to_substitute.date.weekday(),
-                                                    school=obj.school,
-                                                    school_year=self.assignment_to_substitute.school_year).first()
-        if not related_hour_slot:
-            # If there is not a related hour slot, then we are talking about a non standard assignment.
-            # We return False by default
-            return False
-        if related_hour_slot.hour_number == max(HourSlot.objects.filter(
-                day_of_week=self.assignment_to_substitute.date.weekday(),
-                school=obj.school,
-                school_year=self.assignment_to_substitute.school_year)
-                                                        .values_list('hour_number')[0]):
-            # It is the last hour of the day, the teacher can't be at school after.
-            return False
-        later_hour_slot = HourSlot.objects.filter(school=obj.school,
-                                                  school_year=self.assignment_to_substitute.school_year,
-                                                  hour_number=related_hour_slot.hour_number + 1,
-                                                  day_of_week=self.assignment_to_substitute.date.weekday()).first()
-        if not later_hour_slot:
-            # There is no later hour slot, therefore we can't say.
-            return False
-
-        return Assignment.objects.filter(teacher=obj,
-                                         date=self.assignment_to_substitute.date,
-                                         school=obj.school,
-                                         school_year=self.assignment_to_substitute.school_year,
-                                         hour_start=later_hour_slot.starts_at,
-                                         hour_end=later_hour_slot.ends_at).exists()
+        """
+        :return: True when the teacher has a lecture in the hour slot after the assignment to substitute.
+                 False for the last hour of the day and for non standard assignments (not held in an hour slot).
+        """
+        return self.get_score(obj)['has_hour_after']
 
     def get_has_hour_before(self, obj, *args, **kwargs):
-        related_hour_slot = HourSlot.objects.filter(starts_at=self.assignment_to_substitute.hour_start,
-                                                    ends_at=self.assignment_to_substitute.hour_end,
-                                                    day_of_week=self.assignment_to_substitute.date.weekday(),
-                                                    school=obj.school,
-                                                    school_year=self.assignment_to_substitute.school_year).first()
-        if not related_hour_slot:
-            # If there is not a related hour slot, then we are talking about a non standard assignment.
-            # We return False by default
-            return False
-        if related_hour_slot.hour_number == 1:
-            # It is the first hour of the day, the teacher can't be at school before.
-            return False
-        previous_hour_slot = HourSlot.objects.filter(school=obj.school,
-                                                     school_year=self.assignment_to_substitute.school_year,
-                                                     hour_number=related_hour_slot.hour_number - 1,
-                                                     day_of_week=self.assignment_to_substitute.date.weekday()).first()
-        if not previous_hour_slot:
-            # There is no previous hour slot, therefore we can't say.
-            return False
-
-        return Assignment.objects.filter(teacher=obj,
-                                         date=self.assignment_to_substitute.date,
-                                         school=obj.school,
-                                         school_year=self.assignment_to_substitute.school_year,
-                                         hour_start=previous_hour_slot.starts_at,
-                                         hour_end=previous_hour_slot.ends_at).exists()
+        """
+        :return: True when the teacher has a lecture in the hour slot before the assignment to substitute.
+                 False for the first hour of the day and for non standard assignments (not held in an hour slot).
+        """
+        return self.get_score(obj)['has_hour_before']
 
 
 class ReplicationConflictsSerializer(Serializer):
@@ -816,15 +683,14 @@ class SubstitutionSerializer(Serializer):
     other_teachers = SerializerMethodField('get_other_teachers')
 
     def get_available_teachers(self, obj):
-        serializer_context = {'request': self.context.get('request')}
+        # The context can hold the assignment and the scores of all the candidates (see TeacherSubstitutionSerializer)
         serializer = TeacherSubstitutionSerializer(self.initial_data['available_teachers'], many=True,
-                                                   context=serializer_context)
+                                                   context=self.context)
         return serializer.data
 
     def get_other_teachers(self, obj):
-        serializer_context = {'request': self.context.get('request')}
         serializer = TeacherSubstitutionSerializer(self.initial_data['other_teachers'], many=True,
-                                                   context=serializer_context)
+                                                   context=self.context)
         return serializer.data
 
     def create(self, validated_data):
@@ -840,6 +706,8 @@ class SubstitutionAssignmentSerializer(AssignmentSerializer):
     """
     substituted_teacher = SerializerMethodField(read_only=True)
 
+    select_related_fields = AssignmentSerializer.select_related_fields + ['substituted_assignment__teacher']
+
     def get_substituted_teacher(self, obj, *args, **kwargs):
         """
         Per each substitution Assignment, it returns the corresponding substituted teacher.
@@ -0,0 +1,150 @@
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models.signals import pre_save, post_save, post_delete
+from django.dispatch import receiver
+
+from timetable.models import MyUser, Teacher, AdminSchool, Secretary, School, Course, HourSlotsGroup, Assignment, \
+    Holiday, Stage, HourSlot, Room, Subject, AbsenceBlock, RecurringAssignment
+from timetable.utils import get_roles_cache_key, get_school_cache_key, bump_school_version, bump_week_versions, \
+    bump_assignment_versions
+
+
+def _delete_now_and_on_commit(key):
+    """
+    Delete the key now, and again on commit: another process could have cached the old value (still the committed one)
+    in the meanwhile.
+    """
+    cache.delete(key)
+    transaction.on_commit(lambda: cache.delete(key))
+
+
+@receiver(post_save, sender=User)
+@receiver(post_save, sender=MyUser)
+@receiver(post_save, sender=Teacher)
+@receiver(post_save, sender=AdminSchool)
+@receiver(post_save, sender=Secretary)
+@receiver(post_delete, sender=User)
+@receiver(post_delete, sender=MyUser)
+@receiver(post_delete, sender=Teacher)
+@receiver(post_delete, sender=AdminSchool)
+@receiver(post_delete, sender=Secretary)
+def invalidate_roles_cache(sender, instance, **kwargs):
+    """
+    The roles (and the schools) of a user change when a Teacher, AdminSchool or Secretary is created, modified or
+    deleted. Saving a plain User invalidates them too, since its id could belong to a deleted role.
+    """
+    _delete_now_and_on_commit(get_roles_cache_key(instance.pk))
+
+
+@receiver(post_save, sender=School)
+@receiver(post_delete, sender=School)
+def invalidate_school_cache(sender, instance, **kwargs):
+    _delete_now_and_on_commit(get_school_cache_key(instance.pk))
+
+
+@receiver(post_save, sender=Course)
+def update_assignments_of_course(sender, instance, **kwargs):
+    """
+    Keep the school and the school_year of the assignments (and of the recurring assignments) consistent, when the course
+    moves to another hour slots group.
+    """
+    hour_slots_group = instance.hour_slots_group
+    for model in (Assignment, RecurringAssignment):
+        model.objects.filter(course=instance) \
+            .exclude(school=hour_slots_group.school_id, school_year=hour_slots_group.school_year_id) \
+            .update(school=hour_slots_group.school_id, school_year=hour_slots_group.school_year_id)
+
+
+@receiver(post_save, sender=HourSlotsGroup)
+def update_assignments_of_hour_slots_group(sender, instance, **kwargs):
+    """
+    Keep the school and the school_year of the assignments (and of the recurring assignments) consistent, when the hour
+    slots group changes.
+    """
+    for model in (Assignment, RecurringAssignment):
+        model.objects.filter(course__hour_slots_group=instance) \
+            .exclude(school=instance.school_id, school_year=instance.school_year_id) \
+            .update(school=instance.school_id, school_year=instance.school_year_id)
+
+
+def _get_school_of_course(course_id):
+    return Course.objects.filter(id=course_id).values_list('hour_slots_group__school', flat=True).first()
+
+
+@receiver(pre_save, sender=Assignment)
+@receiver(pre_save, sender=Holiday)
+@receiver(pre_save, sender=Stage)
+def remember_previous_version(sender, instance, raw=False, **kwargs):
+    """
+    An assignment, holiday or stage that is moved changes both the weeks where it was and the ones where it goes.
+    The previous version comes from the values loaded with the instance (see LoadedValuesMixin), without reading the row
+    again, and it is None when nothing changed.
+    """
+    if raw or instance.pk is None:
+        return
+    instance._previous_version = instance.get_previous_version()
+
+
+@receiver(post_save, sender=Assignment)
+@receiver(post_delete, sender=Assignment)
+def bump_versions_of_assignment(sender, instance, raw=False, **kwargs):
+    """
+    Change the versions of the week (and of the course, teacher and room) where the assignment is, or was, held.
+    """
+    if raw:
+        return
+    assignments = [a for a in (instance, getattr(instance, '_previous_version', None)) if a is not None]
+    # The lists of the substituted teacher show the substitute too
+    substituted = Assignment.objects.filter(id__in={a.substituted_assignment_id for a in assignments} - {None})
+    bump_assignment_versions(assignments + list(substituted))
+
+
+@receiver(post_save, sender=Holiday)
+@receiver(post_save, sender=Stage)
+@receiver(post_delete, sender=Holiday)
+@receiver(post_delete, sender=Stage)
+def bump_versions_of_weeks(sender, instance, raw=False, **kwargs):
+    """
+    Change the versions of the weeks of the school where the holiday or the stage is, or was.
+    """
+    if raw:
+        return
+    for obj in (instance, getattr(instance, '_previous_version', None)):
+        if obj is None:
+            continue
+        school = obj.school_id if isinstance(obj, Holiday) else _get_school_of_course(obj.course_id)
+        if school is not None:
+            bump_week_versions(school, obj.date_start, obj.date_end)
+
+
+@receiver(post_save, sender=HourSlot)
+@receiver(post_save, sender=HourSlotsGroup)
+@receiver(post_save, sender=Course)
+@receiver(post_save, sender=Teacher)
+@receiver(post_save, sender=Room)
+@receiver(post_save, sender=Subject)
+@receiver(post_save, sender=AbsenceBlock)
+@receiver(post_delete, sender=HourSlot)
+@receiver(post_delete, sender=HourSlotsGroup)
+@receiver(post_delete, sender=Course)
+@receiver(post_delete, sender=Teacher)
+@receiver(post_delete, sender=Room)
+@receiver(post_delete, sender=Subject)
+@receiver(post_delete, sender=AbsenceBlock)
+def bump_version_of_school(sender, instance, raw=False, **kwargs):
+    """
+    The hour slots, and the names of teachers, courses, rooms and subjects are shown in all the weeks of the school
+    (and the absence blocks and the capacity of the rooms decide where the lectures can be placed).
+    """
+    if raw:
+        return
+    if isinstance(instance, (HourSlot, Course)):
+        school = HourSlotsGroup.objects.filter(id=instance.hour_slots_group_id).values_list('school', flat=True).first()
+    elif isinstance(instance, AbsenceBlock):
+        school = HourSlot.objects.filter(id=instance.hour_slot_id).values_list('hour_slots_group__school',
+                                                                                flat=True).first()
+    else:
+        school = instance.school_id
+    if school is not None:
+        bump_school_version(school)
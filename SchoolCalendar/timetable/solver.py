@@ -0,0 +1,157 @@
+import heapq
+from collections import defaultdict
+
+
+# Cost of every substitution already made (or planned) by the substitute: the plan prefers the teachers that made
+# fewer substitutions, and it spreads the lectures of the day among them.
+FAIRNESS_WEIGHT = 10
+
+# Cost of every adjacent hour slot (before and after the lecture) where the substitute has no lecture: the plan prefers
+# the teachers that are already at school in the hours around the lecture.
+ADJACENCY_WEIGHT = 4
+
+
+class MinCostFlow:
+    """
+    Minimum cost flow with successive shortest paths: the paths are found with Dijkstra on the costs reduced by the
+    node potentials (Johnson), hence the costs of the edges must be non negative when the flow is empty.
+    The flow is a maximum flow, of minimum cost among the maximum flows.
+    """
+
+    def __init__(self, n):
+        """
+        :param n: number of nodes, numbered from 0 to n - 1
+        """
+        self.n = n
+        # Every edge is a list [to, capacity, cost, index of the reverse edge in the adjacency list of to]
+        self.graph = [[] for _ in range(n)]
+
+    def add_edge(self, u, v, capacity, cost):
+        """
+        :return: a reference to the edge, to read its flow after solve()
+        """
+        self.graph[u].append([v, capacity, cost, len(self.graph[v])])
+        self.graph[v].append([u, 0, -cost, len(self.graph[u]) - 1])
+        return u, len(self.graph[u]) - 1
+
+    def get_flow(self, edge):
+        """
+        :return: the flow in the edge returned by add_edge
+        """
+        u, i = edge
+        v, _, _, rev = self.graph[u][i]
+        return self.graph[v][rev][1]
+
+    def solve(self, source, sink):
+        """
+        :return: a tuple (flow, cost) of the minimum cost maximum flow from source to sink
+        """
+        potential = [0] * self.n
+        flow = cost = 0
+        while True:
+            distance = [None] * self.n
+            previous = [None] * self.n  # (node, index of the edge) of the shortest path
+            distance[source] = 0
+            heap = [(0, source)]
+            while heap:
+                d, u = heapq.heappop(heap)
+                if d > distance[u]:
+                    continue
+                for i, (v, capacity, edge_cost, _) in enumerate(self.graph[u]):
+                    if capacity <= 0:
+                        continue
+                    nd = d + edge_cost + potential[u] - potential[v]
+                    if distance[v] is None or nd < distance[v]:
+                        distance[v] = nd
+                        previous[v] = (u, i)
+                        heapq.heappush(heap, (nd, v))
+            if distance[sink] is None:
+                return flow, cost
+            for node in range(self.n):
+                if distance[node] is not None:
+                    potential[node] += distance[node]
+
+            # Every edge has capacity 1 from the source, hence every path carries one unit of flow.
+            v = sink
+            while v != source:
+                u, i = previous[v]
+                edge = self.graph[u][i]
+                edge[1] -= 1
+                self.graph[v][edge[3]][1] += 1
+                cost += edge[2]
+                v = u
+            flow += 1
+
+
+def overlap_groups(lectures):
+    """
+    Group the lectures held at overlapping times: two lectures are in the same group when they overlap, directly or
+    through other lectures of the group (e.g. 8-9 and 9-10 are in the group of 8:30-9:30).
+    :param lectures: dict id of the lecture -> tuple (date, hour_start, hour_end)
+    :return: a dict id of the lecture -> time of its group, a tuple (date, number of the group in the date)
+    """
+    groups = {}
+    date = ends_at = None
+    n = 0
+    for lecture, (day, hour_start, hour_end) in sorted(lectures.items(), key=lambda el: el[1]):
+        if day != date or hour_start >= ends_at:
+            if day != date:
+                date, n = day, 0
+            else:
+                n += 1
+            ends_at = hour_end
+        ends_at = max(ends_at, hour_end)
+        groups[lecture] = (day, n)
+    return groups
+
+
+def solve_substitutions(lectures, candidates, substitutions_made, adjacent_lectures):
+    """
+    Find the plan of substitutions that covers the most lectures, and among those the one of minimum cost, where the
+    cost of a substitute grows with the substitutions it makes (already made, and planned in the same plan) and with
+    the adjacent hour slots where it has no lecture.
+    It is a min cost flow: source -> lecture -> (teacher, time of the lecture) -> teacher -> sink, where the node
+    (teacher, time) lets the teacher substitute a single lecture at a time, and the k-th edge from the teacher to the sink
+    costs FAIRNESS_WEIGHT * (substitutions made + k), so that the lectures are spread among the teachers.
+    :param lectures: dict id of the lecture -> time of the lecture, the same for all the lectures that overlap (see
+                     overlap_groups)
+    :param candidates: dict id of the lecture -> iterable of the ids of the teachers that can substitute it
+    :param substitutions_made: dict id of the teacher -> number of substitutions already made
+    :param adjacent_lectures: dict (id of the lecture, id of the teacher) -> number (0, 1 or 2) of the adjacent hour
+                              slots where the teacher has a lecture
+    :return: a dict id of the lecture -> id of the substitute (None when the lecture can't be covered)
+    """
+    lecture_ids = sorted(lectures)
+    teacher_ids = sorted({t for lecture in lecture_ids for t in candidates.get(lecture, ())})
+    times = sorted({(t, lectures[lecture]) for lecture in lecture_ids for t in candidates.get(lecture, ())})
+    # Nodes: source, sink, lectures, (teacher, time), teachers
+    node = {}
+    for key in [('lecture', lecture) for lecture in lecture_ids] + [('time', el) for el in times] + \
+            [('teacher', t) for t in teacher_ids]:
+        node[key] = len(node) + 2
+    source, sink = 0, 1
+    network = MinCostFlow(len(node) + 2)
+
+    edges = {}
+    for lecture in lecture_ids:
+        network.add_edge(source, node[('lecture', lecture)], 1, 0)
+        for t in sorted(candidates.get(lecture, ())):
+            cost = ADJACENCY_WEIGHT * (2 - adjacent_lectures.get((lecture, t), 0))
+            edges[(lecture, t)] = network.add_edge(node[('lecture', lecture)], node[('time', (t, lectures[lecture]))],
+                                                   1, cost)
+    # Every teacher substitutes at most a lecture per time, hence at most as many lectures as its times
+    lectures_per_teacher = defaultdict(int)
+    for t, time in times:
+        lectures_per_teacher[t] += 1
+        network.add_edge(node[('time', (t, time))], node[('teacher', t)], 1, 0)
+    for t in teacher_ids:
+        made = substitutions_made.get(t, 0)
+        for k in range(lectures_per_teacher[t]):
+            network.add_edge(node[('teacher', t)], sink, 1, FAIRNESS_WEIGHT * (made + k))
+
+    network.solve(source, sink)
+    plan = {lecture: None for lecture in lecture_ids}
+    for (lecture, t), edge in edges.items():
+        if network.get_flow(edge):
+            plan[lecture] = t
+    return plan
@@ -0,0 +1,237 @@
+from collections import defaultdict
+
+from django.db import transaction
+from django.db.models import Q, Count
+from django.utils.translation import gettext as _
+
+from timetable.models import Assignment, HourSlot, HoursPerTeacherInClass, AbsenceBlock, Teacher
+from timetable.solver import solve_substitutions, overlap_groups
+
+
+def find_adjacent_hours(hour_slots, hour_start, hour_end):
+    """
+    :param hour_slots: list of dicts with hour_number, starts_at and ends_at of the hour slots of the HourSlotsGroup of
+                       the course of the lecture, in the day of the week of the lecture, ordered by id
+    :return: a tuple with the (starts_at, ends_at) of the hour slots before and after the one of the lecture held in
+             [hour_start, hour_end] (None when there is none, or when the lecture is not held in an hour slot).
+    """
+    related = next((hs for hs in hour_slots if hs['starts_at'] == hour_start and hs['ends_at'] == hour_end), None)
+    if related is None:
+        # If there is not a related hour slot, then we are talking about a non standard assignment.
+        return None, None
+
+    def adjacent(hour_number):
+        return next(((hs['starts_at'], hs['ends_at']) for hs in hour_slots if hs['hour_number'] == hour_number), None)
+    return adjacent(related['hour_number'] - 1), adjacent(related['hour_number'] + 1)
+
+
+class SubstitutionScores:
+    """
+    Computes, for many candidate substitutes of an assignment at once, the information that helps choosing among them:
+    whether they have a lecture in the hour slot before and after the assignment, and how many substitutions they made
+    in the school year.
+    The hour slots adjacent to the assignment are found once (a single query), then the lectures of the day and the
+    substitutions of all the candidates are read with two grouped queries, whatever the number of candidates.
+    """
+
+    def __init__(self, assignment):
+        """
+        :param assignment: the assignment to substitute
+        """
+        self.assignment = assignment
+        self.hour_before, self.hour_after = self._get_adjacent_hour_slots()
+
+    def _get_adjacent_hour_slots(self):
+        """
+        :return: a tuple with the (starts_at, ends_at) of the hour slots before and after the one of the assignment
+                 (see find_adjacent_hours).
+        """
+        hour_slots = HourSlot.objects.filter(hour_slots_group__course=self.assignment.course_id,
+                                             day_of_week=self.assignment.date.weekday()) \
+            .values('hour_number', 'starts_at', 'ends_at').order_by('id')
+        return find_adjacent_hours(list(hour_slots), self.assignment.hour_start, self.assignment.hour_end)
+
+    def get_scores(self, teachers):
+        """
+        :param teachers: list of candidate teachers
+        :return: a dict id of the teacher -> dict with has_hour_before, has_hour_after and substitutions_made_so_far
+        """
+        teacher_ids = [t.id for t in teachers]
+        lectures = set()
+        adjacent_hours = [hours for hours in (self.hour_before, self.hour_after) if hours is not None]
+        if teacher_ids and adjacent_hours:
+            condition = Q()
+            for hour_start, hour_end in adjacent_hours:
+                condition |= Q(hour_start=hour_start, hour_end=hour_end)
+            lectures = set(Assignment.objects.filter(condition,
+                                                     teacher__in=teacher_ids,
+                                                     date=self.assignment.date,
+                                                     school=self.assignment.school_id,
+                                                     school_year=self.assignment.school_year_id)
+                           .values_list('teacher', 'hour_start', 'hour_end'))
+
+        substitutions = {}
+        if teacher_ids:
+            substitutions = dict(Assignment.objects.filter(teacher__in=teacher_ids,
+                                                           school=self.assignment.school_id,
+                                                           school_year=self.assignment.school_year_id,
+                                                           substitution=True)
+                                 .values('teacher').annotate(count=Count('id')).values_list('teacher', 'count')
+                                 .order_by())
+
+        return {teacher_id: {
+            'has_hour_before': self.hour_before is not None and (teacher_id,) + self.hour_before in lectures,
+            'has_hour_after': self.hour_after is not None and (teacher_id,) + self.hour_after in lectures,
+            'substitutions_made_so_far': substitutions.get(teacher_id, 0),
+        } for teacher_id in teacher_ids}
+
+
+class AbsencePlanner:
+    """
+    Plans the substitutions of all the lectures of the teachers that are absent in an interval of dates (e.g. the
+    teachers sick in a day), rather than one lecture at a time.
+    The availability of the teachers of the school is computed for all the lectures in a single pass (with the rules
+    of utils.get_available_teachers, where a teacher is busy when it has a lecture overlapping the one to substitute):
+    the candidates, the hour slots with their absence blocks, the lectures of the days and the substitutions made are
+    read with a query each, whatever the number of lectures and teachers.
+    The plan is globally optimal (see solver.solve_substitutions): it covers as many lectures as possible, balancing the
+    substitutions made so far and preferring the substitutes that have lectures in the adjacent hours.
+    """
+
+    def __init__(self, teachers, date_start, date_end):
+        """
+        :param teachers: list of the absent teachers (of the same school)
+        :param date_start: date of beginning of the absence
+        :param date_end: date of end of the absence
+        """
+        self.teacher_ids = {t.id for t in teachers}
+        self.school = teachers[0].school_id
+        # The lectures of the teachers that are not substituted yet (neither absent nor with a free substitution)
+        self.assignments = list(Assignment.objects.filter(teacher__in=self.teacher_ids, school=self.school,
+                                                          date__gte=date_start, date__lte=date_end,
+                                                          substitution=False, absent=False)
+                                .exclude(id__in=Assignment.objects.filter(
+                                    substituted_assignment__teacher__in=self.teacher_ids,
+                                    date__gte=date_start, date__lte=date_end).values('substituted_assignment'))
+                                .select_related('teacher', 'course', 'subject', 'room')
+                                .order_by('date', 'hour_start', 'id'))
+        self.school_years = {a.school_year_id for a in self.assignments}
+        self.available_teachers = {}
+        self.adjacent_lectures = {}
+        self.substitutions_made = {}
+        if self.assignments:
+            self._load()
+
+    def _load(self):
+        """
+        Compute the teachers available for every lecture (and the adjacent hours where they have lectures), and the
+        substitutions made by the teachers of the school.
+        """
+        # Teachers of the school teaching in the school year, but the absent ones
+        teachers_per_year = defaultdict(set)
+        for teacher, school_year in HoursPerTeacherInClass.objects.filter(
+                teacher__school=self.school, course__hour_slots_group__school_year__in=self.school_years) \
+                .values_list('teacher', 'course__hour_slots_group__school_year').distinct():
+            teachers_per_year[school_year].add(teacher)
+
+        # (hour_slots_group, day_of_week) -> hour slots of the group in that day
+        hour_slots = defaultdict(list)
+        for hs in HourSlot.objects.filter(hour_slots_group__school=self.school,
+                                          hour_slots_group__school_year__in=self.school_years) \
+                .values('id', 'hour_slots_group', 'day_of_week', 'hour_number', 'starts_at', 'ends_at').order_by('id'):
+            hour_slots[(hs['hour_slots_group'], hs['day_of_week'])].append(hs)
+        blocked = defaultdict(set)
+        for hour_slot, teacher in AbsenceBlock.objects.filter(
+                hour_slot__in=[hs['id'] for slots in hour_slots.values() for hs in slots]) \
+                .values_list('hour_slot', 'teacher'):
+            blocked[hour_slot].add(teacher)
+
+        # All the lectures of the school in the days: (school_year, date) -> list of (hour_start, hour_end, teacher)
+        lectures = defaultdict(list)
+        for el in Assignment.objects.filter(school=self.school, school_year__in=self.school_years,
+                                            date__in={a.date for a in self.assignments}) \
+                .values_list('school_year', 'date', 'hour_start', 'hour_end', 'teacher'):
+            lectures[el[:2]].append(el[2:])
+
+        def busy(school_year, date, hour_start, hour_end):
+            """
+            :return: the teachers with a lecture overlapping [hour_start, hour_end], not only the ones with a lecture at
+                     the very same hours.
+            """
+            return {teacher for starts_at, ends_at, teacher in lectures[(school_year, date)]
+                    if starts_at < hour_end and hour_start < ends_at}
+
+        for a in self.assignments:
+            teachers = teachers_per_year[a.school_year_id] - self.teacher_ids
+            slots = hour_slots[(a.course.hour_slots_group_id, a.date.weekday())]
+            # Teachers busy with other lectures, or with an absence block in an hour slot overlapping the lecture, are
+            # not available.
+            teachers = teachers - busy(a.school_year_id, a.date, a.hour_start, a.hour_end)
+            for hs in slots:
+                if hs['starts_at'] < a.hour_end and a.hour_start < hs['ends_at']:
+                    teachers = teachers - blocked[hs['id']]
+            self.available_teachers[a.id] = teachers
+            for hours in find_adjacent_hours(slots, a.hour_start, a.hour_end):
+                if hours is not None:
+                    for t in teachers & busy(a.school_year_id, a.date, *hours):
+                        self.adjacent_lectures[(a.id, t)] = self.adjacent_lectures.get((a.id, t), 0) + 1
+
+        self.substitutions_made = {(el['teacher'], el['school_year']): el['count']
+                                   for el in Assignment.objects.filter(school=self.school,
+                                                                       school_year__in=self.school_years,
+                                                                       substitution=True)
+                                   .values('teacher', 'school_year').annotate(count=Count('id')).order_by()}
+
+    def get_substitutions_made(self, teacher_id, assignment):
+        return self.substitutions_made.get((teacher_id, assignment.school_year_id), 0)
+
+    def plan(self):
+        """
+        :return: a dict id of the assignment -> id of the suggested teacher (None when nobody is available)
+        """
+        substitutions_made = defaultdict(int)
+        for (teacher, _), count in self.substitutions_made.items():
+            substitutions_made[teacher] += count
+        times = overlap_groups({a.id: (a.date, a.hour_start, a.hour_end) for a in self.assignments})
+        return solve_substitutions(times, self.available_teachers, substitutions_made, self.adjacent_lectures)
+
+    @transaction.atomic
+    def substitute(self, substitutions):
+        """
+        Create all the substitutions at once, as SubstituteTeacherApiView does for a single lecture: when the substitute
+        is available the lecture is marked as absent, otherwise the substitution is a free one.
+        :param substitutions: dict id of the assignment -> id of the substitute teacher
+        :return: the list of the created substitutions
+        :raise ValueError: when a lecture is not among the ones to substitute, or a teacher is not valid; then nothing
+                           is saved.
+        """
+        assignments = {a.id: a for a in self.assignments}
+        teachers = Teacher.objects.filter(school=self.school).exclude(id__in=self.teacher_ids) \
+            .in_bulk({teacher for teacher in substitutions.values()})
+        created = []
+        for assignment_id, teacher_id in substitutions.items():
+            a = assignments.get(assignment_id)
+            if a is None:
+                raise ValueError(_("The lecture {} is not among the ones to substitute.").format(assignment_id))
+            if teacher_id not in teachers:
+                raise ValueError(_("The teacher is not valid!"))
+            new_assign = Assignment(teacher=teachers[teacher_id],
+                                    course=a.course,
+                                    subject=a.subject,
+                                    room=a.room,
+                                    date=a.date,
+                                    hour_start=a.hour_start,
+                                    hour_end=a.hour_end,
+                                    bes=a.bes,
+                                    co_teaching=a.co_teaching,
+                                    substitution=True,
+                                    absent=False,
+                                    substituted_assignment=a,
+                                    free_substitution=teacher_id not in self.available_teachers[a.id])
+            if not new_assign.free_substitution:
+                # The substitution counts and it's a normal one
+                a.absent = True
+                a.save()
+            new_assign.save()
+            created.append(new_assign)
+        return created
@@ -0,0 +1,122 @@
+from django.db.models import Q, F, Sum
+
+from timetable.models import Assignment, TeachersYearlyLoad
+from timetable import utils
+
+
+def duration_to_hours(duration):
+    """
+    :param duration: a timedelta (or None, when summing no assignments)
+    :return: the number of whole hours in the duration
+    """
+    if duration is None:
+        return 0
+    return int(duration.total_seconds() / 3600)
+
+
+def filter_assignments_in_period(assignments, start_date=None, end_date=None):
+    """
+    :param start_date: (optional) string YYYY-MM-DD, beginning of the period
+    :param end_date: (optional) string YYYY-MM-DD, end of the period
+    :return: the assignments filtered in the time interval, if the dates are valid.
+    """
+    if start_date and utils.is_date_string_valid(start_date):
+        assignments = assignments.filter(date__gte=start_date)
+    if end_date and utils.is_date_string_valid(end_date):
+        assignments = assignments.filter(date__lte=end_date)
+    return assignments
+
+
+def total_hours(assignments):
+    """
+    :param assignments: queryset of assignments
+    :return: the total number of hours of the assignments, weighted with their legal duration, in a single SUM.
+    """
+    return duration_to_hours(assignments.aggregate(total=Sum('legal_duration'))['total'])
+
+
+def total_hours_per_group(assignments, group_by, **kinds):
+    """
+    Sum the legal duration of the assignments, grouped by the given fields.
+    :param assignments: queryset of assignments
+    :param group_by: list of fields to group by (e.g. ['teacher'] or ['course', 'subject'])
+    :param kinds: for every name, a Q object that selects the assignments to sum (e.g. hours_bes_done=Q(bes=True))
+    :return: a dict (values of the group_by fields) -> dict name -> total hours
+    """
+    rows = assignments.values(*group_by).annotate(**{
+        name: Sum('legal_duration', filter=condition) for name, condition in kinds.items()
+    }).order_by()
+    return {tuple(row[field] for field in group_by): {name: duration_to_hours(row[name]) for name in kinds}
+            for row in rows}
+
+
+def compute_teachers_summary(teachers, school_year, start_date=None, end_date=None):
+    """
+    Compute the hours done (normal, bes, co-teaching and substitution) and the yearly loads of many teachers at once.
+    The hours are summed in a single query grouped by teacher, weighting every assignment with its legal_duration.
+    :param teachers: list of Teacher instances
+    :param school_year: the id of the school year
+    :param start_date: (optional) string YYYY-MM-DD, beginning of the period where to count the hours done
+    :param end_date: (optional) string YYYY-MM-DD, end of the period where to count the hours done
+    :return: a dict teacher_id -> dict with the fields of the TeacherSummarySerializer
+    """
+    teachers = list(teachers)
+    teachers_id = [t.id for t in teachers]
+
+    # Only the assignments in the school of the teacher count.
+    assignments = Assignment.objects.filter(teacher__in=teachers_id,
+                                            school_year=school_year,
+                                            school=F('teacher__school'))
+    assignments = filter_assignments_in_period(assignments, start_date, end_date)
+    hours = total_hours_per_group(assignments, ['teacher'],
+                                  hours_done=Q(substitution=False, bes=False),
+                                  hours_bes_done=Q(bes=True),
+                                  hours_co_teaching_done=Q(co_teaching=True),
+                                  hours_substitution_done=Q(substitution=True))
+
+    yearly_loads = {}
+    for yearly_load in TeachersYearlyLoad.objects.filter(teacher__in=teachers_id,
+                                                         school_year=school_year).order_by('-id'):
+        # Keep the first yearly load of every teacher
+        yearly_loads[yearly_load.teacher_id] = yearly_load
+
+    summaries = {}
+    for teacher in teachers_id:
+        yearly_load = yearly_loads.get(teacher)
+        summaries[teacher] = {
+            'hours_done': 0,
+            'hours_bes_done': 0,
+            'hours_co_teaching_done': 0,
+            'hours_substitution_done': 0,
+            'total_hours': yearly_load.yearly_load if yearly_load else 0,
+            'total_hours_bes': yearly_load.yearly_load_bes if yearly_load else 0,
+            'total_hours_co_teaching': yearly_load.yearly_load_co_teaching if yearly_load else 0,
+        }
+        summaries[teacher].update(hours.get((teacher,), {}))
+    return summaries
+
+
+def compute_hours_per_teacher_in_class_done(hours_per_teacher_in_class, start_date=None, end_date=None):
+    """
+    Compute the hours planned (normal, bes and co-teaching) of many HoursPerTeacherInClass at once,
+    with a single query grouped by teacher, course and subject.
+    :param hours_per_teacher_in_class: list of HoursPerTeacherInClass instances
+    :param start_date: (optional) string YYYY-MM-DD, beginning of the period where to count the hours planned
+    :param end_date: (optional) string YYYY-MM-DD, end of the period where to count the hours planned
+    :return: a dict (teacher_id, course_id, subject_id) -> dict with the hours, hours_bes and hours_co_teaching planned
+    """
+    hours_per_teacher_in_class = list(hours_per_teacher_in_class)
+    assignments = Assignment.objects.filter(teacher__in={h.teacher_id for h in hours_per_teacher_in_class},
+                                            course__in={h.course_id for h in hours_per_teacher_in_class},
+                                            subject__in={h.subject_id for h in hours_per_teacher_in_class})
+    assignments = filter_assignments_in_period(assignments, start_date, end_date)
+    hours = total_hours_per_group(assignments, ['teacher', 'course', 'subject'],
+                                  hours=Q(bes=False, co_teaching=False),
+                                  hours_bes=Q(bes=True, co_teaching=False),
+                                  hours_co_teaching=Q(co_teaching=True))
+
+    hours_done = {}
+    for h in hours_per_teacher_in_class:
+        key = (h.teacher_id, h.course_id, h.subject_id)
+        hours_done[key] = hours.get(key, {'hours': 0, 'hours_bes': 0, 'hours_co_teaching': 0})
+    return hours_done
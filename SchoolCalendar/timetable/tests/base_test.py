@@ -1,5 +1,6 @@
 from django.test import TestCase
 from django.contrib.auth.models import User
+from django.core.cache import cache
 from datetime import datetime
 
 from timetable.models import *
@@ -8,6 +9,8 @@ from timetable.forms import *
 
 class BaseTestCase(TestCase):
     def setUp(self):
+        # The roles and the schools of the users are cached across requests, and ids are reused among the tests
+        cache.clear()
         self.django_admin = User.objects.create_superuser(username='admin', email='admin@fake.com',
                                                           password='password_demo')
 
@@ -231,3 +231,64 @@ class AssignmentTestCase(BaseTestCase):
         f = AssignmentForm(user=self.a1, data=data)
         f.full_clean()
         self.assertFalse(f.is_valid(), msg=f.errors)
+
+    def test_assignment_school_and_school_year(self):
+        """
+        The school and the school_year of the assignments are the ones of their course, on save, on bulk_create
+        and when the course (or its hour slots group) moves.
+        """
+        a1 = Assignment(course=self.c1, subject=self.subj1, teacher=self.teacher1,
+                        date=datetime(day=14, month=9, year=2020), hour_start=time(hour=9, minute=0), hour_end=time(hour=10, minute=5))
+        a1.save()
+        self.assertEqual((a1.school, a1.school_year), (self.s1, self.school_year_2020))
+
+        Assignment.objects.bulk_create([
+            Assignment(course_id=c.id, subject=self.subj1, teacher=self.teacher1,
+                       date=datetime(day=15, month=9, year=2020), hour_start=time(hour=9, minute=0),
+                       hour_end=time(hour=10, minute=5)) for c in [self.c3, self.c2]])
+        self.assertEqual(Assignment.objects.filter(school=self.s1, school_year=self.school_year_2020).count(), 2)
+        self.assertEqual(Assignment.objects.filter(school=self.s2, school_year=self.school_year_2020).count(), 1)
+
+        # The course moves to another school
+        self.c1.hour_slots_group = self.hsg2
+        self.c1.save()
+        self.assertEqual(Assignment.objects.filter(school=self.s2).count(), 2)
+
+        # The hour slots group moves to another school year
+        school_year_2021 = SchoolYear(year_start=2021, date_start=datetime(month=8, year=2021, day=30))
+        school_year_2021.save()
+        self.hsg2.school_year = school_year_2021
+        self.hsg2.save()
+        self.assertEqual(Assignment.objects.filter(school=self.s2, school_year=school_year_2021).count(), 2)
+        self.assertEqual(Assignment.objects.filter(school_year=self.school_year_2020).count(), 1)
+
+        # Filtering by school and school year doesn't join other tables
+        query = str(Assignment.objects.filter(school=self.s1, school_year=self.school_year_2020).query)
+        self.assertNotIn('JOIN', query)
+
+    def test_assignment_save_queries(self):
+        """
+        Saving an assignment reads neither its course again nor its previous row, unless the course changes.
+        """
+        a1 = Assignment(course=self.c1, subject=self.subj1, teacher=self.teacher1,
+                        date=datetime(day=14, month=9, year=2020), hour_start=time(hour=9, minute=0),
+                        hour_end=time(hour=10, minute=0))
+        with self.assertNumQueries(1):
+            a1.save()
+
+        a1 = Assignment.objects.get(id=a1.id)
+        a1.hour_start, a1.hour_end = time(hour=10, minute=0), time(hour=11, minute=0)
+        with self.assertNumQueries(1):
+            a1.save()
+        with self.assertNumQueries(1):
+            a1.save()
+        self.assertEqual(a1.get_previous_version(), None)
+
+        # The course moves the assignment to another school: its school is read, and its previous version is known
+        a1.date = datetime(day=21, month=9, year=2020).date()
+        a1.course_id = self.c2.id
+        self.assertEqual(a1.get_previous_version().date, datetime(day=14, month=9, year=2020).date())
+        with self.assertNumQueries(2):
+            a1.save()
+        self.assertEqual((a1.school_id, a1.school_year_id), (self.s2.id, self.school_year_2020.id))
+        self.assertEqual(Assignment.objects.filter(school=self.s2, date=a1.date).count(), 1)
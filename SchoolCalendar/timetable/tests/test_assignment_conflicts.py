@@ -2,6 +2,8 @@ from django.test import TestCase
 from django.forms.models import model_to_dict
 from datetime import datetime, timedelta, time
 from django.test import Client
+from django.test.utils import CaptureQueriesContext
+from django.db import connection
 
 from timetable.models import *
 from timetable.forms import *
@@ -241,3 +243,40 @@ class AssignmentConflictsTestCase(BaseTestCase):
                 self.assertTrue(self.hs1.id in assgn['conflicting_hour_slots'])
                 self.assertTrue(self.hs2.id in assgn['conflicting_hour_slots'])
         self.assertTrue(found)
+
+    def test_hour_slots_queries_do_not_depend_on_assignments(self):
+        """
+        The hour slot and the conflicting hour slots of all the assignments of a list are resolved
+        with the same queries needed for one assignment.
+        :return:
+        """
+        def count_hour_slots_queries():
+            with CaptureQueriesContext(connection) as context:
+                response = self.c.get(
+                    '/timetable/api/teacher_assignments/{}/{}/'.format(self.t1.id, self.school_year_2020.id))
+            return response.json(), len([q for q in context.captured_queries if 'timetable_hourslot"' in q['sql']])
+
+        Assignment(teacher=self.t1, course=self.c1, subject=self.subj1, date=datetime(day=14, month=9, year=2020),
+                   hour_start=time(hour=9, minute=0), hour_end=time(hour=10, minute=0)).save()
+        json_res, queries_one_assignment = count_hour_slots_queries()
+        self.assertEqual(json_res[0]['hour_slot'], self.hs1.id)
+        self.assertEqual(json_res[0]['conflicting_hour_slots'], [self.hs1.id, self.hs2.id])
+
+        for week in range(1, 10):
+            Assignment(teacher=self.t1, course=self.c2, subject=self.subj1,
+                       date=datetime(day=14, month=9, year=2020) + timedelta(days=7 * week),
+                       hour_start=time(hour=9, minute=30), hour_end=time(hour=10, minute=30)).save()
+            # Not in an hour slot, on Tuesday
+            Assignment(teacher=self.t1, course=self.c1, subject=self.subj1,
+                       date=datetime(day=15, month=9, year=2020) + timedelta(days=7 * week),
+                       hour_start=time(hour=9, minute=0), hour_end=time(hour=10, minute=0)).save()
+        json_res, queries_many_assignments = count_hour_slots_queries()
+        self.assertEqual(len(json_res), 19)
+        self.assertEqual(queries_many_assignments, queries_one_assignment)
+        for assgn in json_res:
+            if datetime.strptime(assgn['date'], '%Y-%m-%d').weekday() == 1:
+                self.assertIsNone(assgn['hour_slot'])
+                self.assertEqual(assgn['conflicting_hour_slots'], [])
+            else:
+                self.assertIn(assgn['hour_slot'], [self.hs1.id, self.hs2.id])
+                self.assertEqual(assgn['conflicting_hour_slots'], [self.hs1.id, self.hs2.id])
@@ -0,0 +1,253 @@
+import io
+from collections import Counter
+from datetime import datetime, date, time, timedelta
+
+from django.core.management import call_command, CommandError
+from django.test import Client
+
+from timetable.models import *
+from timetable.tests.base_test import BaseTestCase
+from timetable.generator import TimetableData, TimetableSearch, write_assignments, search_best_timetable, \
+    assign_rooms, get_lectures_without_room, WEEKS_PER_SCHOOL_YEAR
+
+
+class TimetableGeneratorTestCase(BaseTestCase):
+    def setUp(self):
+        super(TimetableGeneratorTestCase, self).setUp()
+        self.hsg1 = HourSlotsGroup(school=self.s1, school_year=self.sy, name='Default school 1')
+        self.hsg1.save()
+        # 4 days of 4 hours
+        self.hour_slots = []
+        for day_of_week in range(4):
+            for hour in range(4):
+                hs = HourSlot(hour_number=hour + 1, starts_at=time(hour=8 + hour), ends_at=time(hour=9 + hour),
+                              day_of_week=day_of_week, legal_duration=timedelta(hours=1), hour_slots_group=self.hsg1)
+                hs.save()
+                self.hour_slots.append(hs)
+        self.courses = []
+        for section in 'ABC':
+            course = Course(year=1, section=section, hour_slots_group=self.hsg1)
+            course.save()
+            self.courses.append(course)
+        self.sub1 = Subject(name='Maths', school=self.s1)
+        self.sub1.save()
+        self.sub2 = Subject(name='Literature', school=self.s1)
+        self.sub2.save()
+        self.teachers = []
+        for i in range(4):
+            teacher = Teacher(username='t{}'.format(i), school=self.s1, email='t{}@g.com'.format(i),
+                              first_name='fn{}'.format(i), last_name='ln{}'.format(i))
+            teacher.save()
+            self.teachers.append(teacher)
+        # Every course has 8 lectures of Maths and 6 of Literature a week: t0 teaches Maths in A and B, t1 in C,
+        # t2 Literature everywhere but in C with t3 (plus a BES lecture of t3 in C).
+        weekly = [(0, 0, self.sub1, 8, 0), (0, 1, self.sub1, 8, 0), (1, 2, self.sub1, 8, 0),
+                  (2, 0, self.sub2, 6, 0), (2, 1, self.sub2, 6, 0), (3, 2, self.sub2, 6, 1)]
+        for teacher, course, subject, hours, hours_bes in weekly:
+            HoursPerTeacherInClass(teacher=self.teachers[teacher], course=self.courses[course], subject=subject,
+                                   hours=hours * WEEKS_PER_SCHOOL_YEAR, hours_bes=hours_bes * WEEKS_PER_SCHOOL_YEAR,
+                                   hours_co_teaching=0).save()
+        # t1 is not available on the first day
+        for hs in self.hour_slots[:4]:
+            AbsenceBlock(teacher=self.teachers[1], hour_slot=hs).save()
+        # Two rooms for three courses: one of them has capacity 2
+        self.r1 = Room(name='lab1', capacity=1, school=self.s1)
+        self.r1.save()
+        self.r2 = Room(name='lab2', capacity=2, school=self.s1)
+        self.r2.save()
+        self.monday = date(year=2020, month=9, day=14)
+
+    def assertNoConflicts(self, assignments):
+        self.assertFalse([k for k, v in Counter((a.teacher_id, a.date, a.hour_start) for a in assignments).items()
+                          if v > 1])
+        self.assertFalse([k for k, v in Counter((a.course_id, a.date, a.hour_start) for a in assignments
+                                                if not a.bes).items() if v > 1])
+        rooms = Counter((a.room_id, a.date, a.hour_start) for a in assignments if a.room_id is not None)
+        self.assertTrue(all(count <= Room.objects.get(id=room).capacity
+                            for (room, _, _), count in rooms.items()))
+        self.assertFalse([a for a in assignments if a.teacher == self.teachers[1] and a.date == self.monday])
+
+    def test_data(self):
+        with self.assertNumQueries(4):
+            data = TimetableData(self.s1.id, self.sy.id)
+        self.assertEqual(len(data), 3 * 14 + 1)
+        self.assertEqual(len(data.slots), 16)
+        self.assertEqual(len(data.blocked), 4)
+        self.assertEqual(sum(data.lecture_bes), 1)
+        self.assertEqual(len(TimetableData(self.s2.id, self.sy.id)), 0)
+
+    def test_search(self):
+        data = TimetableData(self.s1.id, self.sy.id)
+        search = TimetableSearch(data, seed=0)
+        solution = search.run(iterations=20000)
+        self.assertEqual(solution.hard_violations, 0)
+
+        # The cost evaluated incrementally is the cost of the timetable evaluated from scratch
+        check = TimetableSearch(data)
+        check.slots = search.slots[:]
+        for i in range(len(data)):
+            check._add(i)
+        self.assertEqual((check.hard_violations, check.soft_cost), (search.hard_violations, search.soft_cost))
+
+        created = write_assignments(data, solution, self.monday)
+        self.assertEqual(len(created), len(data))
+        assignments = list(Assignment.objects.filter(school=self.s1, school_year=self.sy))
+        self.assertEqual(len(assignments), len(data))
+        self.assertNoConflicts(assignments)
+        self.assertTrue(all(a.room_id is not None for a in assignments if not a.bes))
+        self.assertEqual({a.date.weekday() for a in assignments}, {0, 1, 2, 3})
+
+        # The week already has lectures
+        with self.assertRaises(ValueError):
+            write_assignments(data, solution, self.monday)
+        Holiday(date_start=self.monday, date_end=self.monday, name='Holiday', school=self.s1,
+                school_year=self.sy).save()
+        created = write_assignments(data, solution, self.monday, replace=True)
+        self.assertFalse([a for a in created if a.date == self.monday])
+        self.assertEqual(Assignment.objects.filter(school=self.s1).count(), len(created))
+
+    def test_restarts(self):
+        """
+        Many searches run in a pool of processes, and the best timetable is kept.
+        """
+        data = TimetableData(self.s1.id, self.sy.id)
+        costs = {seed: TimetableSearch(data, seed).run(iterations=10).cost for seed in range(3, 7)}
+        for processes in (1, 2):
+            solution = search_best_timetable(data, 4, iterations=10, processes=processes, seed=3)
+            self.assertEqual(solution.cost, min(costs.values()))
+            self.assertIn(solution.seed, costs)
+            self.assertEqual(len(solution.slots), len(data))
+
+        solution = search_best_timetable(data, 3, iterations=20000, processes=2)
+        self.assertEqual(solution.hard_violations, 0)
+        write_assignments(data, solution, self.monday)
+        self.assertNoConflicts(list(Assignment.objects.filter(school=self.s1)))
+
+    def test_command_and_api(self):
+        call_command('generate_timetable', self.s1.id, self.sy.id, '--monday', '2020-09-14', '--seed', '1',
+                     '--iterations', '20000', '--restarts', '2', '--processes', '2', '--without-rooms', stdout=io.StringIO())
+        assignments = list(Assignment.objects.filter(school=self.s1))
+        self.assertEqual(len(assignments), 3 * 14 + 1)
+        self.assertNoConflicts(assignments)
+        self.assertTrue(all(a.room_id is None for a in assignments))
+
+        c = Client()
+        c.login(username='preside1', password='password_demo')
+        url = '/timetable/generate_timetable_api/{}/2020-09-14'.format(self.sy.id)
+        response = c.post(url, {'seed': 2, 'iterations': 20000})
+        self.assertEqual(response.status_code, 400)
+        response = c.post(url, {'seed': 2, 'iterations': 20000, 'replace': 'true'})
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.json(), {'lectures': 3 * 14 + 1, 'hard_violations': 0, 'without_room': 0,
+                                           'soft_cost': response.json()['soft_cost'], 'created': 3 * 14 + 1})
+        self.assertNoConflicts(list(Assignment.objects.filter(school=self.s1)))
+        response = c.post(url, {'iterations': 1000, 'dry_run': 'true'})
+        self.assertEqual((response.status_code, response.json()['created']), (200, 0))
+        self.assertEqual(c.post('/timetable/generate_timetable_api/{}/2020-09-15'.format(self.sy.id)).status_code,
+                         400)
+
+        self.teachers[0].set_password('password_demo')
+        self.teachers[0].save()
+        teacher = Client()
+        teacher.login(username='t0', password='password_demo')
+        self.assertEqual(teacher.post(url).status_code, 403)
+
+    def test_overlapping_hour_slots(self):
+        """
+        The lectures of hour slots of different groups that overlap share the seats of the rooms, and a timetable with
+        conflicts is never written.
+        """
+        subject = Subject(name='Maths', school=self.s2)
+        subject.save()
+        Room(name='lab', capacity=1, school=self.s2).save()
+        for i, minute in enumerate((0, 30)):
+            group = HourSlotsGroup(school=self.s2, school_year=self.sy, name='Group {}'.format(i))
+            group.save()
+            HourSlot(hour_number=1, starts_at=time(hour=8, minute=minute), ends_at=time(hour=9, minute=minute),
+                     day_of_week=0, legal_duration=timedelta(hours=1), hour_slots_group=group).save()
+            course = Course(year=1, section='ABC'[i], hour_slots_group=group)
+            course.save()
+            teacher = Teacher(username='s2t{}'.format(i), school=self.s2, email='s2t{}@g.com'.format(i),
+                              first_name='fn', last_name='ln')
+            teacher.save()
+            HoursPerTeacherInClass(teacher=teacher, course=course, subject=subject, hours=WEEKS_PER_SCHOOL_YEAR,
+                                   hours_bes=0, hours_co_teaching=0).save()
+
+        data = TimetableData(self.s2.id, self.sy.id)
+        solution = TimetableSearch(data, seed=0).run(iterations=100)
+        self.assertEqual(solution.hard_violations, 1)
+        self.assertEqual(assign_rooms(data, solution), [0, None])
+        with self.assertRaises(ValueError):
+            write_assignments(data, solution, self.monday)
+        self.assertFalse(Assignment.objects.filter(school=self.s2).exists())
+
+        # With a room for both, there are no conflicts
+        Room.objects.filter(school=self.s2).update(capacity=2)
+        data = TimetableData(self.s2.id, self.sy.id)
+        solution = TimetableSearch(data, seed=0).run(iterations=100)
+        self.assertEqual(solution.hard_violations, 0)
+        self.assertEqual(assign_rooms(data, solution), [0, 0])
+
+        # The API refuses to write a timetable with conflicts, even when replacing the assignments of the week
+        Room.objects.filter(school=self.s2).update(capacity=1)
+        write_assignments(data, solution, self.monday)
+        c = Client()
+        c.login(username='preside2', password='password_demo')
+        response = c.post('/timetable/generate_timetable_api/{}/2020-09-14'.format(self.sy.id), {'replace': 'true'})
+        self.assertEqual((response.status_code, response.json()['hard_violations']), (409, 1))
+        self.assertEqual(Assignment.objects.filter(school=self.s2).count(), 2)
+        with self.assertRaises(CommandError):
+            call_command('generate_timetable', self.s2.id, self.sy.id, '--monday', '2020-09-14', '--replace',
+                         '--iterations', '100', stdout=io.StringIO())
+        self.assertEqual(Assignment.objects.filter(school=self.s2).count(), 2)
+
+    def test_lectures_without_room(self):
+        """
+        The seats are enough at any time, but the lecture of 8:30 finds no room free for its whole hour slot: the
+        timetable is not written.
+        """
+        subject = Subject(name='Maths', school=self.s2)
+        subject.save()
+        for name in ('lab1', 'lab2'):
+            Room(name=name, capacity=1, school=self.s2).save()
+        groups = [HourSlotsGroup(school=self.s2, school_year=self.sy, name='Group {}'.format(i)) for i in range(2)]
+        for group in groups:
+            group.save()
+        for hour in (8, 9):
+            HourSlot(hour_number=hour - 7, starts_at=time(hour=hour), ends_at=time(hour=hour + 1), day_of_week=0,
+                     legal_duration=timedelta(hours=1), hour_slots_group=groups[0]).save()
+        HourSlot(hour_number=1, starts_at=time(hour=8, minute=30), ends_at=time(hour=9, minute=30), day_of_week=0,
+                 legal_duration=timedelta(hours=1), hour_slots_group=groups[1]).save()
+        for i, group in enumerate((groups[0], groups[0], groups[1])):
+            course = Course(year=1, section='ABC'[i], hour_slots_group=group)
+            course.save()
+            teacher = Teacher(username='s2t{}'.format(i), school=self.s2, email='s2t{}@g.com'.format(i),
+                              first_name='fn', last_name='ln')
+            teacher.save()
+            HoursPerTeacherInClass(teacher=teacher, course=course, subject=subject, hours=WEEKS_PER_SCHOOL_YEAR,
+                                   hours_bes=0, hours_co_teaching=0).save()
+
+        data = TimetableData(self.s2.id, self.sy.id)
+        solution = TimetableSearch(data, seed=0).run(iterations=100)
+        self.assertEqual(solution.hard_violations, 0)
+        rooms = assign_rooms(data, solution)
+        self.assertEqual(get_lectures_without_room(data, rooms), [2])
+        with self.assertRaises(ValueError):
+            write_assignments(data, solution, self.monday)
+        self.assertFalse(Assignment.objects.filter(school=self.s2).exists())
+
+        c = Client()
+        c.login(username='preside2', password='password_demo')
+        response = c.post('/timetable/generate_timetable_api/{}/2020-09-14'.format(self.sy.id))
+        self.assertEqual((response.status_code, response.json()['without_room']), (409, 1))
+        self.assertFalse(Assignment.objects.filter(school=self.s2).exists())
+
+    def test_time_limit(self):
+        """
+        The search stops when its time is over, whatever the moves left.
+        """
+        data = TimetableData(self.s1.id, self.sy.id, with_rooms=False)
+        initial = TimetableSearch(data, seed=0).run(iterations=0)
+        self.assertGreater(initial.cost, 0)
+        solution = TimetableSearch(data, seed=0).run(iterations=10 ** 9, time_limit=0)
+        self.assertEqual(solution.slots, initial.slots)
@@ -0,0 +1,43 @@
+from io import StringIO
+
+from django.core.management import call_command
+from django.db import connection
+
+from timetable.models import *
+from timetable.tests.base_test import BaseTestCase
+
+
+class IndexesTestCase(BaseTestCase):
+    def get_assignment_indexes(self):
+        with connection.cursor() as cursor:
+            return set(connection.introspection.get_constraints(cursor, Assignment._meta.db_table))
+
+    def test_hot_queries_use_the_indexes(self):
+        """
+        The lookups of the assignments in a day of a teacher, a room, or in a time interval use the composite indexes.
+        """
+        indexes = self.get_assignment_indexes()
+        for index in Assignment._meta.indexes:
+            self.assertIn(index.name, indexes)
+
+        plan = Assignment.objects.filter(teacher=1, date='2020-09-14', hour_start='08:00').explain()
+        self.assertIn('assignment_teacher_date_idx', plan)
+        plan = Assignment.objects.filter(date='2020-09-14', hour_start='08:00', hour_end='09:00').explain()
+        self.assertIn('assignment_date_hours_idx', plan)
+        plan = Assignment.objects.filter(substitution=True, date='2020-09-14').explain()
+        self.assertIn('assignment_substitution_idx', plan)
+
+    def test_benchmark_indexes(self):
+        """
+        The benchmark prints the timings of every query, and leaves no data behind and the indexes in place.
+        """
+        out = StringIO()
+        call_command('benchmark_indexes', courses=2, teachers=3, rooms=2, weeks=1, absences=0.5, repeat=1, plans=True,
+                     stdout=out)
+        self.assertIn('Busy teachers (get_available_teachers)', out.getvalue())
+        self.assertIn('assignment_date_hours_idx', out.getvalue())
+        self.assertFalse(School.objects.filter(name='Benchmark school').exists())
+        self.assertFalse(Assignment.objects.exists())
+        indexes = self.get_assignment_indexes()
+        for index in Assignment._meta.indexes:
+            self.assertIn(index.name, indexes)
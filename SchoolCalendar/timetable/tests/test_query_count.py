@@ -0,0 +1,220 @@
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+from django.db import connection
+from django.core.cache import cache
+from django.conf import settings
+from django.contrib.auth.models import User
+from datetime import datetime, timedelta, time
+
+from timetable.models import *
+from timetable import utils
+from timetable.tests.base_test import BaseTestCase
+
+
+class QueryCountTestCase(BaseTestCase):
+    """
+    The list endpoints run the same number of queries, whatever the number of objects in the page.
+    """
+    def setUp(self):
+        super(QueryCountTestCase, self).setUp()
+        self.school_year_2020 = SchoolYear(year_start=2020, date_start=datetime(month=8, year=2020, day=31))
+        self.school_year_2020.save()
+        self.hsg1 = HourSlotsGroup(school=self.s1, school_year=self.school_year_2020, name='Default school 1')
+        self.hsg1.save()
+        self.sub1 = Subject(name='Maths', school=self.s1)
+        self.sub1.save()
+        self.r1 = Room(name='lab1', capacity=2, school=self.s1)
+        self.r1.save()
+
+        # The teacher whose timetable is listed
+        self.t0 = Teacher(username='t0', school=self.s1, email='t0@g.com', first_name='fn0', last_name='ln0')
+        self.t0.set_password('password_demo')
+        self.t0.save()
+
+        self.c = Client()
+        self.c.login(username='preside1', password='password_demo')
+        self.n_rows = 0
+
+    def add_rows(self):
+        """
+        Add a new course, with a new teacher, and a row for every endpoint (an absent lecture of t0 with its
+        substitution, a lecture of t0, the hours of the teachers in the course, yearly loads, stage and absence blocks).
+        """
+        i = self.n_rows = self.n_rows + 1
+        teacher = Teacher(username='t{}'.format(i), school=self.s1, email='t{}@g.com'.format(i),
+                          password='password_demo', first_name='fn{}'.format(i), last_name='ln{}'.format(i))
+        teacher.save()
+        course = Course(year=1, section='S{}'.format(i), hour_slots_group=self.hsg1)
+        course.save()
+        hour_slot = HourSlot(hour_number=i, starts_at=time(hour=7 + i, minute=0), ends_at=time(hour=8 + i, minute=0),
+                             day_of_week=0, legal_duration=timedelta(hours=1), hour_slots_group=self.hsg1)
+        hour_slot.save()
+        monday = datetime(year=2020, month=9, day=14) + timedelta(days=7 * i)
+
+        absent = Assignment(teacher=self.t0, course=course, subject=self.sub1, room=self.r1, date=monday,
+                            hour_start=hour_slot.starts_at, hour_end=hour_slot.ends_at, absent=True)
+        absent.save()
+        Assignment(teacher=teacher, course=course, subject=self.sub1, room=self.r1, date=monday,
+                   hour_start=hour_slot.starts_at, hour_end=hour_slot.ends_at, substitution=True,
+                   substituted_assignment=absent).save()
+        Assignment(teacher=self.t0, course=course, subject=self.sub1, room=self.r1, date=monday + timedelta(days=1),
+                   hour_start=hour_slot.starts_at, hour_end=hour_slot.ends_at).save()
+
+        for t in [self.t0, teacher]:
+            HoursPerTeacherInClass(teacher=t, course=course, subject=self.sub1,
+                                   hours=100, hours_bes=10, hours_co_teaching=10).save()
+            AbsenceBlock(teacher=t, hour_slot=hour_slot).save()
+        TeachersYearlyLoad(teacher=teacher, yearly_load=100, yearly_load_bes=10, yearly_load_co_teaching=10,
+                           school_year=self.school_year_2020).save()
+        CoursesYearlyLoad(course=course, yearly_load=100, yearly_load_bes=10).save()
+        Stage(course=course, date_start=monday, date_end=monday + timedelta(days=4), name='Stage').save()
+
+    def assertQueriesDoNotDependOnRows(self, url, client=None):
+        """
+        Request the url with a page of 1 and then of 5 rows per kind: the number of queries must be the same.
+        """
+        client = client or self.c
+        queries = []
+        for rows in [1, 5]:
+            while self.n_rows < rows:
+                self.add_rows()
+            # Warm up the cache of the role and the school of the user
+            client.get(url)
+            with CaptureQueriesContext(connection) as context:
+                response = client.get(url)
+            self.assertEqual(response.status_code, 200)
+            self.assertGreaterEqual(len(response.json()), rows)
+            queries.append(len(context.captured_queries))
+        self.assertEqual(queries[0], queries[1], url)
+
+    def test_assignments(self):
+        self.assertQueriesDoNotDependOnRows('/timetable/api/assignments/')
+
+    def test_teacher_assignments(self):
+        self.assertQueriesDoNotDependOnRows(
+            '/timetable/api/teacher_assignments/{}/{}/'.format(self.t0.id, self.school_year_2020.id))
+
+    def test_room_timetable(self):
+        self.assertQueriesDoNotDependOnRows('/timetable/api/room_timetable/{}/'.format(self.r1.id))
+
+    def test_teacher_timetable(self):
+        client = Client()
+        client.login(username='t0', password='password_demo')
+        self.assertQueriesDoNotDependOnRows('/timetable/api/teacher_timetable/', client)
+
+    def test_substitutions(self):
+        self.assertQueriesDoNotDependOnRows('/timetable/api/substitutions/')
+
+    def test_hours_per_teacher_in_class(self):
+        self.assertQueriesDoNotDependOnRows('/timetable/api/hour_per_teacher_in_class/')
+
+    def test_absence_blocks(self):
+        self.assertQueriesDoNotDependOnRows('/timetable/api/absence_blocks/')
+
+    def test_teacher_absence_blocks(self):
+        self.assertQueriesDoNotDependOnRows(
+            '/timetable/api/teacher_absence_block/{}/{}/'.format(self.t0.id, self.school_year_2020.id))
+
+    def test_teachers_yearly_loads(self):
+        self.assertQueriesDoNotDependOnRows('/timetable/api/teachers_yearly_loads/')
+
+    def test_courses_yearly_loads(self):
+        self.assertQueriesDoNotDependOnRows('/timetable/api/courses_yearly_loads/')
+
+    def test_stages(self):
+        self.assertQueriesDoNotDependOnRows('/timetable/api/stages/')
+
+    def test_school_and_role_resolved_once_per_request(self):
+        """
+        The role and the school of the logged user are resolved once, whatever the number of helpers using them.
+        """
+        self.add_rows()
+        with CaptureQueriesContext(connection) as context:
+            self.c.post('/timetable/api/assignments/', {
+                'teacher_id': self.t0.id, 'course_id': Course.objects.first().id, 'subject_id': self.sub1.id,
+                'date': '2020-09-14', 'hour_start': '12:00', 'hour_end': '13:00', 'bes': False, 'co_teaching': False,
+                'substitution': False, 'absent': False, 'free_substitution': False})
+        roles_queries = [q for q in context.captured_queries if '"timetable_adminschool"' in q['sql']]
+        self.assertEqual(len(roles_queries), 1)
+
+        cache.clear()
+        user = AdminSchool.objects.get(id=self.a1.id)
+        with self.assertNumQueries(2):
+            self.assertEqual(utils.get_role_from_user(user), utils.ADMIN_SCHOOL)
+            self.assertEqual(utils.get_school_from_user(user), self.s1)
+            self.assertTrue(utils.is_adminschool(user))
+            self.assertFalse(utils.is_teacher(user))
+            self.assertFalse(utils.is_secretary(user))
+            self.assertEqual(utils.get_school_from_user(user), self.s1)
+
+        self.assertEqual(utils.get_role_from_user(Teacher.objects.get(id=self.t0.id)), utils.TEACHER)
+        self.assertIsNone(utils.get_role_from_user(self.django_admin))
+        self.assertIsNone(utils.get_school_from_user(self.django_admin))
+
+    def test_school_and_role_cached_across_requests(self):
+        """
+        After the first request, the role and the school of the logged user are read from the cache,
+        until a teacher, admin school or secretary changes.
+        """
+        def count_roles_queries():
+            with CaptureQueriesContext(connection) as context:
+                self.c.get('/timetable/api/teachers/')
+            return len([q for q in context.captured_queries if '"timetable_adminschool"' in q['sql'] or
+                        '"timetable_school"' in q['sql']])
+
+        self.assertEqual(count_roles_queries(), 2)
+        self.assertEqual(count_roles_queries(), 0)
+
+        # The admin school moves to another school
+        self.a1.school = self.s2
+        self.a1.save()
+        self.assertEqual(count_roles_queries(), 2)
+        self.assertEqual(utils.get_school_from_user(AdminSchool.objects.get(id=self.a1.id)), self.s2)
+
+        # The admin school is deleted
+        self.assertTrue(utils.is_adminschool(User(id=self.a1.id)))
+        AdminSchool.objects.filter(id=self.a1.id).delete()
+        self.assertFalse(utils.is_adminschool(User(id=self.a1.id)))
+
+    def test_roles_invalidated_on_commit(self):
+        """
+        The cache is shared by the processes, and the roles cached by another process before the commit of a change are
+        invalidated too.
+        """
+        self.assertNotEqual(settings.CACHES['default']['BACKEND'], 'django.core.cache.backends.locmem.LocMemCache')
+        self.assertTrue(utils.is_adminschool(User(id=self.a2.id)))
+        with self.captureOnCommitCallbacks(execute=True):
+            AdminSchool.objects.filter(id=self.a2.id).delete()
+            # Another process reads the roles that are still committed
+            cache.set(utils.get_roles_cache_key(self.a2.id), {utils.ADMIN_SCHOOL: self.s2.id})
+        self.assertFalse(utils.is_adminschool(User(id=self.a2.id)))
+
+    def test_week_bundle(self):
+        """
+        The week bundle runs the same number of queries, whatever the number of teachers and lectures of the course.
+        """
+        self.add_rows()
+        course = Course.objects.get(section='S1')
+        hour_slot = HourSlot.objects.get(hour_number=1)
+        url = '/timetable/api/week_bundle/?school_year={}&course={}&monday=2020-09-21'.format(
+            self.school_year_2020.id, course.id)
+        queries = []
+        for teachers in [0, 4]:
+            for i in range(teachers):
+                teacher = Teacher(username='tb{}'.format(i), school=self.s1, email='tb{}@g.com'.format(i),
+                                  first_name='fn', last_name='ln')
+                teacher.save()
+                HoursPerTeacherInClass(teacher=teacher, course=course, subject=self.sub1,
+                                       hours=100, hours_bes=10, hours_co_teaching=10).save()
+                AbsenceBlock(teacher=teacher, hour_slot=hour_slot).save()
+                Assignment(teacher=teacher, course=course, subject=self.sub1, room=self.r1,
+                           date=datetime(year=2020, month=9, day=22 + i), hour_start=hour_slot.starts_at,
+                           hour_end=hour_slot.ends_at).save()
+            self.c.get(url)  # Warm up the cache of the role and the school of the user
+            with CaptureQueriesContext(connection) as context:
+                response = self.c.get(url)
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(len(response.json()['hours_per_teacher_in_class']), 2 + teachers)
+            queries.append(len(context.captured_queries))
+        self.assertEqual(len(response.json()['assignments']), 3 + 4)
+        self.assertEqual(queries[0], queries[1])
@@ -0,0 +1,181 @@
+from datetime import datetime, date, timedelta, time
+
+from django.test import Client
+
+from timetable.models import *
+from timetable.tests.base_test import BaseTestCase
+from timetable.recurring import get_occurrences, extend_recurring_assignments, create_recurring_assignments
+
+
+class RecurringAssignmentTestCase(BaseTestCase):
+    def setUp(self):
+        super(RecurringAssignmentTestCase, self).setUp()
+        self.school_year_2020 = SchoolYear(year_start=2020, date_start=datetime(month=8, year=2020, day=31))
+        self.school_year_2020.save()
+        self.hsg1 = HourSlotsGroup(school=self.s1, school_year=self.school_year_2020, name='Default school 1')
+        self.hsg1.save()
+        self.c1 = Course(year=1, section='A', hour_slots_group=self.hsg1)
+        self.c1.save()
+        self.sub1 = Subject(name='Maths', school=self.s1)
+        self.sub1.save()
+        self.r1 = Room(name='lab1', capacity=1, school=self.s1)
+        self.r1.save()
+        self.t1 = Teacher(username='t1', school=self.s1, email='t1@g.com', password='password_demo',
+                          first_name='fn1', last_name='ln1')
+        self.t1.save()
+        self.t2 = Teacher(username='t2', school=self.s1, email='t2@g.com', password='password_demo',
+                          first_name='fn2', last_name='ln2')
+        self.t2.save()
+
+        # Every Monday, from the 14th of September to the 30th of November.
+        self.monday = RecurringAssignment(teacher=self.t1, course=self.c1, subject=self.sub1, room=self.r1,
+                                          day_of_week=0, hour_start=time(hour=8), hour_end=time(hour=9),
+                                          date_start=date(year=2020, month=9, day=14),
+                                          date_end=date(year=2020, month=11, day=30))
+        self.monday.save()
+        # Every Wednesday, in October.
+        self.wednesday = RecurringAssignment(teacher=self.t2, course=self.c1, subject=self.sub1,
+                                             day_of_week=2, hour_start=time(hour=10), hour_end=time(hour=11),
+                                             date_start=date(year=2020, month=10, day=1),
+                                             date_end=date(year=2020, month=10, day=31))
+        self.wednesday.save()
+
+    def test_school_and_school_year(self):
+        self.assertEqual(self.monday.school, self.s1)
+        self.assertEqual(self.monday.school_year, self.school_year_2020)
+        # The course moves to another school
+        hsg2 = HourSlotsGroup(school=self.s2, school_year=self.school_year_2020, name='Default school 2')
+        hsg2.save()
+        self.c1.hour_slots_group = hsg2
+        self.c1.save()
+        self.assertEqual(RecurringAssignment.objects.filter(school=self.s2).count(), 2)
+
+    def test_occurrences(self):
+        """
+        The recurring assignments are expanded in every week of their validity range, in the order of the lectures.
+        """
+        with self.assertNumQueries(0):
+            occurrences = get_occurrences(RecurringAssignment.objects.all(), date(year=2020, month=9, day=1),
+                                          date(year=2020, month=12, day=31))
+        with self.assertNumQueries(4):
+            occurrences = list(occurrences)
+            [(o.teacher.username, o.course.section, o.room) for o in occurrences]
+        self.assertEqual(len(occurrences), 12 + 4)
+        self.assertEqual([o.date for o in occurrences], sorted(o.date for o in occurrences))
+        self.assertEqual(occurrences[0].date, date(year=2020, month=9, day=14))
+        self.assertEqual(occurrences[-1].date, date(year=2020, month=11, day=30))
+        for o in occurrences:
+            self.assertIsNone(o.pk)
+            self.assertEqual(o.date.weekday(), o.recurring_assignment.day_of_week)
+            self.assertEqual(o.school_id, self.s1.id)
+            self.assertEqual(o.school_year_id, self.school_year_2020.id)
+            self.assertFalse(o.absent or o.substitution)
+
+        # Only the occurrences in the interval
+        occurrences = list(get_occurrences(RecurringAssignment.objects.filter(teacher=self.t2),
+                                           date(year=2020, month=10, day=12), date(year=2020, month=10, day=18)))
+        self.assertEqual([o.date for o in occurrences], [date(year=2020, month=10, day=14)])
+
+    def test_holidays_and_stages(self):
+        Holiday(date_start=date(year=2020, month=10, day=5), date_end=date(year=2020, month=10, day=7), name='Holiday',
+                school=self.s1, school_year=self.school_year_2020).save()
+        Stage(date_start=date(year=2020, month=10, day=19), date_end=date(year=2020, month=10, day=19),
+              course=self.c1).save()
+        dates = [o.date for o in get_occurrences(RecurringAssignment.objects.all(), date(year=2020, month=10, day=1),
+                                                 date(year=2020, month=10, day=31))]
+        self.assertEqual(dates, [date(year=2020, month=10, day=12), date(year=2020, month=10, day=14),
+                                 date(year=2020, month=10, day=21), date(year=2020, month=10, day=26),
+                                 date(year=2020, month=10, day=28)])
+
+    def test_exceptions(self):
+        """
+        Cancellations remove an occurrence, substitutions add the substitute, changes replace the fields given.
+        """
+        RecurringAssignmentException(recurring_assignment=self.monday, date=date(year=2020, month=9, day=21),
+                                     kind=RecurringAssignmentException.CANCELLED).save()
+        RecurringAssignmentException(recurring_assignment=self.monday, date=date(year=2020, month=9, day=28),
+                                     kind=RecurringAssignmentException.SUBSTITUTED, teacher=self.t2).save()
+        RecurringAssignmentException(recurring_assignment=self.monday, date=date(year=2020, month=10, day=5),
+                                     kind=RecurringAssignmentException.CHANGED, hour_start=time(hour=9),
+                                     hour_end=time(hour=10)).save()
+        RecurringAssignmentException(recurring_assignment=self.monday, date=date(year=2020, month=10, day=12),
+                                     kind=RecurringAssignmentException.SUBSTITUTED).save()
+        occurrences = list(get_occurrences(RecurringAssignment.objects.filter(day_of_week=0),
+                                           date(year=2020, month=9, day=14), date(year=2020, month=10, day=12)))
+        self.assertEqual([(o.date.day, o.teacher, o.hour_start, o.absent, o.substitution) for o in occurrences], [
+            (14, self.t1, time(hour=8), False, False),
+            (28, self.t1, time(hour=8), True, False),
+            (28, self.t2, time(hour=8), False, True),
+            (5, self.t1, time(hour=9), False, False),
+            (12, self.t1, time(hour=8), True, False),
+        ])
+        self.assertIs(occurrences[2].substituted_assignment, occurrences[1])
+        self.assertEqual(occurrences[3].room, self.r1)
+
+    def test_extend(self):
+        """
+        Replicating the recurring assignments is an update of their validity range.
+        """
+        with self.assertNumQueries(1):
+            extended = extend_recurring_assignments(RecurringAssignment.objects.all(),
+                                                    date(year=2020, month=12, day=31))
+        self.assertEqual(extended, 2)
+        self.assertEqual(len(list(get_occurrences(RecurringAssignment.objects.filter(teacher=self.t2),
+                                                  date(year=2020, month=12, day=1),
+                                                  date(year=2020, month=12, day=31)))), 5)
+        self.assertEqual(extend_recurring_assignments(RecurringAssignment.objects.all(),
+                                                      date(year=2020, month=10, day=31)), 0)
+
+    def test_create_from_week(self):
+        """
+        A week of assignments becomes a set of recurring assignments, one per lecture.
+        """
+        RecurringAssignment.objects.all().delete()
+        monday = date(year=2020, month=9, day=14)
+        for d, hour in [(0, 8), (0, 9), (1, 8)]:
+            Assignment(teacher=self.t1, course=self.c1, subject=self.sub1, room=self.r1,
+                       date=monday + timedelta(days=d), hour_start=time(hour=hour),
+                       hour_end=time(hour=hour + 1)).save()
+        absent = Assignment(teacher=self.t1, course=self.c1, subject=self.sub1, date=monday + timedelta(days=2),
+                            hour_start=time(hour=8), hour_end=time(hour=9), absent=True)
+        absent.save()
+        Assignment(teacher=self.t2, course=self.c1, subject=self.sub1, date=monday + timedelta(days=2),
+                   hour_start=time(hour=8), hour_end=time(hour=9), substitution=True,
+                   substituted_assignment=absent).save()
+
+        end = date(year=2020, month=10, day=11)
+        created = create_recurring_assignments(Assignment.objects.all(), end)
+        self.assertEqual(len(created), 4)
+        self.assertEqual(RecurringAssignment.objects.filter(teacher=self.t1, school=self.s1,
+                                                            school_year=self.school_year_2020).count(), 4)
+        occurrences = list(get_occurrences(RecurringAssignment.objects.all(), monday, end))
+        self.assertEqual(len(occurrences), 4 * 4)
+        self.assertFalse(any(o.absent for o in occurrences))
+
+        # The lectures already recurring are not created again
+        self.assertEqual(create_recurring_assignments(Assignment.objects.all(), end), [])
+
+    def test_occurrences_api(self):
+        c = Client()
+        c.login(username='preside1', password='password_demo')
+        url = '/timetable/recurring_occurrences_api/2020-10-01/2020-10-31'
+        response = c.get(url)
+        self.assertEqual(response.status_code, 200)
+        occurrences = response.json()['occurrences']
+        self.assertEqual(len(occurrences), 4 + 4)
+        self.assertEqual(occurrences[0], {
+            'recurring_assignment': self.monday.id, 'date': '2020-10-05', 'hour_start': '08:00:00',
+            'hour_end': '09:00:00', 'teacher': {'id': self.t1.id, 'first_name': 'fn1', 'last_name': 'ln1'},
+            'course': {'id': self.c1.id, 'year': 1, 'section': 'A'}, 'subject': {'id': self.sub1.id, 'name': 'Maths'},
+            'room': {'id': self.r1.id, 'name': 'lab1'}, 'bes': False, 'co_teaching': False, 'absent': False,
+            'substitution': False, 'free_substitution': False})
+        self.assertEqual({o['date'] for o in c.get(url, {'teacher': self.t2.id}).json()['occurrences']},
+                         {'2020-10-07', '2020-10-14', '2020-10-21', '2020-10-28'})
+        self.assertEqual(c.get(url, {'course': 'A'}).status_code, 400)
+        self.assertEqual(c.get('/timetable/recurring_occurrences_api/2020-10-31/2020-10-01').status_code, 400)
+
+        # The recurring assignments of another school are not listed
+        c.login(username='preside2', password='password_demo')
+        self.assertEqual(c.get(url).json()['occurrences'], [])
+        c.logout()
+        self.assertNotEqual(c.get(url).status_code, 200)
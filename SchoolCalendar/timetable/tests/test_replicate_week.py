@@ -1,12 +1,15 @@
 from django.test import TestCase
 from django.forms.models import model_to_dict
 from django.test import Client
+from django.test.utils import CaptureQueriesContext
+from django.db import connection
 from datetime import datetime, timedelta, time
 
 from timetable.models import *
 from timetable.forms import *
 from timetable.tests.base_test import BaseTestCase
 from timetable.views.other_views import CheckWeekReplicationView
+from timetable.replication import ReplicationConflictEngine, ReplicationWriter
 
 
 class ReplicateWeekTestCase(BaseTestCase):
@@ -465,6 +468,94 @@ class ReplicateWeekTestCase(BaseTestCase):
             el.delete()
         Assignment.objects.filter(id__in=assignments_to_check).delete()
 
+    def test_conflict_engine_queries_do_not_depend_on_assignments(self):
+        """
+        The conflict engine loads the replicated assignments and the candidate window once,
+        whatever the number of assignments and the length of the interval.
+        """
+        assignments_to_check = []
+        for day in range(5):
+            for hour in range(8, 14):
+                ass = Assignment(teacher=self.t2,
+                                 course=self.c2,
+                                 subject=self.sub2,
+                                 room=self.r1,
+                                 date=datetime(year=2020, month=5, day=4) + timedelta(days=day),
+                                 hour_start=time(hour=hour, minute=0),
+                                 hour_end=time(hour=hour + 1, minute=0))
+                ass.save()
+                assignments_to_check.append(ass.id)
+                # A lecture of the same teacher in another course, two weeks later.
+                Assignment(teacher=self.t2,
+                           course=self.c3,
+                           subject=self.sub2,
+                           date=datetime(year=2020, month=5, day=18) + timedelta(days=day),
+                           hour_start=time(hour=hour, minute=0),
+                           hour_end=time(hour=hour + 1, minute=0)).save()
+
+        with self.assertNumQueries(2):
+            engine = ReplicationConflictEngine(Assignment.objects.filter(id__in=assignments_to_check),
+                                               datetime(year=2020, month=5, day=4).date(),
+                                               datetime(year=2020, month=12, day=31).date())
+            course_conflicts, teacher_conflicts, room_conflicts = engine.get_conflicts(check_course_conflicts=True)
+        self.assertEqual(len(teacher_conflicts), 30)
+        self.assertEqual(len(course_conflicts), 0)
+        self.assertEqual(len(room_conflicts), 0)
+
+    def test_replication_writer_queries_do_not_depend_on_interval(self):
+        """
+        Replicating a week for two weeks or for a whole term takes the same number of queries,
+        and holidays and stages are skipped.
+        """
+        christmas = Holiday(date_start=datetime(year=2020, month=12, day=21),
+                            date_end=datetime(year=2021, month=1, day=6),
+                            name='Christmas',
+                            school=self.s1,
+                            school_year=self.school_year_2020)
+        christmas.save()
+        stage = Stage(date_start=datetime(year=2020, month=10, day=5),
+                      date_end=datetime(year=2020, month=10, day=9),
+                      course=self.c1,
+                      name='Internship')
+        stage.save()
+        ass_substituted = Assignment(teacher=self.t4,
+                                     course=self.c1,
+                                     subject=self.sub1,
+                                     date=datetime(year=2020, month=5, day=5),  # Tuesday 5/5/2020
+                                     hour_start=time(hour=9, minute=0),
+                                     hour_end=time(hour=10, minute=0),
+                                     absent=True)
+        ass_substituted.save()
+        Assignment(teacher=self.t3,
+                   course=self.c1,
+                   subject=self.sub1,
+                   date=datetime(year=2020, month=5, day=5),
+                   hour_start=time(hour=9, minute=0),
+                   hour_end=time(hour=10, minute=0),
+                   substitution=True,
+                   substituted_assignment=ass_substituted).save()
+
+        queries = []
+        for to_date in [datetime(year=2020, month=9, day=27), datetime(year=2021, month=1, day=31)]:
+            with CaptureQueriesContext(connection) as context:
+                ReplicationWriter(Assignment.objects.filter(id__in=[self.ass1.id, ass_substituted.id]),
+                                  datetime(year=2020, month=9, day=14).date(),
+                                  to_date.date(),
+                                  without_substitutions=False).replicate()
+            queries.append(len(context.captured_queries))
+        self.assertEqual(queries[0], queries[1])
+
+        # From the 14th of September to the 31st of January there are 20 weeks: 3 of them are holidays for
+        # every course, and in one of them there is a stage for course 1.
+        self.assertEqual(Assignment.objects.filter(teacher=self.t1, date__gte=datetime(year=2020, month=9, day=14))
+                         .count(), 16)
+        substitutions = Assignment.objects.filter(teacher=self.t3, substitution=True,
+                                                  date__gte=datetime(year=2020, month=9, day=14))
+        self.assertEqual(substitutions.count(), 16)
+        for substitution in substitutions:
+            self.assertEqual(substitution.substituted_assignment.date, substitution.date)
+            self.assertEqual(substitution.substituted_assignment.teacher, self.t4)
+
     def test_course_already_present_in_replicated_week(self):
         """
         Assume we want to replicate one week. The week after should be empty so that no conflicts are shown.
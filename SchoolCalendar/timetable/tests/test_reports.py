@@ -0,0 +1,111 @@
+import io
+from datetime import date, time, timedelta
+
+import pandas as pd
+from django.test import Client
+
+from timetable.models import *
+from timetable.tests.base_test import BaseTestCase
+
+
+class ExcelReportsTestCase(BaseTestCase):
+    def setUp(self):
+        super(ExcelReportsTestCase, self).setUp()
+        self.hsg1 = HourSlotsGroup(school=self.s1, school_year=self.sy, name='Default school 1')
+        self.hsg1.save()
+        for day_of_week in range(5):
+            for hour in range(2):
+                HourSlot(hour_number=hour + 1, starts_at=time(hour=8 + hour), ends_at=time(hour=9 + hour),
+                         day_of_week=day_of_week, legal_duration=timedelta(hours=1), hour_slots_group=self.hsg1).save()
+        self.c1 = Course(year=1, section='A', hour_slots_group=self.hsg1)
+        self.c1.save()
+        self.c2 = Course(year=2, section='B', hour_slots_group=self.hsg1)
+        self.c2.save()
+        self.sub1 = Subject(name='Maths', school=self.s1)
+        self.sub1.save()
+        self.sub2 = Subject(name='History', school=self.s1)
+        self.sub2.save()
+        self.t1 = Teacher(username='t1', school=self.s1, email='t1@g.com', first_name='Ada', last_name='Zeta')
+        self.t1.save()
+        self.t2 = Teacher(username='t2', school=self.s1, email='t2@g.com', first_name='Bea', last_name='Alfa')
+        self.t2.save()
+        self.r1 = Room(name='lab1', capacity=2, school=self.s1)
+        self.r1.save()
+
+        self.monday = date(year=2020, month=9, day=14)
+        lectures = [
+            (self.t1, self.c1, self.sub1, self.r1, 0, 8, 9, {}),
+            (self.t2, self.c1, self.sub2, None, 0, 8, 9, {'co_teaching': True}),
+            (self.t2, self.c2, self.sub2, self.r1, 1, 9, 10, {}),
+            (self.t1, self.c2, self.sub1, None, 1, 9, 10, {'bes': True}),
+            # A special hour slot
+            (self.t1, self.c1, self.sub1, None, 2, 11, 13, {}),
+            # Another week
+            (self.t1, self.c1, self.sub1, None, 7, 8, 9, {}),
+        ]
+        for teacher, course, subject, room, day, hour_start, hour_end, kwargs in lectures:
+            Assignment(teacher=teacher, course=course, subject=subject, room=room,
+                       date=self.monday + timedelta(days=day), hour_start=time(hour=hour_start),
+                       hour_end=time(hour=hour_end), **kwargs).save()
+        self.c = Client()
+        self.c.login(username='preside1', password='password_demo')
+
+    def get_report(self, url, **kwargs):
+        response = self.c.get('/timetable/' + url)
+        self.assertEqual(response.status_code, 200)
+        return pd.read_excel(io.BytesIO(response.content), keep_default_na=False, **kwargs)
+
+    def test_week_reports(self):
+        df = self.get_report('timetable_teacher_csv_report_view/{}/{}/2020-09-14'.format(self.sy.id, self.t1.id),
+                             index_col=[0, 1])
+        self.assertEqual(list(df.index), [('08:00', '09:00'), ('09:00', '10:00'), ('11:00', '13:00')])
+        self.assertEqual(list(df.columns), ['Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday'])
+        self.assertEqual(df.iloc[0].tolist(), ['Maths - 1 A', '', '', '', '', ''])
+        self.assertEqual(df.loc[('11:00', '13:00'), 'Wednesday'], 'Maths - 1 A')
+
+        df = self.get_report('timetable_course_csv_report_view/{}/{}/2020-09-14'.format(self.sy.id, self.c1.id),
+                             index_col=[0, 1])
+        self.assertEqual(df.iloc[0]['Monday'], 'Co-teaching - Bea Alfa\nMaths - Ada Zeta (lab1)')
+        df = self.get_report('timetable_course_csv_report_view/{}/{}/2020-09-14'.format(self.sy.id, self.c2.id),
+                             index_col=[0, 1])
+        self.assertEqual(len(df), 2)
+        self.assertEqual(df.iloc[1]['Tuesday'], 'History - Bea Alfa (lab1)\nB.E.S. - Ada Zeta')
+
+        # Any day of the week
+        df = self.get_report('timetable_room_csv_report_view/{}/{}/2020-09-16'.format(self.sy.id, self.r1.id),
+                             index_col=[0, 1])
+        self.assertEqual(df['Monday'].tolist(), ['Maths - Ada Zeta - 1 A', ''])
+        self.assertEqual(df['Tuesday'].tolist(), ['', 'History - Bea Alfa - 2 B'])
+
+        # A week without lectures
+        df = self.get_report('timetable_teacher_csv_report_view/{}/{}/2020-10-05'.format(self.sy.id, self.t1.id),
+                             index_col=[0, 1])
+        self.assertEqual(df.shape, (2, 6))
+
+    def test_general_report(self):
+        df = self.get_report('timetable_general_csv_report_view/{}2020-09-14'.format(self.sy.id),
+                             header=[0, 1], index_col=0)
+        # The teachers are sorted by last name, every day has a column for every hour
+        self.assertEqual(list(df.index), ['Bea Alfa', 'Ada Zeta'])
+        self.assertEqual(df.shape, (2, 6 * 3))
+        self.assertEqual(df[('Monday', '1')].tolist(), ['1 A', '1 A'])
+        self.assertEqual(df[('Tuesday', '2')].tolist(), ['2 B', '2 B'])
+        self.assertEqual(df[('Wednesday', '3')].tolist(), ['', '1 A'])
+
+        # A week without lectures
+        response = self.c.get('/timetable/timetable_general_csv_report_view/{}2020-10-05'.format(self.sy.id))
+        self.assertEqual(response.status_code, 200)
+
+    def test_general_weeks_report(self):
+        response = self.c.get('/timetable/timetable_general_weeks_csv_report_view/{}/2020-09-16/3'.format(self.sy.id))
+        self.assertEqual(response.status_code, 200)
+        sheets = pd.read_excel(io.BytesIO(response.content), sheet_name=None, header=[0, 1], index_col=0,
+                               keep_default_na=False)
+        self.assertEqual(list(sheets), ['2020-09-14', '2020-09-21', '2020-09-28'])
+        self.assertEqual(list(sheets['2020-09-14'].index), ['Bea Alfa', 'Ada Zeta'])
+        self.assertEqual(sheets['2020-09-14'][('Wednesday', '3')].tolist(), ['', '1 A'])
+        # Every week has the same columns, and only the teachers with lectures in the week
+        self.assertEqual(list(sheets['2020-09-21'].index), ['Ada Zeta'])
+        self.assertEqual(sheets['2020-09-21'].shape, (1, 6 * 3))
+        self.assertEqual(sheets['2020-09-21'][('Monday', '1')].tolist(), ['1 A'])
+        self.assertEqual(len(sheets['2020-09-28']), 0)
@@ -1,11 +1,20 @@
 from django.test import TestCase
 from django.forms.models import model_to_dict
-from django.test import Client
+from django.test import Client, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.db import connection
+from django.core.cache import caches
+from rest_framework.pagination import PageNumberPagination
 from datetime import datetime, timedelta, time
+import tempfile
+from unittest import mock
 
 from timetable.models import *
 from timetable.forms import *
 from timetable.tests.base_test import BaseTestCase
+from timetable.checks import check_shared_cache
+from timetable.views.rest_framework_views import AssignmentViewSet
+from timetable import utils
 
 
 class RestFrameworkApiTestCase(BaseTestCase):
@@ -301,3 +310,248 @@ class RestFrameworkApiTestCase(BaseTestCase):
         json_res = response.json()
         self.assertTrue(type(json_res) == list)
         self.assertTrue(len(json_res) == 1)
+
+    def test_week_bundle_api(self):
+        """
+        The week bundle returns the same data of the single apis used by the timetable page.
+        """
+        week = 'from_date=2020-05-04&to_date=2020-05-10'
+        response = self.c.get('/timetable/api/week_bundle/?school_year={}&course={}&monday=2020-05-04'.format(
+            self.school_year_2020.id, self.c1.id))
+        self.assertEqual(response.status_code, 200)
+        bundle = response.json()
+        self.assertEqual(bundle['hour_slots'], self.c.get('/timetable/api/hour_slots/?school_year={}&course={}'.format(
+            self.school_year_2020.id, self.c1.id)).json())
+        self.assertEqual(bundle['hours_per_teacher_in_class'], self.c.get(
+            '/timetable/api/hour_per_teacher_in_class/?school_year={}&course={}'.format(
+                self.school_year_2020.id, self.c1.id)).json())
+        self.assertEqual(bundle['assignments'], self.c.get('/timetable/api/assignments/?school_year={}&course={}&{}'.format(
+            self.school_year_2020.id, self.c1.id, week)).json())
+        self.assertEqual(len(bundle['assignments']), 1)
+        self.assertEqual(bundle['teacher_assignments'], {str(self.t1.id): self.c.get(
+            '/timetable/api/teacher_assignments/{}/{}/?{}'.format(self.t1.id, self.school_year_2020.id, week)).json()})
+        self.assertEqual(bundle['absence_blocks'], {str(self.t1.id): self.c.get(
+            '/timetable/api/teacher_absence_block/{}/{}/'.format(self.t1.id, self.school_year_2020.id)).json()})
+        self.assertEqual(bundle['holidays'], [])
+        self.assertEqual(bundle['stages'], [])
+
+        # Holidays and stages are limited to the week
+        bundle = self.c.get('/timetable/api/week_bundle/?school_year={}&course={}&monday=2020-12-21'.format(
+            self.school_year_2020.id, self.c1.id)).json()
+        self.assertEqual(bundle['assignments'], [])
+        self.assertEqual([(h['name'], h['start'], h['end']) for h in bundle['holidays']],
+                         [('Christmas', '2020-12-25', '2020-12-25')])
+        bundle = self.c.get('/timetable/api/week_bundle/?school_year={}&course={}&monday=2020-11-23'.format(
+            self.school_year_2020.id, self.c1.id)).json()
+        self.assertEqual([s['name'] for s in bundle['stages']], ['Internship'])
+
+        # Wrong parameters, or a course of another school
+        response = self.c.get('/timetable/api/week_bundle/?school_year={}&course={}&monday=2020-13-21'.format(
+            self.school_year_2020.id, self.c1.id))
+        self.assertEqual(response.status_code, 400)
+        c = Client()
+        c.login(username='preside2', password='password_demo')
+        response = c.get('/timetable/api/week_bundle/?school_year={}&course={}&monday=2020-05-04'.format(
+            self.school_year_2020.id, self.c1.id))
+        self.assertEqual(response.status_code, 404)
+
+    def test_conditional_get_api(self):
+        """
+        The timetables of a week are returned with an ETag: when the week didn't change, a 304 is returned without
+        reading the assignments.
+        """
+        url = '/timetable/api/teacher_timetable/?from_date=2020-05-04&to_date=2020-05-10'
+        response = self.c_t.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.json()), 1)
+        etag = response['ETag']
+        self.assertIn('Last-Modified', response)
+        self.assertIn('no-cache', response['Cache-Control'])
+
+        with CaptureQueriesContext(connection) as context:
+            response = self.c_t.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertFalse([q for q in context.captured_queries if 'timetable_assignment' in q['sql']])
+        response = self.c_t.get(url, HTTP_IF_MODIFIED_SINCE=response['Last-Modified'])
+        self.assertEqual(response.status_code, 304)
+
+        # Other parameters have another ETag
+        self.assertNotEqual(self.c_t.get(url + '&course={}'.format(self.c1.id))['ETag'], etag)
+
+        # Changes in other weeks keep the ETag
+        Holiday(date_start=datetime(year=2020, month=5, day=11), date_end=datetime(year=2020, month=5, day=12),
+                name='Other week', school=self.s1, school_year=self.school_year_2020).save()
+        Assignment(teacher=self.t1, course=self.c1, subject=self.sub1, date=datetime(year=2020, month=5, day=11),
+                   hour_start=time(hour=9), hour_end=time(hour=10)).save()
+        self.assertEqual(self.c_t.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+        # A lecture moved into the week, a stage or an hour slot change it, as a lecture moved away
+        def assert_changed(etag):
+            response = self.c_t.get(url, HTTP_IF_NONE_MATCH=etag)
+            self.assertEqual(response.status_code, 200)
+            self.assertNotEqual(response['ETag'], etag)
+            return response
+
+        moved = Assignment.objects.get(date=datetime(year=2020, month=5, day=11))
+        moved.date = datetime(year=2020, month=5, day=5)
+        moved.save()
+        response = assert_changed(etag)
+        self.assertEqual(len(response.json()), 2)
+        Stage(date_start=datetime(year=2020, month=5, day=1), date_end=datetime(year=2020, month=5, day=6),
+              course=self.c1).save()
+        response = assert_changed(response['ETag'])
+        self.hs1.save()
+        response = assert_changed(response['ETag'])
+        moved.date = datetime(year=2020, month=5, day=12)
+        moved.save()
+        response = assert_changed(response['ETag'])
+        self.assertEqual(len(response.json()), 1)
+
+        # Deleting a lecture from the api changes the ETag of the room timetable and of the assignments
+        for url in ['/timetable/api/room_timetable/{}/?from_date=2020-05-04&to_date=2020-05-10'.format(self.r1.id),
+                    '/timetable/api/assignments/?school_year={}&course={}&from_date=2020-05-04&to_date=2020-05-10'
+                    .format(self.school_year_2020.id, self.c1.id)]:
+            etag = self.c.get(url)['ETag']
+            self.assertEqual(self.c.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+            new = Assignment(teacher=self.t1, course=self.c1, subject=self.sub1, room=self.r1,
+                             date=datetime(year=2020, month=5, day=6), hour_start=time(hour=9), hour_end=time(hour=10))
+            new.save()
+            self.assertEqual(self.c.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+            etag = self.c.get(url)['ETag']
+            self.c.delete('/timetable/api/assignments/{}/'.format(new.id))
+            response = self.c.get(url, HTTP_IF_NONE_MATCH=etag)
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(len(response.json()), 1)
+
+        # Without an interval there is no ETag
+        self.assertNotIn('ETag', self.c_t.get('/timetable/api/teacher_timetable/'))
+
+    def test_week_versions_shared_by_processes(self):
+        """
+        The versions of the weeks are kept in a cache shared by the processes: a change made by a worker changes the
+        ETags of the others too. A cache local to the process is reported by the checks.
+        """
+        url = '/timetable/api/room_timetable/{}/?from_date=2020-05-04&to_date=2020-05-10'.format(self.r1.id)
+        key = utils.get_week_version_cache_key(self.s1.id, datetime(year=2020, month=5, day=4).date(),
+                                               utils.ROOM, self.r1.id)
+        etag = self.c.get(url)['ETag']
+        # The cache as seen by another worker
+        other_worker = caches.create_connection('default')
+        version = other_worker.get(key)
+        self.assertIsNotNone(version)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.ass1.room = None
+            self.ass1.save()
+        self.assertNotEqual(other_worker.get(key), version)
+        self.assertNotEqual(self.c.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+        self.assertEqual(check_shared_cache(None), [])
+        with override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}):
+            self.assertEqual([warning.id for warning in check_shared_cache(None)], ['timetable.W001'])
+
+    def test_week_payload_cache_api(self):
+        """
+        The serialized assignments of a week are shared among the users of the school, and only the lists that can
+        contain a lecture are computed again when it changes.
+        """
+        def get(client, url):
+            with CaptureQueriesContext(connection) as context:
+                response = client.get(url)
+            self.assertEqual(response.status_code, 200)
+            return response.json(), any('timetable_assignment' in q['sql'] for q in context.captured_queries)
+
+        t2 = Teacher(username='t2', school=self.s1, email='t2@g.com', first_name='fn2', last_name='ln2')
+        t2.save()
+        HoursPerTeacherInClass(teacher=t2, course=self.c1, subject=self.sub1, hours=10, hours_bes=0,
+                               hours_co_teaching=0).save()
+        c2 = Course(year=2, section='A', hour_slots_group=self.hsg1)
+        c2.save()
+        week = 'from_date=2020-05-04&to_date=2020-05-10'
+        room_url = '/timetable/api/room_timetable/{}/?{}'.format(self.r1.id, week)
+        course_url = '/timetable/api/assignments/?school_year={}&course={{}}&{}'.format(self.school_year_2020.id, week)
+        teacher_url = '/timetable/api/teacher_timetable/?' + week
+
+        payload, read = get(self.c, room_url)
+        self.assertTrue(read)
+        # The same week of the room, for another user
+        self.assertEqual(get(self.c_t, room_url), (payload, False))
+        get(self.c, course_url.format(self.c1.id))
+        get(self.c, course_url.format(c2.id))
+        get(self.c_t, teacher_url)
+
+        # A lecture of another course, teacher and room
+        self.c.post('/timetable/api/assignments/', {
+            'teacher_id': t2.id, 'course_id': c2.id, 'subject_id': self.sub1.id, 'date': '2020-05-05',
+            'hour_start': '09:00', 'hour_end': '10:00', 'bes': False, 'co_teaching': False,
+            'substitution': False, 'absent': False, 'free_substitution': False})
+        self.assertEqual(get(self.c, room_url), (payload, False))
+        self.assertFalse(get(self.c, course_url.format(self.c1.id))[1])
+        payload, read = get(self.c, course_url.format(c2.id))
+        self.assertTrue(read)
+        self.assertEqual(len(payload), 1)
+
+        # A substitution changes the lists of the room, of the course and of the substituted teacher
+        response = self.c.post('/timetable/substitute_teacher_api/{}/{}'.format(self.ass1.id, t2.id))
+        self.assertEqual(response.status_code, 200)
+        payload, read = get(self.c_t, teacher_url)
+        self.assertTrue(read)
+        self.assertEqual(payload[0]['eventual_substitute']['username'], 't2')
+        self.assertTrue(get(self.c, room_url)[1])
+        self.assertTrue(get(self.c, course_url.format(self.c1.id))[1])
+        self.assertFalse(get(self.c, course_url.format(c2.id))[1])
+
+        # The replication changes the weeks where the lectures are copied
+        next_week_url = '/timetable/api/assignments/?school_year={}&course={}&from_date=2020-05-11&to_date=2020-05-17' \
+            .format(self.school_year_2020.id, self.c1.id)
+        self.assertEqual(get(self.c, next_week_url)[0], [])
+        self.assertFalse(get(self.c, next_week_url)[1])
+        response = self.c.post('/timetable/replicate_week/add/{}/{}/2020-05-11/2020-05-17'.format(
+            self.school_year_2020.id, self.c1.id), {'assignments[]': [self.ass1.id]})
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(len(get(self.c, next_week_url)[0]), 2)
+
+        # A holiday changes all the lists of its weeks
+        form = HolidayForm(user=self.a1, data={'date_start': datetime(year=2020, month=5, day=9),
+                                               'date_end': datetime(year=2020, month=5, day=9),
+                                               'school': self.s1, 'school_year': self.school_year_2020,
+                                               'name': 'Saturday'})
+        self.assertTrue(form.is_valid())
+        get(self.c, course_url.format(c2.id))
+        form.save()
+        self.assertTrue(get(self.c, course_url.format(c2.id))[1])
+        self.assertFalse(get(self.c, course_url.format(c2.id))[1])
+
+    def test_week_payload_cache_key_api(self):
+        """
+        The users sharing the serialized assignments of a week share their ETag too, and a page of a paginated list is
+        not kept in the cache.
+        """
+        url = '/timetable/api/room_timetable/{}/?from_date=2020-05-04&to_date=2020-05-10'.format(self.r1.id)
+        etag = self.c.get(url)['ETag']
+        self.assertEqual(self.c_t.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+        class OnePage(PageNumberPagination):
+            page_size = 1
+
+        url = '/timetable/api/assignments/?school_year={}&from_date=2020-05-04&to_date=2020-05-10'.format(
+            self.school_year_2020.id)
+        with mock.patch.object(AssignmentViewSet, 'pagination_class', OnePage):
+            page = self.c.get(url).json()
+            self.assertEqual(len(page['results']), 1)
+            self.assertEqual(self.c.get(url).json(), page)
+        self.assertEqual(len(self.c.get(url).json()), page['count'])
+
+    def test_week_payload_file_based_cache_api(self):
+        """
+        The serialized weeks can be kept in a file based cache too.
+        """
+        url = '/timetable/api/room_timetable/{}/?from_date=2020-05-04&to_date=2020-05-10'.format(self.r1.id)
+        with tempfile.TemporaryDirectory() as directory, override_settings(CACHES={'default': {
+                'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache', 'LOCATION': directory}}):
+            payload = self.c.get(url).json()
+            with CaptureQueriesContext(connection) as context:
+                self.assertEqual(self.c_t.get(url).json(), payload)
+            self.assertFalse([q for q in context.captured_queries if 'timetable_assignment' in q['sql']])
+            self.ass1.room = None
+            self.ass1.save()
+            self.assertEqual(self.c_t.get(url).json(), [])
@@ -0,0 +1,103 @@
+from datetime import date, time, timedelta
+
+from django.test import Client
+
+from timetable.models import *
+from timetable.tests.base_test import BaseTestCase
+from timetable.room_occupancy import DayOccupancy, RoomOccupancy, get_room_occupancy
+
+
+class RoomOccupancyTestCase(BaseTestCase):
+    def setUp(self):
+        super(RoomOccupancyTestCase, self).setUp()
+        self.hsg1 = HourSlotsGroup(school=self.s1, school_year=self.sy, name='Default school 1')
+        self.hsg1.save()
+        for day_of_week in range(2):
+            for hour in range(3):
+                HourSlot(hour_number=hour + 1, starts_at=time(hour=8 + hour), ends_at=time(hour=9 + hour),
+                         day_of_week=day_of_week, legal_duration=timedelta(hours=1), hour_slots_group=self.hsg1).save()
+        self.c1 = Course(year=1, section='A', hour_slots_group=self.hsg1)
+        self.c1.save()
+        self.c2 = Course(year=1, section='B', hour_slots_group=self.hsg1)
+        self.c2.save()
+        self.sub1 = Subject(name='Maths', school=self.s1)
+        self.sub1.save()
+        self.t1 = Teacher(username='t1', school=self.s1, email='t1@g.com', first_name='fn1', last_name='ln1')
+        self.t1.save()
+        self.r1 = Room(name='lab1', capacity=1, school=self.s1)
+        self.r1.save()
+        self.r2 = Room(name='lab2', capacity=2, school=self.s1)
+        self.r2.save()
+
+        self.monday = date(year=2020, month=9, day=14)
+        # lab1 is used by c1 from 8 to 10, lab2 by c1 and c2 from 9 to 10
+        self.a1 = Assignment(teacher=self.t1, course=self.c1, subject=self.sub1, room=self.r1, date=self.monday,
+                             hour_start=time(hour=8), hour_end=time(hour=10))
+        self.a1.save()
+        Assignment(teacher=self.t1, course=self.c1, subject=self.sub1, room=self.r2, date=self.monday,
+                   hour_start=time(hour=9), hour_end=time(hour=10)).save()
+        Assignment(teacher=self.t1, course=self.c2, subject=self.sub1, room=self.r2, date=self.monday,
+                   hour_start=time(hour=9), hour_end=time(hour=10)).save()
+
+    def test_day_occupancy(self):
+        day = DayOccupancy([(time(hour=8), time(hour=12), 1, 1), (time(hour=9), time(hour=10), 2, 2),
+                            (time(hour=10), time(hour=11), 3, 3), (time(hour=13), time(hour=14), 4, 4)])
+        self.assertEqual({lecture[2] for lecture in day.overlapping(time(hour=10), time(hour=11))}, {1, 3})
+        self.assertEqual({lecture[2] for lecture in day.overlapping(time(hour=11), time(hour=13))}, {1})
+        # A lecture contained in the interval overlaps it
+        self.assertEqual({lecture[2] for lecture in day.overlapping(time(hour=8, minute=30), time(hour=14))},
+                         {1, 2, 3, 4})
+        self.assertEqual(list(day.overlapping(time(hour=12), time(hour=13))), [])
+
+    def test_full_rooms(self):
+        with self.assertNumQueries(2):
+            occupancy = RoomOccupancy.load(self.s1.id, self.sy.id, self.monday)
+        self.assertEqual(occupancy.get_full_rooms(self.monday, time(hour=8), time(hour=9)), {self.r1.id})
+        self.assertEqual(occupancy.get_full_rooms(self.monday, time(hour=9), time(hour=10)), {self.r1.id, self.r2.id})
+        # The lectures of the course itself don't take a place
+        self.assertEqual(occupancy.get_full_rooms(self.monday, time(hour=9), time(hour=10), self.c1.id), set())
+        self.assertEqual(occupancy.get_free_rooms(self.monday, time(hour=10), time(hour=11)),
+                         [self.r1.id, self.r2.id])
+        self.assertEqual(occupancy.get_free_rooms(self.monday + timedelta(days=1), time(hour=9), time(hour=10)),
+                         [self.r1.id, self.r2.id])
+
+    def test_cache(self):
+        occupancy = get_room_occupancy(self.s1.id, self.sy.id, self.monday)
+        with self.assertNumQueries(0):
+            self.assertEqual(get_room_occupancy(self.s1.id, self.sy.id, self.monday).capacity, occupancy.capacity)
+        self.a1.room = self.r2
+        self.a1.save()
+        occupancy = get_room_occupancy(self.s1.id, self.sy.id, self.monday)
+        self.assertEqual(occupancy.get_full_rooms(self.monday, time(hour=8), time(hour=9)), set())
+        self.r2.capacity = 3
+        self.r2.save()
+        occupancy = get_room_occupancy(self.s1.id, self.sy.id, self.monday)
+        self.assertEqual(occupancy.get_full_rooms(self.monday, time(hour=9), time(hour=10)), set())
+
+    def test_api(self):
+        c = Client()
+        c.login(username='preside1', password='password_demo')
+        response = c.get('/timetable/api/rooms/', {'school_year': self.sy.id, 'date': '2020-09-14',
+                                                   'hour_start': '08:30', 'hour_end': '11:00'})
+        self.assertEqual(response.json(), [])
+        response = c.get('/timetable/api/rooms/', {'school_year': self.sy.id, 'date': '2020-09-14',
+                                                   'hour_start': '09:00', 'hour_end': '10:00', 'course': self.c2.id})
+        self.assertEqual([room['id'] for room in response.json()], [self.r2.id])
+        self.assertEqual(len(c.get('/timetable/api/rooms/').json()), 2)
+
+        response = c.get('/timetable/api/week_free_rooms/', {'school_year': self.sy.id, 'monday': '2020-09-14'})
+        self.assertEqual(response.status_code, 200)
+        free_rooms = response.json()
+        self.assertEqual(len(free_rooms), 6)
+        self.assertEqual(free_rooms[0], {'date': '2020-09-14', 'hour_start': '08:00:00', 'hour_end': '09:00:00',
+                                         'rooms': [self.r2.id]})
+        self.assertEqual([el['rooms'] for el in free_rooms[1:4]],
+                         [[], [self.r1.id, self.r2.id], [self.r1.id, self.r2.id]])
+        response = c.get('/timetable/api/week_free_rooms/', {'school_year': self.sy.id, 'monday': '2020-09-14',
+                                                             'course': self.c1.id})
+        self.assertEqual(response.json()[1]['rooms'], [self.r1.id, self.r2.id])
+        self.assertEqual(c.get('/timetable/api/week_free_rooms/', {'school_year': self.sy.id}).status_code, 400)
+        self.assertEqual(c.get('/timetable/api/week_free_rooms/', {'school_year': self.sy.id,
+                                                                   'monday': '2020-09-15'}).status_code, 400)
+        self.assertEqual(c.get('/timetable/api/week_free_rooms/', {'school_year': self.sy.id, 'monday': '2020-09-14',
+                                                                   'course': 0}).status_code, 404)
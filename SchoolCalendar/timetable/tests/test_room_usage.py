@@ -0,0 +1,90 @@
+import io
+from datetime import date, time, timedelta
+
+import pandas as pd
+from django.test import Client
+
+from timetable.models import *
+from timetable.tests.base_test import BaseTestCase
+from timetable.room_usage import RoomUsage
+
+
+class RoomUsageTestCase(BaseTestCase):
+    def setUp(self):
+        super(RoomUsageTestCase, self).setUp()
+        self.hsg1 = HourSlotsGroup(school=self.s1, school_year=self.sy, name='Default school 1')
+        self.hsg1.save()
+        for day_of_week in range(2):
+            for hour in range(2):
+                HourSlot(hour_number=hour + 1, starts_at=time(hour=8 + hour), ends_at=time(hour=9 + hour),
+                         day_of_week=day_of_week, legal_duration=timedelta(hours=1), hour_slots_group=self.hsg1).save()
+        self.c1 = Course(year=1, section='A', hour_slots_group=self.hsg1)
+        self.c1.save()
+        self.c2 = Course(year=1, section='B', hour_slots_group=self.hsg1)
+        self.c2.save()
+        self.sub1 = Subject(name='Maths', school=self.s1)
+        self.sub1.save()
+        self.t1 = Teacher(username='t1', school=self.s1, email='t1@g.com', first_name='fn1', last_name='ln1')
+        self.t1.save()
+        self.r1 = Room(name='lab1', capacity=1, school=self.s1)
+        self.r1.save()
+        self.r2 = Room(name='lab2', capacity=2, school=self.s1)
+        self.r2.save()
+
+        # Two weeks, the second Tuesday is a holiday
+        self.monday = date(year=2020, month=9, day=14)
+        Holiday(date_start=self.monday + timedelta(days=8), date_end=self.monday + timedelta(days=8), name='Holiday',
+                school=self.s1, school_year=self.sy).save()
+        lectures = [
+            # lab1 is used every Monday at 8, and once at a time that is not of an hour slot
+            (self.r1, self.c1, 0, 8), (self.r1, self.c1, 7, 8), (self.r1, self.c2, 2, 11),
+            # lab2 hosts two courses the first Monday at 9 (the lectures of the same course count once)
+            (self.r2, self.c1, 0, 9), (self.r2, self.c1, 0, 9), (self.r2, self.c2, 0, 9),
+            (self.r2, self.c1, 1, 8),
+            # Lectures without a room or out of the interval
+            (None, self.c2, 0, 8), (self.r1, self.c1, 14, 8),
+        ]
+        for room, course, day, hour in lectures:
+            Assignment(teacher=self.t1, course=course, subject=self.sub1, room=room,
+                       date=self.monday + timedelta(days=day), hour_start=time(hour=hour),
+                       hour_end=time(hour=hour + 1)).save()
+
+    def test_usage(self):
+        with self.assertNumQueries(4):
+            usage = RoomUsage(self.s1.id, self.sy.id, self.monday, self.monday + timedelta(days=13))
+        self.assertEqual(usage.days.tolist(), [2, 1, 2, 2, 2, 2, 2])
+        self.assertEqual(list(usage.times), [(0, time(hour=8), time(hour=9)), (0, time(hour=9), time(hour=10)),
+                                             (1, time(hour=8), time(hour=9)), (1, time(hour=9), time(hour=10)),
+                                             (2, time(hour=11), time(hour=12))])
+        self.assertEqual(usage.rooms['name'].tolist(), ['lab1', 'lab2'])
+        self.assertEqual(usage.occupancy.values.tolist(), [[1, 0, 0, 0, .5], [0, .5, 1, 0, 0]])
+        self.assertEqual(usage.pressure.values.tolist(), [[1, 0, 0, 0, .5], [0, .5, .5, 0, 0]])
+
+        # No lectures
+        usage = RoomUsage(self.s1.id, self.sy.id, self.monday + timedelta(days=21), self.monday + timedelta(days=27))
+        self.assertEqual(usage.occupancy.shape, (2, 4))
+        self.assertFalse(usage.pressure.values.any())
+
+    def test_api_and_report(self):
+        c = Client()
+        c.login(username='preside1', password='password_demo')
+        response = c.get('/timetable/room_usage_api/{}/2020-09-14/2020-09-27'.format(self.sy.id))
+        self.assertEqual(response.status_code, 200)
+        usage = response.json()
+        self.assertEqual(usage['rooms'], [{'id': self.r1.id, 'name': 'lab1', 'capacity': 1},
+                                          {'id': self.r2.id, 'name': 'lab2', 'capacity': 2}])
+        self.assertEqual(usage['times'][0], {'day_of_week': 0, 'hour_start': '08:00:00', 'hour_end': '09:00:00'})
+        self.assertEqual(usage['occupancy'][1], [0, .5, 1, 0, 0])
+        self.assertEqual(usage['pressure'][1], [0, .5, .5, 0, 0])
+        self.assertEqual(c.get('/timetable/room_usage_api/{}/2020-09-27/2020-09-14'.format(self.sy.id)).status_code,
+                         400)
+
+        response = c.get('/timetable/room_usage_csv_report_view/{}/2020-09-14/2020-09-27'.format(self.sy.id))
+        self.assertEqual(response.status_code, 200)
+        df = pd.read_excel(io.BytesIO(response.content), header=[0, 1], index_col=[0, 1])
+        self.assertEqual(df.shape, (4, 5))
+        self.assertEqual(df.iloc[3].tolist(), [0, 50, 50, 0, 0])
+
+        c.logout()
+        self.assertNotEqual(c.get('/timetable/room_usage_api/{}/2020-09-14/2020-09-27'.format(self.sy.id))
+                            .status_code, 200)
@@ -0,0 +1,74 @@
+from datetime import date, time as dtime
+
+from django.test import SimpleTestCase
+
+from timetable.solver import solve_substitutions, overlap_groups, MinCostFlow
+
+
+class SolverTestCase(SimpleTestCase):
+    def test_min_cost_flow(self):
+        network = MinCostFlow(4)
+        cheap = network.add_edge(0, 1, 1, 1)
+        network.add_edge(0, 2, 2, 5)
+        network.add_edge(1, 3, 2, 1)
+        network.add_edge(2, 3, 1, 1)
+        self.assertEqual(network.solve(0, 3), (2, 8))
+        self.assertEqual(network.get_flow(cheap), 1)
+
+    def test_optimal_plan(self):
+        """
+        A greedy plan gives the first lecture to its best candidate, leaving the other one uncovered.
+        """
+        lectures = {1: 'first hour', 2: 'first hour'}
+        plan = solve_substitutions(lectures, {1: {10, 20}, 2: {10}}, {10: 0, 20: 5}, {})
+        self.assertEqual(plan, {1: 20, 2: 10})
+
+        # Nobody is available
+        self.assertEqual(solve_substitutions(lectures, {1: set(), 2: {10}}, {}, {}), {1: None, 2: 10})
+
+    def test_one_lecture_at_a_time(self):
+        lectures = {1: 'first hour', 2: 'first hour', 3: 'second hour'}
+        plan = solve_substitutions(lectures, {1: {10}, 2: {10}, 3: {10}}, {}, {})
+        self.assertEqual(plan[3], 10)
+        self.assertEqual(sorted([plan[1], plan[2]], key=str), [10, None])
+
+    def test_overlapping_lectures(self):
+        """
+        A teacher doesn't substitute two lectures that overlap, even when they are not held at the very same hours.
+        """
+        day, other_day = date(year=2020, month=5, day=4), date(year=2020, month=5, day=5)
+        lectures = {1: (day, dtime(hour=8), dtime(hour=9)),
+                    2: (day, dtime(hour=8, minute=30), dtime(hour=9, minute=30)),
+                    3: (day, dtime(hour=9), dtime(hour=10)), 4: (day, dtime(hour=10), dtime(hour=11)),
+                    5: (other_day, dtime(hour=8), dtime(hour=9))}
+        times = overlap_groups(lectures)
+        self.assertEqual(times[1], times[2])
+        self.assertEqual(times[2], times[3])
+        self.assertEqual(len({times[1], times[4], times[5]}), 3)
+
+        plan = solve_substitutions(times, {i: {10} for i in lectures}, {}, {})
+        self.assertEqual([plan[1], plan[2], plan[3]].count(10), 1)
+        self.assertEqual((plan[4], plan[5]), (10, 10))
+
+    def test_fairness_and_adjacency(self):
+        lectures = {1: 'first hour', 2: 'second hour'}
+        # The lectures are spread among the teachers, the ones with fewer substitutions first
+        self.assertEqual(solve_substitutions(lectures, {1: {10, 20}, 2: {10, 20}}, {10: 1, 20: 1},
+                                             {(1, 10): 1, (2, 20): 1}), {1: 10, 2: 20})
+        self.assertEqual(solve_substitutions({1: 'first hour'}, {1: {10, 20}}, {10: 3, 20: 1}, {}), {1: 20})
+        # The teachers at school in the adjacent hours are preferred, when the substitutions made are the same
+        self.assertEqual(solve_substitutions({1: 'first hour'}, {1: {10, 20}}, {}, {(1, 20): 2}), {1: 20})
+
+    def test_large_day(self):
+        """
+        A day of a large school: 200 teachers available, 30 lectures to substitute.
+        """
+        day = date(year=2020, month=5, day=4)
+        lectures = {i: (day, dtime(hour=8 + i % 6), dtime(hour=9 + i % 6)) for i in range(30)}
+        candidates = {i: {t for t in range(200) if (t + i) % 7} for i in range(30)}
+        substitutions_made = {t: t % 5 for t in range(200)}
+        adjacent_lectures = {(i, t): (t + i) % 3 for i in range(30) for t in range(200)}
+        plan = solve_substitutions(lectures, candidates, substitutions_made, adjacent_lectures)
+        self.assertTrue(all(plan[i] in candidates[i] for i in range(30)))
+        # Nobody substitutes two lectures at the same time
+        self.assertEqual(len({(lectures[i], t) for i, t in plan.items()}), 30)
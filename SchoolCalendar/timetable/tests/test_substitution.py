@@ -1,12 +1,15 @@
 from django.test import TestCase
 from django.forms.models import model_to_dict
 from django.test import Client
+from django.test.utils import CaptureQueriesContext
+from django.db import connection
 from datetime import datetime, timedelta, time
 
 from timetable.models import *
 from timetable.forms import *
 from timetable.tests.base_test import BaseTestCase
 from timetable.views.other_views import TeacherSubstitutionView, SubstituteTeacherApiView
+from timetable.substitutions import AbsencePlanner, SubstitutionScores
 
 
 class ReplicateWeekTestCase(BaseTestCase):
@@ -305,3 +308,186 @@ class ReplicateWeekTestCase(BaseTestCase):
         self.assertTrue(json_res['substitution'])
         self.assertTrue(not json_res['free_substitution'])
         self.assertTrue(json_res['teacher']['id'] == self.t4.id)
+
+    def test_eventual_substitute(self):
+        """
+        The substitutes of the absent assignments are loaded at once, whatever the number of absences.
+        """
+        def count_substitutes_queries():
+            with CaptureQueriesContext(connection) as context:
+                response = self.c.get('/timetable/api/teacher_assignments/{}/{}/'.format(self.t1.id,
+                                                                                        self.school_year_2020.id))
+            return response.json(), len([q for q in context.captured_queries
+                                         if '"substituted_assignment_id" IN' in q['sql']])
+
+        self.c.post('/timetable/substitute_teacher_api/{0}/{1}'.format(self.ass1.id, self.t3.id))
+        json_res, queries_one_absence = count_substitutes_queries()
+        self.assertEqual(queries_one_absence, 1)
+        for assgn in json_res:
+            if assgn['id'] == self.ass1.id:
+                self.assertEqual(assgn['eventual_substitute']['id'], self.t3.id)
+            else:
+                self.assertIsNone(assgn['eventual_substitute'])
+
+        self.c.post('/timetable/substitute_teacher_api/{0}/{1}'.format(self.ass3.id, self.t4.id))
+        json_res, queries_two_absences = count_substitutes_queries()
+        self.assertEqual(queries_two_absences, queries_one_absence)
+        substitutes = {assgn['id']: assgn['eventual_substitute']['id'] for assgn in json_res}
+        self.assertEqual(substitutes, {self.ass1.id: self.t3.id, self.ass3.id: self.t4.id})
+
+        # A single assignment
+        response = self.c.get('/timetable/api/assignments/{}/'.format(self.ass3.id))
+        self.assertEqual(response.json()['eventual_substitute']['id'], self.t4.id)
+
+    def test_substitution_scores(self):
+        """
+        The lectures before and after the assignment, and the substitutions made, are computed for all the candidates
+        at once: the number of queries doesn't depend on the number of teachers.
+        """
+        for hour_number, hour in [(1, 8), (3, 10)]:
+            HourSlot(hour_number=hour_number, starts_at=time(hour=hour), ends_at=time(hour=hour + 1), day_of_week=0,
+                     legal_duration=timedelta(hours=1), hour_slots_group=self.hsg1).save()
+        Assignment(teacher=self.t3, course=self.c3, subject=self.sub3, date=datetime(year=2020, month=5, day=4),
+                   hour_start=time(hour=8), hour_end=time(hour=9)).save()
+        Assignment(teacher=self.t4, course=self.c3, subject=self.sub1, date=datetime(year=2020, month=5, day=4),
+                   hour_start=time(hour=10), hour_end=time(hour=11)).save()
+        absent = Assignment(teacher=self.t3, course=self.c2, subject=self.sub3, date=datetime(year=2020, month=5, day=5),
+                            hour_start=time(hour=9), hour_end=time(hour=10), absent=True)
+        absent.save()
+        Assignment(teacher=self.t4, course=self.c2, subject=self.sub3, date=datetime(year=2020, month=5, day=5),
+                   hour_start=time(hour=9), hour_end=time(hour=10), substitution=True,
+                   substituted_assignment=absent).save()
+
+        url = '/timetable/teacher_can_substitute/' + str(self.ass1.id)
+        self.c.get(url)  # Warm up the cache of the role and the school of the user
+        with CaptureQueriesContext(connection) as context:
+            json_res = self.c.get(url).json()
+        teachers = {tea['id']: tea for tea in json_res['available_teachers'] + json_res['other_teachers']}
+        self.assertEqual((teachers[self.t3.id]['has_hour_before'], teachers[self.t3.id]['has_hour_after']),
+                         (True, False))
+        self.assertEqual((teachers[self.t4.id]['has_hour_before'], teachers[self.t4.id]['has_hour_after']),
+                         (False, True))
+        self.assertEqual((teachers[self.t2.id]['has_hour_before'], teachers[self.t2.id]['has_hour_after']),
+                         (False, False))
+        self.assertEqual(teachers[self.t4.id]['substitutions_made_so_far'], 1)
+        self.assertEqual(teachers[self.t3.id]['substitutions_made_so_far'], 0)
+
+        for i in range(5):
+            teacher = Teacher(username='tx{}'.format(i), school=self.s1, email='tx{}@g.com'.format(i),
+                              first_name='fn', last_name='ln')
+            teacher.save()
+            HoursPerTeacherInClass(teacher=teacher, course=self.c3, subject=self.sub3, hours=10, hours_bes=0,
+                                   hours_co_teaching=0).save()
+            Assignment(teacher=teacher, course=self.c3, subject=self.sub3, date=datetime(year=2020, month=5, day=4),
+                       hour_start=time(hour=10), hour_end=time(hour=11)).save()
+        with CaptureQueriesContext(connection) as context_more_teachers:
+            json_res = self.c.get(url).json()
+        self.assertEqual(len(json_res['available_teachers']), 2 + 5)
+        self.assertTrue(all(tea['has_hour_after'] for tea in json_res['available_teachers'] if tea['last_name'] == 'ln'))
+        self.assertEqual(len(context_more_teachers.captured_queries), len(context.captured_queries))
+
+    def test_adjacent_hours_of_the_course(self):
+        """
+        The hour slots before and after a lecture are the ones of the HourSlotsGroup of its course, even when another
+        group has an hour slot at the same hours.
+        """
+        hsg2 = HourSlotsGroup(school=self.s1, school_year=self.school_year_2020, name='Short hours school 1')
+        hsg2.save()
+        c4 = Course(year=2, section='A', hour_slots_group=hsg2)
+        c4.save()
+        for hour_number, hour in [(1, 8), (2, 9)]:
+            HourSlot(hour_number=hour_number, starts_at=time(hour=hour), ends_at=time(hour=hour + 1), day_of_week=0,
+                     legal_duration=timedelta(hours=1), hour_slots_group=hsg2).save()
+        t5 = Teacher(username='t5', school=self.s1, email='t5@g.com', first_name='fn5', last_name='ln5')
+        t5.save()
+        lecture = Assignment(teacher=t5, course=c4, subject=self.sub1, date=datetime(year=2020, month=5, day=4),
+                             hour_start=time(hour=9), hour_end=time(hour=10))
+        lecture.save()
+        Assignment(teacher=self.t3, course=self.c3, subject=self.sub3, date=datetime(year=2020, month=5, day=4),
+                   hour_start=time(hour=8), hour_end=time(hour=9)).save()
+
+        scores = SubstitutionScores(lecture).get_scores([self.t3])
+        self.assertEqual((scores[self.t3.id]['has_hour_before'], scores[self.t3.id]['has_hour_after']), (True, False))
+        # The lecture of c1 at the same hours has no hour slot before it
+        scores = SubstitutionScores(self.ass1).get_scores([self.t3])
+        self.assertFalse(scores[self.t3.id]['has_hour_before'])
+
+        planner = AbsencePlanner([t5], datetime(year=2020, month=5, day=4).date(),
+                                 datetime(year=2020, month=5, day=4).date())
+        self.assertEqual(planner.adjacent_lectures.get((lecture.id, self.t3.id)), 1)
+
+    def test_absence_planner(self):
+        """
+        All the lectures of an absent teacher are substituted at once, balancing the substitutions made so far.
+        """
+        for i in range(2):
+            absent = Assignment(teacher=self.t2, course=self.c2, subject=self.sub2,
+                                date=datetime(year=2020, month=5, day=5 + i), hour_start=time(hour=9),
+                                hour_end=time(hour=10), absent=True)
+            absent.save()
+            Assignment(teacher=self.t4, course=self.c2, subject=self.sub2, date=datetime(year=2020, month=5, day=5 + i),
+                       hour_start=time(hour=9), hour_end=time(hour=10), substitution=True,
+                       substituted_assignment=absent).save()
+        url = '/timetable/absence_planner_api/{}/2020-05-04/2020-05-04'.format(self.t1.id)
+
+        # The lectures, the candidates, the hour slots, the absence blocks, the busy teachers and the substitutions made
+        with self.assertNumQueries(6):
+            AbsencePlanner([self.t1], datetime(year=2020, month=5, day=4).date(),
+                           datetime(year=2020, month=5, day=8).date()).plan()
+
+        json_res = self.c.get(url).json()
+        plan = {el['assignment']['id']: el for el in json_res['assignments']}
+        self.assertEqual(set(plan), {self.ass1.id, self.ass3.id})
+        # t2 is busy when ass1 is held, and ass3 is not held in an hour slot
+        self.assertEqual([t['id'] for t in plan[self.ass1.id]['available_teachers']], [self.t3.id, self.t4.id])
+        self.assertEqual([t['id'] for t in plan[self.ass3.id]['available_teachers']],
+                         [self.t2.id, self.t3.id, self.t4.id])
+        self.assertEqual(plan[self.ass1.id]['available_teachers'][1]['substitutions_made_so_far'], 2)
+        # t4 made 2 substitutions already, and t3 is suggested for ass1
+        self.assertEqual(plan[self.ass1.id]['suggested_substitute'], self.t3.id)
+        self.assertEqual(plan[self.ass3.id]['suggested_substitute'], self.t2.id)
+
+        # A teacher with a lecture overlapping ass1, though not at the same hours, is busy
+        overlapping = Assignment(teacher=self.t3, course=self.c3, subject=self.sub3,
+                                 date=datetime(year=2020, month=5, day=4), hour_start=time(hour=9, minute=30),
+                                 hour_end=time(hour=10, minute=30))
+        overlapping.save()
+        planner = AbsencePlanner([self.t1], datetime(year=2020, month=5, day=4).date(),
+                                 datetime(year=2020, month=5, day=4).date())
+        self.assertEqual(planner.available_teachers[self.ass1.id], {self.t4.id})
+        self.assertEqual(planner.available_teachers[self.ass3.id], {self.t2.id, self.t4.id})
+        overlapping.delete()
+
+        # Many teachers absent in the same day: none of them is a substitute
+        json_res = self.c.get('/timetable/absence_planner_api/2020-05-04/2020-05-04',
+                              {'teachers[]': [self.t1.id, self.t3.id]}).json()
+        plan = {el['assignment']['id']: el for el in json_res['assignments']}
+        self.assertTrue({self.ass1.id, self.ass3.id} <= set(plan))
+        self.assertTrue(all(t['id'] not in (self.t1.id, self.t3.id)
+                            for el in plan.values() for t in el['available_teachers']))
+        self.assertEqual(plan[self.ass1.id]['suggested_substitute'], self.t4.id)
+
+        # A teacher of another school can't substitute: nothing is saved
+        t5 = Teacher(username='t5', school=self.s2, email='t5@g.com', first_name='fn5', last_name='ln5')
+        t5.save()
+        response = self.c.post(url, {'substitutions': '{{"{}": {}, "{}": {}}}'.format(
+            self.ass1.id, self.t3.id, self.ass3.id, t5.id)})
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(Assignment.objects.filter(substituted_assignment__in=[self.ass1, self.ass3]).exists())
+
+        response = self.c.post(url)
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual({(a['teacher']['id'], a['substitution']) for a in response.json()},
+                         {(self.t3.id, True), (self.t2.id, True)})
+        self.assertTrue(Assignment.objects.get(id=self.ass1.id).absent)
+        self.assertTrue(Assignment.objects.get(id=self.ass3.id).absent)
+        self.assertEqual(self.c.get(url).json()['assignments'], [])
+
+        # Only the admins of the school of the teacher can plan the absences
+        c = Client()
+        c.login(username='preside2', password='password_demo')
+        self.assertEqual(c.get(url).status_code, 403)
+        self.assertEqual(c.get('/timetable/absence_planner_api/2020-05-04/2020-05-04',
+                               {'teachers[]': [self.t1.id]}).status_code, 403)
+        self.assertEqual(self.c.get('/timetable/absence_planner_api/{}/2020-05-05/2020-05-04'.format(
+            self.t1.id)).status_code, 400)
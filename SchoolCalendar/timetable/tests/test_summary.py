@@ -0,0 +1,119 @@
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+from django.db import connection
+from django.db.models import Sum
+from datetime import datetime, timedelta, time
+
+from timetable.models import *
+from timetable.tests.base_test import BaseTestCase
+
+
+class SummaryTestCase(BaseTestCase):
+    def setUp(self):
+        super(SummaryTestCase, self).setUp()
+        self.school_year_2020 = SchoolYear(year_start=2020, date_start=datetime(month=8, year=2020, day=31))
+        self.school_year_2020.save()
+
+        self.hsg1 = HourSlotsGroup(school=self.s1, school_year=self.school_year_2020, name='Dafault school 1')
+        self.hsg1.save()
+        self.c1 = Course(year=1, section='A', hour_slots_group=self.hsg1)
+        self.c1.save()
+        self.sub1 = Subject(name='Maths', school=self.s1)
+        self.sub1.save()
+
+        # Lectures of 50' are worth 1 hour.
+        self.hs1 = HourSlot(hour_number=1,
+                            starts_at=time(hour=8, minute=0),
+                            ends_at=time(hour=8, minute=50),
+                            day_of_week=0,
+                            legal_duration=timedelta(hours=1),
+                            hour_slots_group=self.hsg1)
+        self.hs1.save()
+
+        self.teachers = []
+        for i in range(3):
+            teacher = Teacher(username='t{}'.format(i), school=self.s1, email='t{}@g.com'.format(i),
+                              password='password_demo', first_name='fn{}'.format(i), last_name='ln{}'.format(i))
+            teacher.save()
+            self.teachers.append(teacher)
+            HoursPerTeacherInClass(teacher=teacher, course=self.c1, subject=self.sub1,
+                                   hours=100, hours_bes=10, hours_co_teaching=10).save()
+            TeachersYearlyLoad(teacher=teacher, yearly_load=100, yearly_load_bes=10, yearly_load_co_teaching=10,
+                               school_year=self.school_year_2020).save()
+            for week in range(4):
+                monday = datetime(year=2020, month=9, day=14) + timedelta(days=7 * week)
+                # A lecture in the hour slot, one outside of it (2 hours long)
+                Assignment(teacher=teacher, course=self.c1, subject=self.sub1, date=monday,
+                           hour_start=time(hour=8, minute=0), hour_end=time(hour=8, minute=50)).save()
+                Assignment(teacher=teacher, course=self.c1, subject=self.sub1, date=monday + timedelta(days=1),
+                           hour_start=time(hour=10, minute=0), hour_end=time(hour=12, minute=0),
+                           bes=(week == 0), co_teaching=(week == 1), substitution=(week == 2)).save()
+
+        self.c = Client()
+        self.c.login(username='preside1', password='password_demo')
+
+    def test_teachers_summary_values(self):
+        """
+        Hours are weighted with the legal duration of the hour slot, or with the actual duration of the lecture
+        when there is no hour slot.
+        """
+        response = self.c.get('/timetable/api/teachers_summary/?school_year={}'.format(self.school_year_2020.id))
+        json_res = response.json()
+        self.assertEqual(len(json_res), 3)
+        for summary in json_res:
+            self.assertEqual(summary['hours_done'], 4 + 2 * 2)  # 4 in the hour slot, 2 normal and 1 co-teaching
+            self.assertEqual(summary['hours_bes_done'], 2)
+            self.assertEqual(summary['hours_co_teaching_done'], 2)
+            self.assertEqual(summary['hours_substitution_done'], 2)
+            self.assertEqual(summary['total_hours'], 100)
+            self.assertEqual(summary['total_hours_bes'], 10)
+            self.assertEqual(summary['total_hours_co_teaching'], 10)
+
+        # Filter in a time interval: only the first week
+        response = self.c.get('/timetable/api/teachers_summary/?school_year={}&start_date=2020-09-14'
+                              '&end_date=2020-09-20'.format(self.school_year_2020.id))
+        for summary in response.json():
+            self.assertEqual(summary['hours_done'], 1)
+            self.assertEqual(summary['hours_bes_done'], 2)
+
+    def test_teachers_summary_queries_do_not_depend_on_teachers(self):
+        """
+        The summary of many teachers is computed with the same number of queries needed for one teacher.
+        """
+        url = '/timetable/api/teachers_summary/?school_year={}'.format(self.school_year_2020.id)
+        self.c.get(url)  # Warm up the cache of the role and the school of the user
+        with CaptureQueriesContext(connection) as context:
+            self.c.get(url)
+        queries_3_teachers = len(context.captured_queries)
+
+        Teacher.objects.filter(id__in=[t.id for t in self.teachers[1:]]).delete()
+        with CaptureQueriesContext(connection) as context:
+            response = self.c.get(url)
+        self.assertEqual(len(response.json()), 1)
+        self.assertEqual(len(context.captured_queries), queries_3_teachers)
+
+    def test_legal_duration_annotation(self):
+        """
+        The legal duration is the one of the hour slot of the course, or the actual duration of the lecture.
+        """
+        teacher = self.teachers[0]
+        durations = Assignment.objects.filter(teacher=teacher).select_properties('legal_duration') \
+            .values_list('hour_start', 'legal_duration')
+        for hour_start, legal_duration in durations:
+            if hour_start == time(hour=8, minute=0):
+                self.assertEqual(legal_duration, timedelta(hours=1))
+            else:
+                self.assertEqual(legal_duration, timedelta(hours=2))
+
+        # The same lecture in another day of the week isn't in the hour slot
+        a = Assignment.objects.filter(teacher=teacher, hour_start=time(hour=8, minute=0)).first()
+        a.date += timedelta(days=2)
+        a.save()
+        self.assertEqual(a.legal_duration, timedelta(minutes=50))
+
+        # Totals are computed in a single SUM
+        with CaptureQueriesContext(connection) as context:
+            totals = Assignment.objects.values('teacher').annotate(total=Sum('legal_duration')).order_by('teacher')
+            self.assertEqual([t['total'] for t in totals],
+                             [timedelta(hours=3 + 8, minutes=50), timedelta(hours=12), timedelta(hours=12)])
+        self.assertEqual(len(context.captured_queries), 1)
@@ -0,0 +1,166 @@
+from datetime import date, time, timedelta
+
+from django.test import Client
+
+from timetable.models import *
+from timetable.tests.base_test import BaseTestCase
+from timetable.week_state import WeekState, get_week_state, TEACHER_CONFLICT, COURSE_CONFLICT, ROOM_CONFLICT, \
+    ABSENCE_BLOCK
+
+
+class WeekStateTestCase(BaseTestCase):
+    def setUp(self):
+        super(WeekStateTestCase, self).setUp()
+        self.hsg1 = HourSlotsGroup(school=self.s1, school_year=self.sy, name='Default school 1')
+        self.hsg1.save()
+        self.hour_slots = []
+        for day_of_week in range(2):
+            for hour in range(3):
+                hs = HourSlot(hour_number=hour + 1, starts_at=time(hour=8 + hour), ends_at=time(hour=9 + hour),
+                              day_of_week=day_of_week, legal_duration=timedelta(hours=1), hour_slots_group=self.hsg1)
+                hs.save()
+                self.hour_slots.append(hs)
+        self.c1 = Course(year=1, section='A', hour_slots_group=self.hsg1)
+        self.c1.save()
+        self.c2 = Course(year=1, section='B', hour_slots_group=self.hsg1)
+        self.c2.save()
+        self.sub1 = Subject(name='Maths', school=self.s1)
+        self.sub1.save()
+        self.t1 = Teacher(username='t1', school=self.s1, email='t1@g.com', first_name='fn1', last_name='ln1')
+        self.t1.save()
+        self.t2 = Teacher(username='t2', school=self.s1, email='t2@g.com', first_name='fn2', last_name='ln2')
+        self.t2.save()
+        self.r1 = Room(name='lab1', capacity=1, school=self.s1)
+        self.r1.save()
+        self.r2 = Room(name='lab2', capacity=2, school=self.s1)
+        self.r2.save()
+        # t2 is not available in the last hour of Tuesday
+        AbsenceBlock(teacher=self.t2, hour_slot=self.hour_slots[5]).save()
+
+        self.monday = date(year=2020, month=9, day=14)
+        self.a1 = Assignment(teacher=self.t1, course=self.c1, subject=self.sub1, room=self.r1, date=self.monday,
+                             hour_start=time(hour=8), hour_end=time(hour=9))
+        self.a1.save()
+        self.a2 = Assignment(teacher=self.t2, course=self.c2, subject=self.sub1, room=self.r2, date=self.monday,
+                             hour_start=time(hour=9), hour_end=time(hour=10))
+        self.a2.save()
+        # A lecture of another week
+        Assignment(teacher=self.t2, course=self.c2, subject=self.sub1, date=self.monday + timedelta(days=7),
+                   hour_start=time(hour=8), hour_end=time(hour=9)).save()
+
+    def test_conflicts(self):
+        with self.assertNumQueries(4):
+            state = WeekState.load(self.s1.id, self.sy.id, self.monday)
+        eight, nine, ten = time(hour=8), time(hour=9), time(hour=10)
+        self.assertEqual(state.get_conflicts(self.t1.id, self.c2.id, None, self.monday, eight, nine),
+                         [TEACHER_CONFLICT])
+        # lab1 is full of c1, hence not for c1 itself
+        self.assertEqual(state.get_conflicts(self.t2.id, self.c1.id, self.r1.id, self.monday, eight, nine),
+                         [COURSE_CONFLICT])
+        self.assertEqual(state.get_conflicts(self.t2.id, self.c2.id, self.r1.id, self.monday, eight, nine),
+                         [ROOM_CONFLICT])
+        # A BES lecture is held during the lectures of the course
+        self.assertEqual(state.get_conflicts(self.t2.id, self.c1.id, None, self.monday, eight, nine, normal=False), [])
+        # The room lab2 has room for two courses
+        self.assertEqual(state.get_conflicts(self.t1.id, self.c1.id, self.r2.id, self.monday, nine, ten), [])
+        self.assertEqual(state.get_conflicts(self.t2.id, self.c2.id, None, self.monday + timedelta(days=1),
+                                             time(hour=10), time(hour=11)), [ABSENCE_BLOCK])
+        self.assertEqual(state.get_conflicts(self.t2.id, self.c2.id, None, self.monday, eight, nine), [])
+
+        # A lecture is moved as a delta of the state
+        state.remove(self.a1.id)
+        state.add(self.a1.id, self.t1.id, self.c1.id, self.r2.id, self.monday, nine, ten)
+        self.assertEqual(state.get_conflicts(self.t2.id, self.c2.id, self.r1.id, self.monday, eight, nine), [])
+        # lab2 hosts c1 and c2, but the lectures of c2 don't take a place for c2
+        self.assertEqual(state.get_conflicts(self.t2.id, self.c2.id, self.r2.id, self.monday, nine, ten),
+                         [TEACHER_CONFLICT, COURSE_CONFLICT])
+        state.remove(self.a2.id)
+        self.assertEqual(state.get_conflicts(self.t2.id, self.c2.id, self.r2.id, self.monday, nine, ten), [])
+
+    def test_room_courses(self):
+        """
+        As in RoomOccupancy, a room is full when it hosts as many courses as its capacity, and the lectures of the
+        course that is placed don't count.
+        """
+        state = WeekState.load(self.s1.id, self.sy.id, self.monday)
+        eight, nine, ten = time(hour=8), time(hour=9), time(hour=10)
+        other_teacher, other_course = 0, 0
+        # A co-teaching lecture of c1 in lab1, with a1
+        self.assertEqual(state.get_conflicts(self.t2.id, self.c1.id, self.r1.id, self.monday, eight, nine,
+                                             normal=False), [])
+        state.add(-1, self.t2.id, self.c1.id, self.r1.id, self.monday, eight, nine, normal=False)
+        self.assertEqual(state.get_conflicts(other_teacher, self.c2.id, self.r1.id, self.monday, eight, nine),
+                         [ROOM_CONFLICT])
+        # lab1 hosts c1 as long as one of its lectures is there
+        state.remove(self.a1.id)
+        self.assertEqual(state.get_conflicts(other_teacher, self.c2.id, self.r1.id, self.monday, eight, nine),
+                         [ROOM_CONFLICT])
+        state.remove(-1)
+        self.assertEqual(state.get_conflicts(other_teacher, self.c2.id, self.r1.id, self.monday, eight, nine), [])
+
+        # lab2 hosts c2 and c1: it is full for the other courses only
+        state.add(-2, self.t1.id, self.c1.id, self.r2.id, self.monday, nine, ten)
+        self.assertEqual(state.get_conflicts(other_teacher, other_course, self.r2.id, self.monday, nine, ten),
+                         [ROOM_CONFLICT])
+        self.assertEqual(state.get_conflicts(other_teacher, self.c1.id, self.r2.id, self.monday, nine, ten,
+                                             normal=False), [])
+        targets = state.get_drop_targets(self.t1.id, self.c1.id, self.hsg1.id, self.r2.id, assignment_id=-2)
+        self.assertEqual(targets[1][4], [])
+
+    def test_drop_targets(self):
+        # The courses of another group have their own hour slots
+        hsg2 = HourSlotsGroup(school=self.s1, school_year=self.sy, name='Short hours school 1')
+        hsg2.save()
+        hs = HourSlot(hour_number=1, starts_at=time(hour=8, minute=30), ends_at=time(hour=9, minute=30), day_of_week=0,
+                      legal_duration=timedelta(minutes=50), hour_slots_group=hsg2)
+        hs.save()
+        state = WeekState.load(self.s1.id, self.sy.id, self.monday)
+        targets = state.get_drop_targets(self.t2.id, self.c2.id, self.hsg1.id, self.r1.id, assignment_id=self.a2.id)
+        self.assertEqual(len(targets), 6)
+        self.assertEqual([conflicts for _, _, _, _, conflicts in targets],
+                         [[ROOM_CONFLICT], [], [], [], [], [ABSENCE_BLOCK]])
+        self.assertEqual(targets[3][:4], (self.hour_slots[3].id, self.monday + timedelta(days=1), time(hour=8),
+                                           time(hour=9)))
+        # The moved lecture is back in its place
+        self.assertEqual(state.get_drop_targets(self.t2.id, self.c1.id, self.hsg1.id)[1][4], [TEACHER_CONFLICT])
+        self.assertEqual(state.get_drop_targets(self.t2.id, self.c1.id, hsg2.id),
+                         [(hs.id, self.monday, time(hour=8, minute=30), time(hour=9, minute=30), [])])
+
+    def test_cache(self):
+        state = get_week_state(self.s1.id, self.sy.id, self.monday)
+        with self.assertNumQueries(0):
+            self.assertEqual(get_week_state(self.s1.id, self.sy.id, self.monday).lectures, state.lectures)
+
+        # Any change of the assignments, the rooms or the absence blocks of the week is seen
+        self.a1.hour_start, self.a1.hour_end = time(hour=10), time(hour=11)
+        self.a1.save()
+        state = get_week_state(self.s1.id, self.sy.id, self.monday)
+        self.assertEqual(state.get_conflicts(self.t1.id, self.c1.id, None, self.monday, time(hour=10), time(hour=11)),
+                         [TEACHER_CONFLICT, COURSE_CONFLICT])
+        AbsenceBlock(teacher=self.t1, hour_slot=self.hour_slots[1]).save()
+        state = get_week_state(self.s1.id, self.sy.id, self.monday)
+        self.assertEqual(state.get_conflicts(self.t1.id, self.c1.id, None, self.monday, time(hour=9), time(hour=10)),
+                         [ABSENCE_BLOCK])
+
+    def test_drop_targets_api(self):
+        c = Client()
+        c.login(username='preside1', password='password_demo')
+        url = '/timetable/drop_targets_api/{}/2020-09-14'.format(self.sy.id)
+        response = c.get(url, {'teacher': self.t1.id, 'course': self.c2.id, 'room': self.r1.id})
+        self.assertEqual(response.status_code, 200)
+        targets = response.json()['targets']
+        self.assertEqual(targets[0], {'hour_slot': self.hour_slots[0].id, 'date': '2020-09-14',
+                                      'hour_start': '08:00:00', 'hour_end': '09:00:00',
+                                      'conflicts': [TEACHER_CONFLICT, ROOM_CONFLICT]})
+        self.assertEqual(targets[1]['conflicts'], [COURSE_CONFLICT])
+        response = c.get(url, {'teacher': self.t1.id, 'course': self.c2.id, 'bes': 'true'})
+        self.assertEqual([t['conflicts'] for t in response.json()['targets']][:2], [[TEACHER_CONFLICT], []])
+        response = c.get(url, {'teacher': self.t1.id, 'course': self.c1.id, 'assignment': self.a1.id})
+        self.assertEqual(response.json()['targets'][0]['conflicts'], [])
+
+        self.assertEqual(c.get(url, {'teacher': self.t1.id}).status_code, 400)
+        self.assertEqual(c.get(url, {'teacher': self.t1.id, 'course': 0}).status_code, 400)
+        self.assertEqual(c.get('/timetable/drop_targets_api/{}/2020-09-15'.format(self.sy.id),
+                               {'teacher': self.t1.id, 'course': self.c1.id}).status_code, 400)
+        c.logout()
+        self.assertNotEqual(c.get(url, {'teacher': self.t1.id, 'course': self.c1.id}).status_code, 200)
@@ -21,16 +21,19 @@ from timetable.views.rest_framework_views import TeacherViewSet, \
     HourSlotViewSet, HoursPerTeacherInClassViewSet, AssignmentViewSet, TeacherAssignmentsViewSet, \
     AbsenceBlocksPerTeacherViewSet, TeacherTimetableViewSet, AbsenceBlockViewSet, \
     SubjectViewSet, RoomViewSet, TeacherSummaryViewSet, CourseSummaryViewSet, TeachersYearlyLoadViewSet, \
-    CoursesYearlyLoadViewSet, RoomTimetableViewSet, HourSlotsGroupViewSet, SubstitutionAssignmentsViewSet
+    CoursesYearlyLoadViewSet, RoomTimetableViewSet, HourSlotsGroupViewSet, SubstitutionAssignmentsViewSet, \
+    WeekBundleViewSet, WeekFreeRoomsViewSet
 from timetable.views.other_views import TimetableView, SubstituteTeacherView, TeacherTimetableView, \
     LoggedUserRedirectView, TeacherSummaryView, SendInvitationTeacherEmailView, \
     SendInvitationAdminSchoolEmailView, CheckWeekReplicationView, ReplicateWeekAssignmentsView, \
-    TeacherSubstitutionView, SubstituteTeacherApiView, TimetableReportView, \
-    CourseSummaryView, RoomTimetableView, SubstitutionSummaryView, \
-    SendTeacherSubstitutionEmailView, DownloadTeacherSubstitutionTicketView, SecretaryTimetableView, UserGuideView
+    TeacherSubstitutionView, SubstituteTeacherApiView, AbsencePlannerApiView, GenerateTimetableApiView, \
+    DropTargetsApiView, RoomUsageApiView, RecurringOccurrencesApiView, TimetableReportView, CourseSummaryView, \
+    RoomTimetableView, SubstitutionSummaryView, SendTeacherSubstitutionEmailView, \
+    DownloadTeacherSubstitutionTicketView, SecretaryTimetableView, UserGuideView
 from timetable.views.csv_views import TimetableTeacherCSVReportViewSet, TimetableCourseCSVReportViewSet, \
                                       TimetableRoomCSVReportViewSet, TimetableGeneralCSVReportViewSet, \
-                                      SubstitutionsCSVReportViewSet
+                                      SubstitutionsCSVReportViewSet, RoomUsageCSVReportViewSet, \
+                                      TimetableGeneralWeeksCSVReportViewSet
 
 from rest_framework.routers import DefaultRouter
 
@@ -61,6 +64,8 @@ router.register(r'courses_summary/?(school_year=[0-9]+)?(start_date=\d\d\d\d-\d\
                 CourseSummaryViewSet, basename='course_summary')
 router.register(r'teachers_yearly_loads', TeachersYearlyLoadViewSet, basename='teachers_yearly_load')
 router.register(r'courses_yearly_loads', CoursesYearlyLoadViewSet, basename='courses_yearly_load')
+router.register(r'week_bundle', WeekBundleViewSet, basename='week_bundle')
+router.register(r'week_free_rooms', WeekFreeRoomsViewSet, basename='week_free_rooms')
 
 
 urlpatterns = [
@@ -77,6 +82,10 @@ urlpatterns = [
     url(r'timetable_general_csv_report_view/(?P<school_year_pk>[0-9]+)'
         r'(?P<monday_date>\d\d\d\d-\d\d-\d\d)', TimetableGeneralCSVReportViewSet.as_view(),
         name='timetable_general_csv_report'),
+    url(r'timetable_general_weeks_csv_report_view/(?P<school_year_pk>[0-9]+)/(?P<monday_date>\d\d\d\d-\d\d-\d\d)/'
+        r'(?P<weeks>\d+)', TimetableGeneralWeeksCSVReportViewSet.as_view(), name='timetable_general_weeks_csv_report'),
+    url(r'room_usage_csv_report_view/(?P<school_year_pk>[0-9]+)/(?P<from>\d\d\d\d-\d\d-\d\d)/'
+        r'(?P<to>\d\d\d\d-\d\d-\d\d)', RoomUsageCSVReportViewSet.as_view(), name='room_usage_csv_report'),
     url(r'substitutions_csv_report_view/(?P<school_year_pk>[0-9]+)', SubstitutionsCSVReportViewSet.as_view(),
         name='substitutions_csv_report'),
 
@@ -178,5 +187,17 @@ urlpatterns = [
     re_path(r'teacher_can_substitute/(?P<assignment_pk>\d+)', TeacherSubstitutionView.as_view(),
             name='teacher_substitution-view'),
     re_path(r'substitute_teacher_api/(?P<assignment_pk>\d+)/(?P<teacher_pk>\d+)', SubstituteTeacherApiView.as_view(),
-            name='substitute_teacher_api-view')
+            name='substitute_teacher_api-view'),
+    re_path(r'absence_planner_api/(?P<teacher_pk>\d+)/(?P<from>\d\d\d\d-\d\d-\d\d)/(?P<to>\d\d\d\d-\d\d-\d\d)',
+            AbsencePlannerApiView.as_view(), name='absence_planner_api-view'),
+    re_path(r'absence_planner_api/(?P<from>\d\d\d\d-\d\d-\d\d)/(?P<to>\d\d\d\d-\d\d-\d\d)',
+            AbsencePlannerApiView.as_view(), name='absence_planner_teachers_api-view'),
+    re_path(r'generate_timetable_api/(?P<school_year_pk>\d+)/(?P<monday>\d\d\d\d-\d\d-\d\d)',
+            GenerateTimetableApiView.as_view(), name='generate_timetable_api-view'),
+    re_path(r'drop_targets_api/(?P<school_year_pk>\d+)/(?P<monday>\d\d\d\d-\d\d-\d\d)',
+            DropTargetsApiView.as_view(), name='drop_targets_api-view'),
+    re_path(r'room_usage_api/(?P<school_year_pk>\d+)/(?P<from>\d\d\d\d-\d\d-\d\d)/(?P<to>\d\d\d\d-\d\d-\d\d)',
+            RoomUsageApiView.as_view(), name='room_usage_api-view'),
+    re_path(r'recurring_occurrences_api/(?P<from>\d\d\d\d-\d\d-\d\d)/(?P<to>\d\d\d\d-\d\d-\d\d)',
+            RecurringOccurrencesApiView.as_view(), name='recurring_occurrences_api-view'),
 ]
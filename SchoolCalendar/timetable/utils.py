@@ -1,31 +1,243 @@
 import datetime
+import hashlib
 import random
 import string
+import uuid
 
 from django.contrib.auth.forms import PasswordResetForm
 from django.contrib.auth.models import User
-from django.db import models
+from django.core.cache import cache
+from django.db import models, transaction
 from django.db.models import Q, Subquery
+from django.utils import timezone
 from django.utils.text import capfirst
 from timetable.models import Teacher, AdminSchool, Secretary, HoursPerTeacherInClass, Assignment, HourSlot, School
 
 
+# The roles of the users of a school, in the order in which they are looked for.
+TEACHER = 'teacher'
+ADMIN_SCHOOL = 'adminschool'
+SECRETARY = 'secretary'
+ROLES = (TEACHER, ADMIN_SCHOOL, SECRETARY)
+
+# How long (in seconds) roles and schools are kept in the cache, in case an invalidation gets lost.
+SCHOOL_ROLES_CACHE_TIMEOUT = 60 * 60
+
+
+def get_roles_cache_key(user_id):
+    return 'timetable:roles:{}'.format(user_id)
+
+
+def get_school_cache_key(school_id):
+    return 'timetable:school:{}'.format(school_id)
+
+
+# How long (in seconds) the versions of the weeks are kept. A version that is lost is created again, hence the clients
+# simply download the week once more.
+WEEK_VERSION_CACHE_TIMEOUT = 60 * 60 * 24 * 7
+
+# Intervals longer than this are not versioned week by week: the version of the whole school is changed instead.
+MAX_VERSIONED_WEEKS = 53
+
+# The assignments of a week are versioned as a whole, and per course, teacher and room: a lecture that changes only
+# changes the versions of its course, teacher and room (and the one of all the assignments of the week).
+ALL_ASSIGNMENTS = 'assignments'
+COURSE = 'course'
+ROOM = 'room'
+WEEK_SCOPES = (ALL_ASSIGNMENTS, COURSE, TEACHER, ROOM)
+
+# How long (in seconds) the serialized assignments of a week are kept.
+WEEK_PAYLOAD_CACHE_TIMEOUT = 60 * 60
+
+
+# How long (in seconds) the in-memory state of a week (see week_state.WeekState and room_occupancy.RoomOccupancy) is
+# kept.
+WEEK_STATE_CACHE_TIMEOUT = 60 * 60
+
+
+def get_school_version_cache_key(school_id):
+    return 'timetable:school_version:{}'.format(school_id)
+
+
+def get_week_version_cache_key(school_id, monday, scope=None, scope_id=None):
+    """
+    :return: the key of the version of the week (holidays and stages), or of the assignments of the week in the scope.
+    """
+    key = 'timetable:week_version:{}:{}'.format(school_id, monday.isoformat())
+    if scope is not None:
+        key += ':{}:{}'.format(scope, '' if scope_id is None else scope_id)
+    return key
+
+
+def get_week_payload_cache_key(school_id, school_year_id, scope, scope_id, monday, params):
+    """
+    :param params: the parameters of the request, that can change the payload (ordering, filters...)
+    """
+    return 'timetable:week_payload:{}:{}:{}:{}:{}:{}'.format(school_id, school_year_id or '', scope,
+                                                              '' if scope_id is None else scope_id,
+                                                              monday.isoformat(),
+                                                              hashlib.md5(params.encode()).hexdigest())
+
+
+def get_week_state_cache_key(school_id, school_year_id, monday):
+    return 'timetable:week_state:{}:{}:{}'.format(school_id, school_year_id, monday.isoformat())
+
+
+def get_room_occupancy_cache_key(school_id, school_year_id, monday):
+    return 'timetable:room_occupancy:{}:{}:{}'.format(school_id, school_year_id, monday.isoformat())
+
+
+def get_mondays(date_start, date_end):
+    """
+    :return: the list of the Mondays of the weeks that overlap the interval [date_start, date_end]
+    """
+    # The date fields of unsaved (or just saved) instances can hold datetimes
+    if isinstance(date_start, datetime.datetime):
+        date_start = date_start.date()
+    if isinstance(date_end, datetime.datetime):
+        date_end = date_end.date()
+    monday = date_start - datetime.timedelta(days=date_start.weekday())
+    mondays = []
+    while monday <= date_end:
+        mondays.append(monday)
+        monday += datetime.timedelta(days=7)
+    return mondays
+
+
+def _new_version():
+    """
+    :return: a new (version, last modified) pair. The version is random rather than a counter, so that a version
+             evicted from the cache is never created again with a value already seen by a client.
+    """
+    return uuid.uuid4().hex, timezone.now().replace(microsecond=0)
+
+
+def _set_new_version(keys):
+    """
+    Give a new version to the keys now, so that the ETags of the clients are stale at once, and again on commit, so that
+    an ETag computed in the meanwhile (on data not yet committed) is never valid.
+    """
+    def set_new_version():
+        version = _new_version()
+        cache.set_many({key: version for key in keys}, WEEK_VERSION_CACHE_TIMEOUT)
+    set_new_version()
+    transaction.on_commit(set_new_version)
+
+
+def bump_school_version(school_id):
+    """
+    Change the version of all the weeks of the school, e.g. when its hour slots, teachers or rooms change.
+    """
+    _set_new_version([get_school_version_cache_key(school_id)])
+
+
+def bump_week_versions(school_id, date_start, date_end=None):
+    """
+    Change the version of the weeks of the school that overlap the interval [date_start, date_end], e.g. when a holiday
+    or a stage changes: every entry of those weeks is concerned.
+    """
+    mondays = get_mondays(date_start, date_end or date_start)
+    if len(mondays) > MAX_VERSIONED_WEEKS:
+        bump_school_version(school_id)
+    else:
+        _set_new_version([get_week_version_cache_key(school_id, monday) for monday in mondays])
+
+
+def bump_assignment_versions(assignments):
+    """
+    Change the versions of the weeks of the assignments, for all the assignments and for their courses, teachers and
+    rooms only (the other entries of the weeks are kept).
+    :param assignments: iterable of assignments
+    """
+    keys = set()
+    for a in assignments:
+        if a.school_id is None:
+            continue
+        monday = get_mondays(a.date, a.date)[0]
+        keys.update([get_week_version_cache_key(a.school_id, monday, ALL_ASSIGNMENTS),
+                     get_week_version_cache_key(a.school_id, monday, COURSE, a.course_id),
+                     get_week_version_cache_key(a.school_id, monday, TEACHER, a.teacher_id)])
+        if a.room_id is not None:
+            keys.add(get_week_version_cache_key(a.school_id, monday, ROOM, a.room_id))
+    if keys:
+        _set_new_version(sorted(keys))
+
+
+def get_week_versions(school_id, date_start, date_end, scope=ALL_ASSIGNMENTS, scope_id=None):
+    """
+    Read the versions of the school, of the weeks overlapping the interval [date_start, date_end] and of their
+    assignments in the scope, with a single access to the cache (the missing ones are created).
+    :param scope: one of WEEK_SCOPES, with the id of the course, teacher or room (None for ALL_ASSIGNMENTS)
+    :return: a tuple (list of the versions, date of the last change), or None if the interval is too long
+    """
+    mondays = get_mondays(date_start, date_end)
+    if len(mondays) > MAX_VERSIONED_WEEKS:
+        return None
+    keys = [get_school_version_cache_key(school_id)]
+    for monday in mondays:
+        keys += [get_week_version_cache_key(school_id, monday),
+                 get_week_version_cache_key(school_id, monday, scope, scope_id)]
+    versions = cache.get_many(keys)
+    missing = {key: _new_version() for key in keys if key not in versions}
+    if missing:
+        cache.set_many(missing, WEEK_VERSION_CACHE_TIMEOUT)
+        versions.update(missing)
+    return [versions[key][0] for key in keys], max(versions[key][1] for key in keys)
+
+
+def get_roles_from_user(user):
+    """
+    Returns the roles of the user (Teacher, AdminSchool or Secretary) with the related school.
+    They are resolved with a single query and kept in the cache across requests (invalidated by the signals when teachers,
+    admin schools or secretaries change). Besides, they are memoized in the user instance: since the user of a request is
+    loaded once per request, every helper called during the request (see SchoolRoleMiddleware) reads them from there.
+    :param user:
+    :return: a dict role -> id of the school. Empty when no teacher or AdminSchool or Secretary is related to that user.
+    """
+    if not user:
+        return {}
+    if not hasattr(user, '_school_roles'):
+        roles = {}
+        if user.id is not None:
+            roles = cache.get(get_roles_cache_key(user.id))
+            if roles is None:
+                schools = User.objects.filter(id=user.id).values('myuser__teacher__school',
+                                                                 'myuser__adminschool__school',
+                                                                 'myuser__secretary__school').first() or {}
+                roles = {role: schools['myuser__{}__school'.format(role)] for role in ROLES
+                         if schools.get('myuser__{}__school'.format(role)) is not None}
+                cache.set(get_roles_cache_key(user.id), roles, SCHOOL_ROLES_CACHE_TIMEOUT)
+        user._school_roles = roles
+    return user._school_roles
+
+
+def get_role_from_user(user):
+    """
+    :param user:
+    :return: the role of the user (TEACHER, ADMIN_SCHOOL or SECRETARY), None if the user has no role in a school.
+    """
+    roles = get_roles_from_user(user)
+    return next((role for role in ROLES if role in roles), None)
+
+
 def get_school_from_user(user):
     """
     Returns the school related to a Teacher or an AdminSchool or a Secretary instance.
+    The school is kept in the cache and memoized in the user instance, as its roles.
     :param user:
     :return: the school related to that user. None if no teacher or AdminSchool or Secretary is related to that user.
     """
-    teacher = Teacher.objects.filter(id=user.id)
-    if teacher:
-        return teacher[0].school
-    admin_school = AdminSchool.objects.filter(id=user.id)
-    if admin_school:
-        return admin_school[0].school
-    secretary = Secretary.objects.filter(id=user.id)
-    if secretary:
-        return secretary[0].school
-    return None
+    role = get_role_from_user(user)
+    if role is None:
+        return None
+    if not hasattr(user, '_school'):
+        school_id = get_roles_from_user(user)[role]
+        school = cache.get(get_school_cache_key(school_id))
+        if school is None:
+            school = School.objects.get(id=school_id)
+            cache.set(get_school_cache_key(school_id), school, SCHOOL_ROLES_CACHE_TIMEOUT)
+        user._school = school
+    return user._school
 
 
 def convert_weekday_into_0_6_format(day):
@@ -66,9 +278,7 @@ def is_adminschool(user):
     :param user:
     :return: True when the user is an AdminSchool corresponding to the given user
     """
-    if not user:
-        return False
-    return AdminSchool.objects.filter(id=user.id).exists()
+    return ADMIN_SCHOOL in get_roles_from_user(user)
 
 
 def is_teacher(user):
@@ -76,9 +286,7 @@ def is_teacher(user):
     :param user:
     :return: True when the user is a Teacher corresponding to the given user
     """
-    if not user:
-        return False
-    return Teacher.objects.filter(id=user.id).exists()
+    return TEACHER in get_roles_from_user(user)
     
 
 def is_secretary(user):
@@ -86,46 +294,7 @@ def is_secretary(user):
     :param user:
     :return: True when the user is a Secretary corresponding to the given user
     """
-    if not user:
-        return False
-    return Secretary.objects.filter(id=user.id).exists()
-
-
-def compute_total_hours_assignments(assignments, hours_slots):
-    """
-    In order to compute the total_hour_assignments for a teacher, we should merge assignments with the
-    hour_slots in a left outer join fashion.
-    Where there exists an hour slot for a given assignment, then we should use the 'legal_duration' field.
-    Where there is no time_slot for it, we should use instead the actual duration of the assignment.
-    :param assignments: the list of assignments for a given teacher, course, school_year, school, subject (bes and
-                        co-teaching can be both True or False, but not True at the same time).
-    :param hours_slots: the list of hour_slots for a given school and school_year
-    :return: the total number of hours planned (both past and in the future) for a given teacher, course, school,
-             school_year, subject.
-    """
-    # Create a 3 dimensional map, indexed by day_of_week, starts_at, ends_at -> legal_duration
-    map_hour_slots = {}
-    for el in hours_slots:
-        if el['day_of_week'] not in map_hour_slots:
-            map_hour_slots[el['day_of_week']] = {}
-        if el['starts_at'] not in map_hour_slots[el['day_of_week']]:
-            map_hour_slots[el['day_of_week']][el['starts_at']] = {}
-        if el['ends_at'] not in map_hour_slots[el['day_of_week']][el['starts_at']]:
-            map_hour_slots[el['day_of_week']][el['starts_at']][el['ends_at']] = {}
-        map_hour_slots[el['day_of_week']][el['starts_at']][el['ends_at']] = el['legal_duration']
-
-    for el in assignments:
-        if el["date__week_day"] in map_hour_slots and el['hour_start'] in map_hour_slots[el['date__week_day']] and \
-                el['hour_end'] in map_hour_slots[el['date__week_day']][el['hour_start']]:
-            el['legal_duration'] = map_hour_slots[el['date__week_day']][el['hour_start']][el['hour_end']]
-        else:
-            el['legal_duration'] = datetime.datetime.combine(datetime.date.min, el['hour_end']) - \
-                                   datetime.datetime.combine(datetime.date.min, el['hour_start'])
-
-    total = 0
-    for el in assignments:
-        total += el['legal_duration'].seconds
-    return int(total / 3600)
+    return SECRETARY in get_roles_from_user(user)
 
 
 def assign_html_style_to_visible_forms_fields(form):
@@ -1,3 +1,4 @@
+import numpy as np
 import pandas as pd
 import datetime
 
@@ -7,7 +8,8 @@ from django.utils.translation import gettext_lazy as _
 from rest_pandas import PandasSimpleView, PandasExcelRenderer
 from timetable import utils
 from timetable.permissions import SchoolAdminCanWriteDelete
-from timetable.models import HourSlot, Assignment, Teacher, Course, Room
+from timetable.models import HourSlot, Assignment, Teacher, Course, Room, DAYS_OF_WEEK
+from timetable.room_usage import RoomUsage
 
 days_of_week = ['Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday']
 
@@ -23,6 +25,103 @@ labels = {
         }
 
 
+class TimetableReportBuilder:
+    """
+    Builds the timetable of a week (of a teacher, a course, a room or of the whole school) shown in the Excel reports,
+    or the ones of some consecutive weeks.
+    The assignments are read with a single query, as a flat projection of their fields and of the ones of the related
+    subject, course, teacher and room, and they are pivoted into the grid of the report.
+    The hours of the grid are the ones of the hour slots of the school year, plus the ones of the lectures held at
+    other hours (special hour slots).
+    """
+    fields = ['teacher', 'date', 'hour_start', 'hour_end', 'bes', 'co_teaching', 'subject__name', 'course__year',
+              'course__section', 'teacher__first_name', 'teacher__last_name', 'room__name']
+
+    def __init__(self, school, school_year, monday_date, weeks=1, **filters):
+        """
+        :param weeks: number of weeks of the report, starting from the one of monday_date
+        :param filters: the filters of the assignments of the report (e.g. teacher=1)
+        """
+        self.mondays = [monday_date + datetime.timedelta(weeks=week) for week in range(weeks)]
+        end_date = self.mondays[-1] + datetime.timedelta(days=6)
+        self.assignments = pd.DataFrame.from_records(list(
+            Assignment.objects.filter(school=school, course__school_year=school_year, date__gte=monday_date,
+                                      date__lte=end_date, **filters)
+            .order_by('date', 'hour_start', 'hour_end', 'teacher__last_name', 'teacher__first_name', 'course__year',
+                      'course__section')
+            .values_list(*self.fields)), columns=self.fields)
+        self.assignments['day_of_week'] = pd.to_datetime(self.assignments['date']).dt.weekday
+        self.assignments['day'] = self.assignments['day_of_week'].map(dict(enumerate(days_of_week)))
+
+        hour_slots = HourSlot.objects.filter(school=school, school_year=school_year) \
+            .values_list('starts_at', 'ends_at').distinct()
+        self.hours = sorted(set(hour_slots) | set(zip(self.assignments['hour_start'], self.assignments['hour_end'])))
+
+    def get_teacher(self):
+        return self.assignments['teacher__first_name'] + " " + self.assignments['teacher__last_name']
+
+    def get_course(self):
+        return self.assignments['course__year'].astype(str) + " " + self.assignments['course__section']
+
+    def get_lecture(self):
+        """
+        :return: the subject of every lecture, or the kind of the lecture for B.E.S. and co-teaching.
+        """
+        return self.assignments['subject__name'] \
+            .mask(self.assignments['co_teaching'].astype(bool), str(_('Co-teaching'))) \
+            .mask(self.assignments['bes'].astype(bool), str(_('B.E.S.')))
+
+    def get_week_grid(self, text):
+        """
+        :param text: a Series with the text of every assignment
+        :return: a DataFrame with a row for every hour (hour_start, hour_end) and a column for every day of the week.
+                 The lectures held at the same time are on different lines of the cell.
+        """
+        grid = self.assignments.assign(text=text) \
+            .pivot_table(index=['hour_start', 'hour_end'], columns='day', values='text', aggfunc="\n".join) \
+            .reindex(index=pd.MultiIndex.from_tuples(self.hours, names=['hour_start', 'hour_end']),
+                     columns=days_of_week) \
+            .fillna('')
+        # Set the hour format to hh:mm, and both the index and the columns with reasonable human-readable names.
+        grid.index = pd.MultiIndex.from_tuples(
+            [(hour_start.strftime('%H:%M'), hour_end.strftime('%H:%M')) for hour_start, hour_end in self.hours],
+            names=[str(labels['hour_start']), str(labels['hour_end'])])
+        grid.columns = [str(labels[day]) for day in days_of_week]
+        return grid
+
+    def get_general_grid(self, text, monday_date=None):
+        """
+        :param text: a Series with the text of every assignment
+        :param monday_date: the week of the grid, when the report has more weeks
+        :return: a DataFrame with a row for every teacher (by last and first name), and a column for every hour of
+                 every day of the week (numbered from 1). The lectures held at the same time are on different lines of
+                 the cell.
+        """
+        lectures = self.assignments.assign(text=text)
+        lectures = lectures[lectures['day_of_week'] < len(days_of_week)]
+        if monday_date is not None:
+            lectures = lectures[(lectures['date'] >= monday_date) &
+                                (lectures['date'] <= monday_date + datetime.timedelta(days=6))]
+        # The cell of a lecture is found with a dict from the teacher to the row, and one from the hours of the
+        # lecture to the column (in the day).
+        teachers = sorted(set(zip(lectures['teacher__last_name'], lectures['teacher__first_name'],
+                                  lectures['teacher'])))
+        rows = {teacher: i for i, (last_name, first_name, teacher) in enumerate(teachers)}
+        columns = {hours: i for i, hours in enumerate(self.hours)}
+        cells = np.full((len(teachers), len(days_of_week) * len(self.hours)), '', dtype=object)
+        for teacher, day_of_week, hour_start, hour_end, lecture in zip(
+                lectures['teacher'], lectures['day_of_week'], lectures['hour_start'], lectures['hour_end'],
+                lectures['text']):
+            row, column = rows[teacher], day_of_week * len(self.hours) + columns[(hour_start, hour_end)]
+            cells[row, column] = lecture if cells[row, column] == '' else cells[row, column] + "\n" + lecture
+
+        return pd.DataFrame(
+            cells,
+            index=["{} {}".format(first_name, last_name) for last_name, first_name, teacher in teachers],
+            columns=pd.MultiIndex.from_product([[str(labels[day]) for day in days_of_week],
+                                                [str(hour + 1) for hour in range(len(self.hours))]]))
+
+
 class TimetableTeacherCSVReportViewSet(PandasSimpleView):
     queryset = Teacher.objects.none()  # needed to avoid throwing errors
     permission_classes = [IsAuthenticated, SchoolAdminCanWriteDelete]  # In the meantime only school admin.
@@ -40,7 +139,6 @@ class TimetableTeacherCSVReportViewSet(PandasSimpleView):
             # TODO: maybe it is better to get Monday date here,
             # rather than letting JS doing the job and giving it for granted?
             monday_date = datetime.datetime.strptime(kwargs.get('monday_date'), '%Y-%m-%d').date()
-            end_date = monday_date + datetime.timedelta(days=6)
             school = utils.get_school_from_user(self.request.user)
         except ValueError:
             return []
@@ -48,48 +146,8 @@ class TimetableTeacherCSVReportViewSet(PandasSimpleView):
         self.teacher = Teacher.objects.get(pk=teacher_pk)
         self.monday_date = monday_date
 
-        hour_slots = HourSlot.objects.filter(school=school, school_year=school_year)
-        hours_hour_slots = hour_slots.extra(
-            select={
-                'hour_start': 'starts_at',
-                'hour_end': 'ends_at'
-            }
-        ).order_by('hour_start', 'hour_end').values('hour_start', 'hour_end').distinct()
-        assignments = Assignment.objects.filter(school=school, course__school_year=school_year, teacher=teacher_pk,
-                                                date__gte=monday_date, date__lte=end_date)
-        hours_assign = assignments.order_by('hour_start', 'hour_end').values('hour_start', 'hour_end').distinct()
-
-        hours_list = [h for h in hours_hour_slots]
-
-        for h in hours_assign:
-            if h not in hours_list:
-                hours_list.append(h)
-
-        queryset = sorted(hours_list, key=lambda x: (x['hour_start'], x['hour_end']))
-
-        for i in queryset:
-            i.update({j: '' for j in days_of_week})
-
-        for assign in assignments:
-            for hour in queryset:
-                if hour['hour_start'] == assign.hour_start and \
-                        hour['hour_end'] == assign.hour_end:
-                    day_of_week = days_of_week[assign.date.weekday()]
-                    hour[day_of_week] = "{} - {} {}".format(str(assign.subject),
-                                                            str(assign.course.year), str(assign.course.section))
-                    break
-
-        df = pd.DataFrame(queryset)
-        # Set the hour format to hh:mm
-        df['hour_start'] = df['hour_start'].apply(lambda x: x.strftime('%H:%M'))
-        df['hour_end'] = df['hour_end'].apply(lambda x: x.strftime('%H:%M'))
-        # Set the index for the df to hour_start and hour_end, so that we can drop the counter of rows.
-        df.set_index(['hour_start', 'hour_end'], inplace=True)
-        # Rename both the index and the columns with reasonable human-readable names.
-        df.rename(labels, inplace=True)
-        df.index.rename(["".join(labels['hour_start']), "".join(labels['hour_end'])], inplace=True)
-
-        return df
+        builder = TimetableReportBuilder(school, school_year, monday_date, teacher=teacher_pk)
+        return builder.get_week_grid(builder.assignments['subject__name'] + " - " + builder.get_course())
 
 
 class TimetableCourseCSVReportViewSet(PandasSimpleView):
@@ -107,7 +165,6 @@ class TimetableCourseCSVReportViewSet(PandasSimpleView):
             school_year = kwargs.get('school_year_pk')
             course_pk = self.kwargs.get('course_pk')
             monday_date = datetime.datetime.strptime(kwargs.get('monday_date'), '%Y-%m-%d').date()
-            end_date = monday_date + datetime.timedelta(days=6)
             school = utils.get_school_from_user(self.request.user)
         except ValueError:
             return []
@@ -115,61 +172,10 @@ class TimetableCourseCSVReportViewSet(PandasSimpleView):
         self.course = Course.objects.get(pk=course_pk)
         self.monday_date = monday_date
 
-        hour_slots = HourSlot.objects.filter(school=school, school_year=school_year)
-        hours_hour_slots = hour_slots.extra(
-            select={
-                'hour_start': 'starts_at',
-                'hour_end': 'ends_at'
-            }
-        ).order_by('hour_start', 'hour_end').values('hour_start', 'hour_end').distinct()
-        assignments = Assignment.objects.filter(school=school, course__school_year=school_year, course=course_pk,
-                                                date__gte=monday_date, date__lte=end_date)
-        hours_assign = assignments.order_by('hour_start', 'hour_end').values('hour_start', 'hour_end').distinct()
-
-        hours_list = [h for h in hours_hour_slots]
-
-        for h in hours_assign:
-            if h not in hours_list:
-                hours_list.append(h)
-
-        queryset = sorted(hours_list, key=lambda x: (x['hour_start'], x['hour_end']))
-
-        for i in queryset:
-            i.update({j: '' for j in days_of_week})
-
-        for assign in assignments:
-            for hour in queryset:
-                if hour['hour_start'] == assign.hour_start and \
-                        hour['hour_end'] == assign.hour_end:
-                    day_of_week = days_of_week[assign.date.weekday()]
-
-                    if assign.bes:
-                        assignment_text = _('B.E.S.')
-                    elif assign.co_teaching:
-                        assignment_text = _('Co-teaching')
-                    else:
-                        assignment_text = str(assign.subject)
-
-                    assignment_text += " - " + str(assign.teacher)
-                    if assign.room:
-                        assignment_text += " (" + assign.room.name + ")"
-
-                    if hour[day_of_week] != '':
-                        hour[day_of_week] += "\n"
-                    hour[day_of_week] += assignment_text
-                    break
-
-        df = pd.DataFrame(queryset)
-        # Set the hour format to hh:mm
-        df['hour_start'] = df['hour_start'].apply(lambda x: x.strftime('%H:%M'))
-        df['hour_end'] = df['hour_end'].apply(lambda x: x.strftime('%H:%M'))
-        # Set the index for the df to hour_start and hour_end, so that we can drop the counter of rows.
-        df.set_index(['hour_start', 'hour_end'], inplace=True)
-        # Rename both the index and the columns with reasonable human-readable names.
-        df.rename(labels, inplace=True)
-        df.index.rename(["".join(labels['hour_start']), "".join(labels['hour_end'])], inplace=True)
-
-        return df
+        builder = TimetableReportBuilder(school, school_year, monday_date, course=course_pk)
+        rooms = builder.assignments['room__name']
+        return builder.get_week_grid(builder.get_lecture() + " - " + builder.get_teacher() +
+                                     (" (" + rooms + ")").where(rooms.notna(), ''))
 
 
 class TimetableRoomCSVReportViewSet(PandasSimpleView):
@@ -185,78 +191,17 @@ class TimetableRoomCSVReportViewSet(PandasSimpleView):
             school_year = kwargs.get('school_year_pk')
             room_pk = self.kwargs.get('room_pk')
             monday_date = datetime.datetime.strptime(kwargs.get('monday_date'), '%Y-%m-%d').date()
-            end_date = monday_date + datetime.timedelta(days=6)
             school = utils.get_school_from_user(self.request.user)
         except ValueError:
             return []
 
         self.room = Room.objects.get(pk=room_pk)
-        self.monday_date = monday_date
-        if self.monday_date.weekday() != 0:   # Monday is the weekday 0
-            # Set the Monday date to the smaller closest Monday.
-            # Correct accordingly the end_date.
-            self.monday_date -= datetime.timedelta(days=self.monday_date.weekday())
-            end_date = self.monday_date + datetime.timedelta(days=6)
-
-        hour_slots = HourSlot.objects.filter(school=school, school_year=school_year)
-        hours_hour_slots = hour_slots.extra(
-            select={
-                'hour_start': 'starts_at',
-                'hour_end': 'ends_at'
-            }
-        ).order_by('hour_start', 'hour_end').values('hour_start', 'hour_end').distinct()
-        assignments = Assignment.objects.filter(school=school, course__school_year=school_year, room=room_pk,
-                                                date__gte=monday_date, date__lte=end_date)
-
-        # In case we have special hours slots: take the assignments of the current week, and check that
-        # all the related hour_slots appear in hours_list
-        hours_assign = assignments.order_by('hour_start', 'hour_end').values('hour_start', 'hour_end').distinct()
-
-        hours_list = [h for h in hours_hour_slots]
-
-        for h in hours_assign:
-            if h not in hours_list:
-                # Add special hour slots.
-                hours_list.append(h)
-
-        queryset = sorted(hours_list, key=lambda x: (x['hour_start'], x['hour_end']))
-
-        for i in queryset:
-            i.update({j: '' for j in days_of_week})
-
-        for assign in assignments:
-            for hour in queryset:
-                if hour['hour_start'] == assign.hour_start and \
-                        hour['hour_end'] == assign.hour_end:
-                    day_of_week = days_of_week[assign.date.weekday()]
-
-                    if assign.bes:
-                        assignment_text = _('B.E.S.')
-                    elif assign.co_teaching:
-                        assignment_text = _('Co-teaching')
-                    else:
-                        assignment_text = str(assign.subject)
-
-                    assignment_text += " - {} - {} {}".format(str(assign.teacher),
-                                                              str(assign.course.year), str(assign.course.section))
-
-                    if hour[day_of_week] != '':
-                        # In case we already have more than one lecture, add a newline.
-                        hour[day_of_week] += "\n"
-                    hour[day_of_week] += assignment_text
-                    break
-
-        df = pd.DataFrame(queryset)
-        # Set the hour format to hh:mm
-        df['hour_start'] = df['hour_start'].apply(lambda x: x.strftime('%H:%M'))
-        df['hour_end'] = df['hour_end'].apply(lambda x: x.strftime('%H:%M'))
-        # Set the index for the df to hour_start and hour_end, so that we can drop the counter of rows.
-        df.set_index(['hour_start', 'hour_end'], inplace=True)
-        # Rename both the index and the columns with reasonable human-readable names.
-        df.rename(labels, inplace=True)
-        df.index.rename(["".join(labels['hour_start']), "".join(labels['hour_end'])], inplace=True)
+        # Set the Monday date to the smaller closest Monday (Monday is the weekday 0).
+        self.monday_date = monday_date - datetime.timedelta(days=monday_date.weekday())
 
-        return df
+        builder = TimetableReportBuilder(school, school_year, self.monday_date, room=room_pk)
+        return builder.get_week_grid(builder.get_lecture() + " - " + builder.get_teacher() + " - " +
+                                     builder.get_course())
 
 
 class GeneralTimetablePandasExcelRenderer(PandasExcelRenderer):
@@ -278,69 +223,59 @@ class TimetableGeneralCSVReportViewSet(PandasSimpleView):
         try:
             school_year = kwargs.get('school_year_pk')
             monday_date = datetime.datetime.strptime(kwargs.get('monday_date'), '%Y-%m-%d').date()
-            end_date = monday_date + datetime.timedelta(days=6)
             school = utils.get_school_from_user(self.request.user)
         except ValueError:
             return []
 
         self.monday_date = monday_date
 
-        hour_slots = HourSlot.objects.filter(school=school, school_year=school_year)
-        hours_hour_slots = hour_slots.extra(
-            select={
-                'hour_start': 'starts_at',
-                'hour_end': 'ends_at'
-            }
-        ).order_by('hour_start', 'hour_end').values('hour_start', 'hour_end').distinct()
-        assignments = Assignment.objects.filter(school=school, course__school_year=school_year,
-                                                date__gte=monday_date, date__lte=end_date). \
-            order_by('teacher__last_name', 'teacher__first_name')
-        hours_assign = assignments.order_by('hour_start', 'hour_end').values('hour_start', 'hour_end').distinct()
-
-        hours_list = [h for h in hours_hour_slots]
-
-        for h in hours_assign:
-            if h not in hours_list:
-                hours_list.append(h)
-
-        nr_teachers = assignments.values('teacher__id').distinct()
-        queryset = [{} for i in nr_teachers]
-
-        dow_with_hour_slots = [d + "_" + str(i) for d in days_of_week for i in range(len(hours_list))]
-        for i in queryset:
-            i.update({j: '' for j in dow_with_hour_slots})
-
-        teacher_id, teacher_idx = None, -1
-        for assign in assignments:
-            if teacher_id != assign.teacher.id:
-                teacher_id = assign.teacher.id
-                teacher_idx += 1
-                queryset[teacher_idx]['teacher'] = str(assign.teacher)
-
-            hs = {
-                'hour_start': assign.hour_start,
-                'hour_end': assign.hour_end
-            }
-            hs_idx = hours_list.index(hs)
-
-            field = days_of_week[assign.date.weekday()] + "_" +  str(hs_idx)
-            queryset[teacher_idx][field] = "{} {}".format(str(assign.course.year), assign.course.section)
-
-        df = pd.DataFrame(queryset)
-        # Set the index for the df to teacher, so that we can drop the counter of rows.
-        df.set_index(['teacher'], inplace=True)
-        # Create subcolumns, so that the dow will be the super column of the hours
-        df.columns = pd.MultiIndex.from_tuples([c.split('_') for c in df.columns])
-        # Rename both the index and the columns with reasonable human-readable names.
-        general_labels = {
-            'teacher': _('Teacher')
-        }
-        general_labels.update(labels)
-        for i in range(len(hours_list)):
-            general_labels.update({str(i): str(i + 1)})
-        df.rename(columns=general_labels, inplace=True)
+        builder = TimetableReportBuilder(school, school_year, monday_date)
+        return builder.get_general_grid(builder.get_course())
 
-        return df
+
+class GeneralTimetableWeeksPandasExcelRenderer(GeneralTimetablePandasExcelRenderer):
+    """
+    Writes the general timetables of some weeks in a single workbook, with a sheet for every week: the first level of
+    the index of the data is the week.
+    """
+    def render_dataframe(self, data, name, *args, **kwargs):
+        if not isinstance(data.index, pd.MultiIndex):
+            return super().render_dataframe(data, name, *args, **kwargs)
+        with pd.ExcelWriter(args[0]) as writer:
+            for week in data.index.levels[0]:
+                data[data.index.get_level_values(0) == week].droplevel(0) \
+                    .to_excel(writer, sheet_name=week, **kwargs)
+
+
+class TimetableGeneralWeeksCSVReportViewSet(TimetableGeneralCSVReportViewSet):
+    """
+    The general timetables of some consecutive weeks, starting from the one of the given Monday.
+    """
+    renderer_classes = [GeneralTimetableWeeksPandasExcelRenderer]
+    # The assignments of all the weeks are read at once: their number is bounded.
+    MAX_WEEKS = 53
+
+    def get_pandas_filename(self, request, format):
+        return _("General") + " - " + self.monday_date.strftime("%d-%m-%Y") + " - " + \
+            self.end_date.strftime("%d-%m-%Y")
+
+    def get_data(self, request, *args, **kwargs):
+        try:
+            school_year = kwargs.get('school_year_pk')
+            monday_date = datetime.datetime.strptime(kwargs.get('monday_date'), '%Y-%m-%d').date()
+            weeks = min(max(int(kwargs.get('weeks')), 1), self.MAX_WEEKS)
+            school = utils.get_school_from_user(self.request.user)
+        except ValueError:
+            return []
+
+        # Set the Monday date to the smaller closest Monday (Monday is the weekday 0).
+        self.monday_date = monday_date - datetime.timedelta(days=monday_date.weekday())
+        self.end_date = self.monday_date + datetime.timedelta(weeks=weeks, days=-1)
+
+        builder = TimetableReportBuilder(school, school_year, self.monday_date, weeks=weeks)
+        text = builder.get_course()
+        # The weeks are the sheets of the workbook, in the renderer.
+        return pd.concat({monday.isoformat(): builder.get_general_grid(text, monday) for monday in builder.mondays})
 
 
 class SubstitutionsCSVReportViewSet(PandasSimpleView):
@@ -400,3 +335,44 @@ class SubstitutionsCSVReportViewSet(PandasSimpleView):
         df.rename(columns=subst_labels, inplace=True)
 
         return df
+
+
+class RoomUsagePandasExcelRenderer(PandasExcelRenderer):
+    def get_pandas_kwargs(self, data, renderer_context):
+        return {'index_label': [_('Room'), '']}
+
+
+class RoomUsageCSVReportViewSet(PandasSimpleView):
+    """
+    Occupancy and capacity pressure (in percentage) of every room, for every time of the week, over an interval of
+    dates (see room_usage.RoomUsage).
+    """
+    renderer_classes = [RoomUsagePandasExcelRenderer]
+    queryset = Room.objects.none()  # needed to avoid throwing errors
+    permission_classes = [IsAuthenticated, SchoolAdminCanWriteDelete]    # In the meantime only school admin.
+
+    def get_pandas_filename(self, request, format):
+        return _("Rooms usage") + " - " + self.from_date.strftime("%d-%m-%Y") + " - " + \
+            self.to_date.strftime("%d-%m-%Y")
+
+    def get_data(self, request, *args, **kwargs):
+        try:
+            school_year = int(kwargs.get('school_year_pk'))
+            self.from_date = datetime.datetime.strptime(kwargs.get('from'), '%Y-%m-%d').date()
+            self.to_date = datetime.datetime.strptime(kwargs.get('to'), '%Y-%m-%d').date()
+            school = utils.get_school_from_user(self.request.user)
+        except ValueError:
+            return []
+
+        usage = RoomUsage(school.id, school_year, self.from_date, self.to_date)
+        # A row for every room and measure (its occupancy, then its capacity pressure), a column for every time.
+        values = np.stack([usage.occupancy.to_numpy(), usage.pressure.to_numpy()], axis=1) \
+            .reshape(2 * len(usage.rooms), len(usage.times))
+        df = pd.DataFrame((values * 100).round(1),
+                          index=pd.MultiIndex.from_product([usage.rooms['name'].tolist(),
+                                                            [str(_('Occupancy')), str(_('Capacity pressure'))]]))
+        df.columns = pd.MultiIndex.from_tuples([
+            (str(DAYS_OF_WEEK[day_of_week][1]), "{} - {}".format(hour_start.strftime('%H:%M'),
+                                                                 hour_end.strftime('%H:%M')))
+            for day_of_week, hour_start, hour_end in usage.times], names=['', ''])
+        return df
@@ -5,12 +5,12 @@ from abc import ABCMeta
 from django.contrib.auth.mixins import UserPassesTestMixin, LoginRequiredMixin
 from django.core.exceptions import ObjectDoesNotExist
 from django.core.mail import send_mail
+from django.db import transaction
 from django.db.models import Q, Count
 from django.shortcuts import render, redirect, reverse
 from django.template.loader import render_to_string
 from django.utils.html import strip_tags
 from django.utils.translation import get_language_from_request
-from django.forms.models import model_to_dict
 
 from django.views.generic import TemplateView
 from django.views.generic.base import RedirectView
@@ -32,8 +32,15 @@ from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph,
 from timetable.mixins import AdminSchoolPermissionMixin, SuperUserPermissionMixin, TeacherPermissionMixin, SecretaryPermissionMixin, \
     AdminSchoolOrSecretaryPermissionMixin
 from timetable.models import School, MyUser, Teacher, AdminSchool, SchoolYear, Course, HourSlot, AbsenceBlock, Holiday, \
-    Stage, Subject, HoursPerTeacherInClass, Assignment, Room
+    Stage, Subject, HoursPerTeacherInClass, Assignment, Room, RecurringAssignment
 from timetable import utils
+from timetable.replication import ReplicationConflictEngine, ReplicationWriter
+from timetable.substitutions import SubstitutionScores, AbsencePlanner
+from timetable.generator import TimetableData, TimetableSearch, write_assignments, assign_rooms, \
+    get_lectures_without_room, DEFAULT_ITERATIONS
+from timetable.week_state import get_week_state
+from timetable.room_usage import RoomUsage
+from timetable.recurring import get_occurrences
 from timetable.serializers import ReplicationConflictsSerializer, AssignmentSerializer, SubstitutionSerializer
 from timetable.views.CRUD_views import TemplateViewWithSchoolYears
 
@@ -96,63 +103,12 @@ class WeekReplicationConflictWrapperView(UserPassesTestMixin, View, metaclass=AB
             to_date: date of end of interval
             check_course_conflicts: bool to decide if course conflicts should be reported or not
         """
-        course_conflicts = Assignment.objects.none()
-        teacher_conflicts = Assignment.objects.none()
-        room_conflicts = Assignment.objects.none()
-
-        # Define all the possible assignments that can conflict with the replicating assignments
-        # we exclude at the beginning the assignments already replicated, in order to avoid false conflicts
-        possible_conflicts = Assignment.objects.filter(date__gte=from_date, date__lte=to_date)
-        non_conflicts_assign = []
-        for a in assignments_qs:
-            # Exclude lectures that are equivalent to the one that we want to replicate, since aren't conflicts
-            # but the same lecture already defined by the user
-            non_conflicts_assign += possible_conflicts.filter(school=a.school,
-                                                              school_year=a.school_year,
-                                                              course=a.course,
-                                                              teacher=a.teacher,
-                                                              subject=a.subject,
-                                                              # _week_day returns dates Sun-Sat (1,7), while weekday (Mon, Sun) (0,6)
-                                                              date__week_day=(a.date.weekday() + 2) % 7,
-                                                              hour_start=a.hour_start,
-                                                              hour_end=a.hour_end,
-                                                              bes=a.bes,
-                                                              co_teaching=a.co_teaching,
-                                                              absent=a.absent,
-                                                              substitution=a.substitution)\
-                                                        .values_list('id', flat=True).distinct()
-
-        possible_conflicts = possible_conflicts.exclude(id__in=non_conflicts_assign)
-
-        for a in assignments_qs:
-            # Return all assignments from the same course or teacher that would collide in the future.
-            # excluding the assignment in the url.
-            conflicts = possible_conflicts.filter(school=a.school,
-                                                  school_year=a.school_year,
-                                                  # _week_day returns dates Sun-Sat (1,7), while weekday (Mon, Sun) (0,6)
-                                                  date__week_day=(a.date.weekday() + 2) % 7,
-                                                  hour_start=a.hour_start)
-
-            if check_course_conflicts:
-                course_conflicts |= conflicts.filter(course=a.course)
-            teacher_conflicts |= conflicts.filter(teacher=a.teacher)
-
-            # Check both that the room is not null, and is the same as the current room!
-            conf_room = conflicts.filter(room__isnull=False, room=a.room, substitution=False)
-            # TODO: This will be super slow!
-            for date in conflicts.values_list('date').distinct():
-                # Select the distinct courses for the same date
-                distinct_course_in_date = conf_room.filter(date=date[0]).values_list('course', flat=True).distinct()
-                if a.room is not None and \
-                        a.course.id not in distinct_course_in_date and \
-                        distinct_course_in_date.count() >= a.room.capacity:
-                    # If there is a room in the current assignment,
-                    # the course is not one of the already present in the course
-                    # and the capacity of the room is filled, then: mark the room conflict.
-                    conf_rooms_in_conflicting_dates = conf_room.filter(date=date[0])
-                    room_conflicts |= conf_rooms_in_conflicting_dates
-
-        return course_conflicts, teacher_conflicts, room_conflicts
+        engine = ReplicationConflictEngine(assignments_qs, from_date, to_date)
+        course_conflicts, teacher_conflicts, room_conflicts = engine.get_conflicts(check_course_conflicts)
+
+        return Assignment.objects.filter(id__in=course_conflicts), \
+            Assignment.objects.filter(id__in=teacher_conflicts), \
+            Assignment.objects.filter(id__in=room_conflicts)
 
 
 class CheckWeekReplicationView(WeekReplicationConflictWrapperView):
@@ -203,13 +159,13 @@ class ReplicateWeekAssignmentsView(WeekReplicationConflictWrapperView):
         are in the correct school
         :return:
         """
-        assignments = self.request.POST.getlist('assignments[]')
+        assignments = set(self.request.POST.getlist('assignments[]'))
+        if not (utils.is_adminschool(self.request.user)):
+            return False
+        school = utils.get_school_from_user(self.request.user)
 
-        for assign in assignments:
-            if not (utils.is_adminschool(self.request.user) and Assignment.objects.filter(id=assign).exists() and
-                    Assignment.objects.get(id=assign).school == utils.get_school_from_user(self.request.user)):
-                return False
-        return True
+        # They should be in the same school of the admin and all of them should exist
+        return Assignment.objects.filter(id__in=assignments, school=school).count() == len(assignments)
 
     def post(self, request, *args, **kwargs):
         """
@@ -252,99 +208,24 @@ class ReplicateWeekAssignmentsView(WeekReplicationConflictWrapperView):
                                          context={'request': request}, many=True).data,
                     safe=False, status=400)
 
-            # Delete the assignments of that course in the specified period of time
-            school = utils.get_school_from_user(request.user)
-
-            assign_to_del = Assignment.objects.none()
-            if remove_extra_ass:
-                assign_to_del = Assignment.objects.filter(school=school,
-                                                          course=course_pk,
-                                                          school_year=school_year_pk,
-                                                          date__gte=from_date,
-                                                          date__lte=to_date). \
-                    exclude(id__in=assignments)  # avoid removing replicating assignments
-
-            assign_to_del.delete()
-
-            # Replicate the assignments
-            assignments_list_a, assignments_list_b = [], []
-            # Necessary to reassign the foreign key reference after the creation of the assignments_list_a of the assgnments in the assignments_list_b
-            link_assg_b_to_a = []
-            # Iterate only over non substitutions.
-            # In case we want to replicate them, then both substituted and substitution is going to be created
-            for a in assignments_qs.exclude(substitution=True):
-                d = from_date
-                while d <= to_date:
-                    if d != a.date and d.weekday() == a.date.weekday() and not \
-                            Holiday.objects.filter(school=a.school,
-                                                   school_year=a.school_year,
-                                                   date_end__gte=d,
-                                                   date_start__lte=d).exists() and not \
-                            Stage.objects.filter(school=a.school,
-                                                 school_year=a.school_year,
-                                                 date_start__lte=d,
-                                                 date_end__gte=d,
-                                                 course=a.course):
-                        # Found the correct day of the week when to duplicate the assignment
-                        # First we create the "substituted" or normal hour
-                        new_a = Assignment(
-                            teacher=a.teacher,
-                            course=a.course,
-                            subject=a.subject,
-                            room=a.room,
-                            hour_start=a.hour_start,
-                            hour_end=a.hour_end,
-                            bes=a.bes,
-                            co_teaching=a.co_teaching,
-                            substitution=a.substitution,
-                            substituted_assignment=a.substituted_assignment,
-                            absent=(False if without_substitutions else a.absent),
-                            date=d
-                        )
-                        new_a_dict = model_to_dict(new_a, exclude=['id'])
-                        # Add the new assignment only if is not already present
-                        if not Assignment.objects.filter(**new_a_dict).exists():
-                            assignments_list_a.append(new_a)
-
-                        if not without_substitutions and Assignment.objects.filter(
-                                substituted_assignment=a).exists():
-                            # If we want to replicate even the substitutions, then do it:
-                            substitution_ass = Assignment.objects.filter(substituted_assignment=a).first()
-                            new_a_substitution = Assignment(
-                                teacher=substitution_ass.teacher,
-                                course=substitution_ass.course,
-                                subject=substitution_ass.subject,
-                                room=substitution_ass.room,
-                                hour_start=substitution_ass.hour_start,
-                                hour_end=substitution_ass.hour_end,
-                                bes=substitution_ass.bes,
-                                co_teaching=substitution_ass.co_teaching,
-                                substitution=True,
-                                substituted_assignment=new_a,  # The newly created assignment.
-                                absent=substitution_ass.absent,
-                                date=d
-                            )
-                            new_a_substitution_dict = model_to_dict(new_a_substitution, exclude=['id'])
-                            # Add the new assignment only if is not already present
-                            if not Assignment.objects.filter(**new_a_substitution_dict).exists():
-                                assignments_list_b.append(new_a_substitution)
-                                link_assg_b_to_a.append(len(assignments_list_a) - 1)
-                    d += datetime.timedelta(days=1)
-
-            # Create in blocks: in the first one the new assignments that could even be substituted, 
-            # while in the second one only substitutions assignments. Divided in two due to reference constraints.
-            Assignment.objects.bulk_create(assignments_list_a)
-
-            # Fix the substituted_assignment foreign key after the just made creation, and create in blocks the substitution assignments
-            for b_idx in range(len(assignments_list_b)):
-                # Retrieve the created original assignment now knowing its pk, and re-assign it
-                a_idx = link_assg_b_to_a[b_idx]
-                created_assgn_a_dict = model_to_dict(assignments_list_a[a_idx], exclude=['id'])
-                created_assgn_a = Assignment.objects.get(**created_assgn_a_dict)
-                assignments_list_b[b_idx].substituted_assignment = created_assgn_a
-            # Create in blocks all the substitution assignments
-            Assignment.objects.bulk_create(assignments_list_b)
-            
+            with transaction.atomic():
+                # Delete the assignments of that course in the specified period of time
+                school = utils.get_school_from_user(request.user)
+
+                assign_to_del = Assignment.objects.none()
+                if remove_extra_ass:
+                    assign_to_del = Assignment.objects.filter(school=school,
+                                                              course=course_pk,
+                                                              school_year=school_year_pk,
+                                                              date__gte=from_date,
+                                                              date__lte=to_date). \
+                        exclude(id__in=assignments)  # avoid removing replicating assignments
+
+                assign_to_del.delete()
+
+                # Replicate the assignments
+                ReplicationWriter(assignments_qs, from_date, to_date, without_substitutions).replicate()
+
             return HttpResponse(status=201)
         except ObjectDoesNotExist:
             return HttpResponse(_("One of the Assignments specified doesn't exist"), 404)
@@ -379,16 +260,20 @@ class TeacherSubstitutionView(UserPassesTestMixin, View):
         a = Assignment.objects.get(id=self.kwargs.get('assignment_pk'),
                                    school=school.id)
 
-        teachers_list = utils.get_available_teachers(a, school)
+        teachers_list = list(utils.get_available_teachers(a, school))
 
         # Show all the other teachers (the ones that may be busy or have an absence block).
-        other_teachers = Teacher.objects.filter(school=school) \
-            .exclude(id__in=teachers_list.values('id')) \
-            .exclude(id=a.teacher.id)  # Exclude the teacher herself!
+        other_teachers = list(Teacher.objects.filter(school=school)
+                              .exclude(id__in=[t.id for t in teachers_list])
+                              .exclude(id=a.teacher_id))  # Exclude the teacher herself!
+
+        # Score all the candidates at once
+        scores = SubstitutionScores(a).get_scores(teachers_list + other_teachers)
 
         data = dict(available_teachers=teachers_list,
                     other_teachers=other_teachers)
-        serializer = SubstitutionSerializer(data=data, context={'request': request})
+        serializer = SubstitutionSerializer(data=data, context={'request': request, 'assignment': a,
+                                                                'substitution_scores': scores})
         serializer.is_valid()
         return JsonResponse(serializer.data)
 
@@ -453,6 +338,268 @@ class SubstituteTeacherApiView(UserPassesTestMixin, View):
         return HttpResponse(status=200)
 
 
+class AbsencePlannerApiView(UserPassesTestMixin, View):
+    """
+    Substitute all the lectures of the teachers that are absent in an interval of dates, at once.
+    The absent teacher is in the url, or the absent teachers are in the 'teachers[]' parameter (e.g. all the teachers
+    sick in a day).
+    GET returns the lectures to substitute, with the available teachers and a suggested substitute for each of them;
+    POST creates the substitutions in a single transaction: the ones given in the 'substitutions' parameter
+    (a JSON object id of the assignment -> id of the teacher), or the suggested ones when it is missing.
+    """
+    def get_teacher_ids(self):
+        if 'teacher_pk' in self.kwargs:
+            return [self.kwargs['teacher_pk']]
+        params = self.request.POST if self.request.method == 'POST' else self.request.GET
+        return [el for el in params.getlist('teachers[]') if el.isdigit()]
+
+    def test_func(self):
+        """
+        Returns True only when the user logged is an admin, and the absent teachers are in the same school.
+        :return:
+        """
+        school = utils.get_school_from_user(self.request.user)
+        teacher_ids = set(self.get_teacher_ids())
+        return utils.is_adminschool(self.request.user) and len(teacher_ids) > 0 and \
+            Teacher.objects.filter(id__in=teacher_ids, school=school).count() == len(teacher_ids)
+
+    def get_planner(self):
+        """
+        :return: the AbsencePlanner of the teachers and the interval given, or an HttpResponse with the error.
+        """
+        try:
+            from_date = datetime.datetime.strptime(self.kwargs.get('from'), '%Y-%m-%d').date()
+            to_date = datetime.datetime.strptime(self.kwargs.get('to'), '%Y-%m-%d').date()
+        except ValueError:
+            # Wrong format of date: yyyy-mm-dd
+            return HttpResponse(_('Wrong format of date: yyyy-mm-dd'), status=400)
+        if from_date > to_date:
+            return HttpResponse(_('The beginning of the period is greater then the end of the period'), status=400)
+        return AbsencePlanner(list(Teacher.objects.filter(id__in=self.get_teacher_ids())), from_date, to_date)
+
+    def get(self, request, *args, **kwargs):
+        planner = self.get_planner()
+        if isinstance(planner, HttpResponse):
+            return planner
+        suggestions = planner.plan()
+        assignments = AssignmentSerializer(planner.assignments, many=True, context={'request': request}).data
+        return JsonResponse({'assignments': [{
+            'assignment': assignment,
+            'available_teachers': [{'id': t, 'substitutions_made_so_far': planner.get_substitutions_made(t, a),
+                                    'adjacent_lectures': planner.adjacent_lectures.get((a.id, t), 0)}
+                                   for t in sorted(planner.available_teachers[a.id])],
+            'suggested_substitute': suggestions[a.id]
+        } for a, assignment in zip(planner.assignments, assignments)]})
+
+    def post(self, request, *args, **kwargs):
+        planner = self.get_planner()
+        if isinstance(planner, HttpResponse):
+            return planner
+        if 'substitutions' in request.POST:
+            try:
+                substitutions = {int(assignment): int(teacher)
+                                 for assignment, teacher in json.loads(request.POST['substitutions']).items()}
+            except (ValueError, TypeError, AttributeError):
+                return HttpResponse(_('The substitutions are not valid'), status=400)
+        else:
+            substitutions = {assignment: teacher for assignment, teacher in planner.plan().items()
+                             if teacher is not None}
+        try:
+            created = planner.substitute(substitutions)
+        except ValueError as e:
+            return HttpResponse(str(e), status=400)
+        return JsonResponse(AssignmentSerializer(created, many=True, context={'request': request}).data,
+                            safe=False, status=201)
+
+
+class GenerateTimetableApiView(UserPassesTestMixin, View):
+    """
+    Generate the weekly timetable of the school year (see timetable.generator), and write it as the assignments of
+    the week starting on the given monday.
+    POST parameters (all optional): iterations, seed, replace (delete the assignments of the courses already present in
+    the week) and dry_run (only generate the timetable).
+    A timetable with conflicts, or with normal lectures left without a room, is not written: the response is 409, with
+    the number of the conflicts and of the lectures without a room.
+    The search runs in the request, in this process: it stops after MAX_ITERATIONS moves or MAX_SECONDS seconds. The
+    longer searches (with many restarts and processes) are run by the generate_timetable command.
+    """
+    MAX_ITERATIONS = DEFAULT_ITERATIONS
+    MAX_SECONDS = 10
+
+    def test_func(self):
+        """
+        Returns True only when the user logged is an admin.
+        :return:
+        """
+        return utils.is_adminschool(self.request.user)
+
+    def post(self, request, *args, **kwargs):
+        try:
+            monday = datetime.datetime.strptime(kwargs.get('monday'), '%Y-%m-%d').date()
+        except ValueError:
+            # Wrong format of date: yyyy-mm-dd
+            return HttpResponse(_('Wrong format of date: yyyy-mm-dd'), status=400)
+        if monday.weekday() != 0:
+            return HttpResponse(_('The date is not a Monday'), status=400)
+        try:
+            iterations = min(int(request.POST.get('iterations', DEFAULT_ITERATIONS)), self.MAX_ITERATIONS)
+            seed = int(request.POST['seed']) if 'seed' in request.POST else None
+            replace = json.loads(request.POST.get('replace', 'false'))
+            dry_run = json.loads(request.POST.get('dry_run', 'false'))
+        except ValueError:
+            return HttpResponse(_('The parameters are not valid'), status=400)
+
+        school = utils.get_school_from_user(request.user)
+        data = TimetableData(school.id, kwargs.get('school_year_pk'))
+        solution = TimetableSearch(data, seed).run(iterations, time_limit=self.MAX_SECONDS)
+        rooms = assign_rooms(data, solution)
+        result = {'lectures': len(data),
+                  'hard_violations': solution.hard_violations,
+                  'without_room': len(get_lectures_without_room(data, rooms)),
+                  'soft_cost': solution.soft_cost,
+                  'created': 0}
+        if dry_run:
+            return JsonResponse(result, status=200)
+        if solution.hard_violations > 0 or result['without_room'] > 0:
+            # A timetable with conflicts is never written (nor the assignments of the week replaced)
+            return JsonResponse(result, status=409)
+        try:
+            result['created'] = len(write_assignments(data, solution, monday, replace=replace, rooms=rooms))
+        except ValueError as e:
+            return HttpResponse(str(e), status=400)
+        return JsonResponse(result, status=201)
+
+
+class DropTargetsApiView(UserPassesTestMixin, View):
+    """
+    Check at once all the hour slots of a week where a lecture can be dropped in the timetable grid, on the in-memory
+    state of the week (see week_state.WeekState).
+    GET parameters: teacher, course, room (optional), bes and co_teaching (optional), assignment (optional, the lecture
+    that is moved).
+    Only the hour slots of the HourSlotsGroup of the course are checked.
+    """
+    def test_func(self):
+        """
+        Returns True only when the user logged is an admin.
+        :return:
+        """
+        return utils.is_adminschool(self.request.user)
+
+    def get(self, request, *args, **kwargs):
+        try:
+            monday = datetime.datetime.strptime(kwargs.get('monday'), '%Y-%m-%d').date()
+            teacher = int(request.GET['teacher'])
+            course = int(request.GET['course'])
+            room = int(request.GET['room']) if request.GET.get('room') else None
+            assignment = int(request.GET['assignment']) if request.GET.get('assignment') else None
+            normal = not (json.loads(request.GET.get('bes', 'false')) or
+                          json.loads(request.GET.get('co_teaching', 'false')))
+        except (KeyError, ValueError):
+            return HttpResponse(_('The parameters are not valid'), status=400)
+        if monday.weekday() != 0:
+            return HttpResponse(_('The date is not a Monday'), status=400)
+
+        school = utils.get_school_from_user(request.user)
+        school_year = int(kwargs.get('school_year_pk'))
+        hour_slots_group = Course.objects.filter(id=course, school=school.id, school_year=school_year) \
+            .values_list('hour_slots_group', flat=True).first()
+        if hour_slots_group is None:
+            return HttpResponse(_('The parameters are not valid'), status=400)
+        state = get_week_state(school.id, school_year, monday)
+        return JsonResponse({'targets': [{
+            'hour_slot': hour_slot,
+            'date': date,
+            'hour_start': hour_start,
+            'hour_end': hour_end,
+            'conflicts': conflicts
+        } for hour_slot, date, hour_start, hour_end, conflicts in state.get_drop_targets(teacher, course,
+                                                                                       hour_slots_group, room, normal,
+                                                                                       assignment)]})
+
+
+class RoomUsageApiView(UserPassesTestMixin, View):
+    """
+    Occupancy and capacity pressure of every room of the school, for every time of the week, over an interval of dates
+    (e.g. the whole school year), see room_usage.RoomUsage.
+    The matrices have a row for every room and a column for every time of the week ('times').
+    """
+    def test_func(self):
+        """
+        Returns True only when the user logged is an admin.
+        :return:
+        """
+        return utils.is_adminschool(self.request.user)
+
+    def get(self, request, *args, **kwargs):
+        try:
+            from_date = datetime.datetime.strptime(kwargs.get('from'), '%Y-%m-%d').date()
+            to_date = datetime.datetime.strptime(kwargs.get('to'), '%Y-%m-%d').date()
+        except ValueError:
+            # Wrong format of date: yyyy-mm-dd
+            return HttpResponse(_('Wrong format of date: yyyy-mm-dd'), status=400)
+        if from_date > to_date:
+            return HttpResponse(_('The beginning of the period is greater then the end of the period'), status=400)
+
+        school = utils.get_school_from_user(request.user)
+        usage = RoomUsage(school.id, int(kwargs.get('school_year_pk')), from_date, to_date)
+        return JsonResponse({
+            'rooms': [{'id': room, 'name': name, 'capacity': capacity}
+                      for room, name, capacity in usage.rooms.itertuples()],
+            'times': [{'day_of_week': day_of_week, 'hour_start': hour_start, 'hour_end': hour_end}
+                      for day_of_week, hour_start, hour_end in usage.times],
+            'days': usage.days.tolist(),
+            'occupancy': usage.occupancy.round(4).values.tolist(),
+            'pressure': usage.pressure.round(4).values.tolist(),
+        })
+
+
+class RecurringOccurrencesApiView(UserPassesTestMixin, View):
+    """
+    The lectures of the recurring assignments of the school held in an interval of dates, expanded from the weekly
+    templates with their exceptions (see recurring.get_occurrences): the rows read don't depend on the number of weeks.
+    GET parameters: course and teacher (optional).
+    """
+    def test_func(self):
+        """
+        Returns True only when the user logged is an admin or a secretary.
+        :return:
+        """
+        return utils.is_adminschool(self.request.user) or utils.is_secretary(self.request.user)
+
+    def get(self, request, *args, **kwargs):
+        try:
+            from_date = datetime.datetime.strptime(kwargs.get('from'), '%Y-%m-%d').date()
+            to_date = datetime.datetime.strptime(kwargs.get('to'), '%Y-%m-%d').date()
+        except ValueError:
+            # Wrong format of date: yyyy-mm-dd
+            return HttpResponse(_('Wrong format of date: yyyy-mm-dd'), status=400)
+        if from_date > to_date:
+            return HttpResponse(_('The beginning of the period is greater then the end of the period'), status=400)
+
+        school = utils.get_school_from_user(request.user)
+        recurring_assignments = RecurringAssignment.objects.filter(school=school.id)
+        for param in ('course', 'teacher'):
+            if request.GET.get(param):
+                if not request.GET[param].isdigit():
+                    return HttpResponse(_('The parameters are not valid'), status=400)
+                recurring_assignments = recurring_assignments.filter(**{param: int(request.GET[param])})
+        return JsonResponse({'occurrences': [{
+            'recurring_assignment': o.recurring_assignment.id,
+            'date': o.date,
+            'hour_start': o.hour_start,
+            'hour_end': o.hour_end,
+            'teacher': {'id': o.teacher.id, 'first_name': o.teacher.first_name, 'last_name': o.teacher.last_name},
+            'course': {'id': o.course.id, 'year': o.course.year, 'section': o.course.section},
+            'subject': {'id': o.subject.id, 'name': o.subject.name},
+            'room': None if o.room is None else {'id': o.room.id, 'name': o.room.name},
+            'bes': o.bes,
+            'co_teaching': o.co_teaching,
+            'absent': o.absent,
+            'substitution': o.substitution,
+            'free_substitution': o.free_substitution
+        } for o in get_occurrences(recurring_assignments, from_date, to_date)]})
+
+
 class TimetableReportView(LoginRequiredMixin, AdminSchoolOrSecretaryPermissionMixin, TemplateView):
     template_name = 'timetable/timetable_report.html'
 
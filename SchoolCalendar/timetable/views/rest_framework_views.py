@@ -3,8 +3,14 @@ from rest_framework.viewsets import ModelViewSet, ViewSet, GenericViewSet
 from rest_framework.mixins import ListModelMixin, CreateModelMixin, RetrieveModelMixin, DestroyModelMixin, \
     UpdateModelMixin
 from rest_framework.permissions import IsAuthenticated
+from rest_framework.response import Response
+from rest_framework import status
 from django_filters.rest_framework import DjangoFilterBackend
 from django.core.exceptions import ObjectDoesNotExist
+from django.db.models import Q
+from django.utils.translation import gettext as _
+
+import datetime
 
 from timetable.models import School, MyUser, Teacher, AdminSchool, SchoolYear, Course, HourSlot, AbsenceBlock, Holiday, \
     Stage, Subject, HoursPerTeacherInClass, Assignment, Room, TeachersYearlyLoad, CoursesYearlyLoad, HourSlotsGroup
@@ -13,6 +19,7 @@ from timetable.serializers import TeacherSerializer, CourseYearOnlySerializer, C
     AbsenceBlockSerializer, TeacherSubstitutionSerializer, SubjectSerializer, ReplicationConflictsSerializer, \
     RoomSerializer, TeacherSummarySerializer, CourseSummarySerializer, TeachersYearlyLoadSerializer, \
     CoursesYearlyLoadSerializer, HourSlotsGroupSerializer, SubstitutionAssignmentSerializer
+from timetable.mixins import EagerLoadingMixin, WeekCacheMixin
 from timetable.permissions import SchoolAdminCanWriteDelete, TeacherCanView
 from timetable.filters import TeacherFromSameSchoolFilterBackend, HolidayPeriodFilter, QuerysetFromSameSchool, \
     StageFilter, HourSlotFilter, HoursPerTeacherInClassFilter, CourseSectionOnlyFilter, CourseYearOnlyFilter, \
@@ -22,6 +29,7 @@ from timetable.filters import TeacherFromSameSchoolFilterBackend, HolidayPeriodF
 from django.contrib.auth.mixins import UserPassesTestMixin, LoginRequiredMixin
 
 from timetable import utils
+from timetable.room_occupancy import get_room_occupancy
 
 
 class TeacherViewSet(RetrieveModelMixin, UpdateModelMixin, DestroyModelMixin, ListModelMixin, GenericViewSet):
@@ -49,7 +57,7 @@ class TeacherSummaryViewSet(RetrieveModelMixin, UpdateModelMixin, DestroyModelMi
         return Teacher.objects.filter(id__in=teachers_teaching_in_the_year)
 
 
-class TeachersYearlyLoadViewSet(RetrieveModelMixin, ListModelMixin, GenericViewSet):
+class TeachersYearlyLoadViewSet(EagerLoadingMixin, RetrieveModelMixin, ListModelMixin, GenericViewSet):
     queryset = TeachersYearlyLoad.objects.all()
     serializer_class = TeachersYearlyLoadSerializer
     permission_classes = [IsAuthenticated, SchoolAdminCanWriteDelete]
@@ -58,7 +66,7 @@ class TeachersYearlyLoadViewSet(RetrieveModelMixin, ListModelMixin, GenericViewS
     ordering = ['teacher__last_name', 'teacher__first_name']
 
 
-class CoursesYearlyLoadViewSet(RetrieveModelMixin, ListModelMixin, GenericViewSet):
+class CoursesYearlyLoadViewSet(EagerLoadingMixin, RetrieveModelMixin, ListModelMixin, GenericViewSet):
     queryset = CoursesYearlyLoad.objects.all()
     serializer_class = CoursesYearlyLoadSerializer
     permission_classes = [IsAuthenticated, SchoolAdminCanWriteDelete]
@@ -83,7 +91,7 @@ class CourseSummaryViewSet(RetrieveModelMixin, UpdateModelMixin, DestroyModelMix
         return Course.objects.all()
 
 
-class AbsenceBlockViewSet(ListModelMixin, GenericViewSet):
+class AbsenceBlockViewSet(EagerLoadingMixin, ListModelMixin, GenericViewSet):
     queryset = AbsenceBlock.objects.all()
     serializer_class = AbsenceBlockSerializer
     permission_classes = [IsAuthenticated, SchoolAdminCanWriteDelete]
@@ -145,7 +153,7 @@ class HolidayViewSet(RetrieveModelMixin, UpdateModelMixin, DestroyModelMixin, Li
     ordering = ['date_start', 'name']
 
 
-class StageViewSet(ListModelMixin, GenericViewSet):
+class StageViewSet(EagerLoadingMixin, ListModelMixin, GenericViewSet):
     queryset = Stage.objects.all()
     serializer_class = StageSerializer
     permission_classes = [IsAuthenticated, SchoolAdminCanWriteDelete]
@@ -172,8 +180,8 @@ class HourSlotViewSet(RetrieveModelMixin, UpdateModelMixin, DestroyModelMixin, L
     ordering = ['day_of_week', 'starts_at']
 
 
-class HoursPerTeacherInClassViewSet(RetrieveModelMixin, UpdateModelMixin, DestroyModelMixin, ListModelMixin,
-                                    GenericViewSet):
+class HoursPerTeacherInClassViewSet(EagerLoadingMixin, RetrieveModelMixin, UpdateModelMixin, DestroyModelMixin,
+                                    ListModelMixin, GenericViewSet):
     """
     Can accept as parameter in the url (start_date, end_date) a period of time where to compute
     the total hour missing for a teacher.
@@ -186,8 +194,8 @@ class HoursPerTeacherInClassViewSet(RetrieveModelMixin, UpdateModelMixin, Destro
     ordering = ['teacher__last_name', 'teacher__first_name', 'course__year', 'course__section', 'subject__name']
 
 
-class AssignmentViewSet(RetrieveModelMixin, UpdateModelMixin, DestroyModelMixin, ListModelMixin, CreateModelMixin,
-                        GenericViewSet):
+class AssignmentViewSet(WeekCacheMixin, EagerLoadingMixin, RetrieveModelMixin, UpdateModelMixin,
+                        DestroyModelMixin, ListModelMixin, CreateModelMixin, GenericViewSet):
     queryset = Assignment.objects.all()
     serializer_class = AssignmentSerializer
     permission_classes = [IsAuthenticated, SchoolAdminCanWriteDelete]
@@ -217,7 +225,7 @@ class AssignmentViewSet(RetrieveModelMixin, UpdateModelMixin, DestroyModelMixin,
         return super(AssignmentViewSet, self).destroy(request, *args, **kwargs)
 
 
-class TeacherAssignmentsViewSet(UserPassesTestMixin, ListModelMixin, GenericViewSet):
+class TeacherAssignmentsViewSet(EagerLoadingMixin, UserPassesTestMixin, ListModelMixin, GenericViewSet):
     queryset = Assignment.objects.all()
     serializer_class = AssignmentSerializer
     filter_backends = (DjangoFilterBackend, OrderingFilter, QuerysetFromSameSchool,)
@@ -253,7 +261,7 @@ class TeacherAssignmentsViewSet(UserPassesTestMixin, ListModelMixin, GenericView
                                          school_year=school_year)
 
 
-class AbsenceBlocksPerTeacherViewSet(UserPassesTestMixin, ListModelMixin, GenericViewSet):
+class AbsenceBlocksPerTeacherViewSet(EagerLoadingMixin, UserPassesTestMixin, ListModelMixin, GenericViewSet):
     queryset = AbsenceBlock.objects.all()
     serializer_class = AbsenceBlockSerializer
     filter_backends = (DjangoFilterBackend,)
@@ -291,20 +299,23 @@ class AbsenceBlocksPerTeacherViewSet(UserPassesTestMixin, ListModelMixin, Generi
                                            school_year=school_year)
 
 
-class TeacherTimetableViewSet(ListModelMixin, GenericViewSet):
+class TeacherTimetableViewSet(WeekCacheMixin, EagerLoadingMixin, ListModelMixin, GenericViewSet):
     queryset = Assignment.objects.all()
     serializer_class = AssignmentSerializer
     permission_classes = [IsAuthenticated, TeacherCanView]
     filter_backends = (DjangoFilterBackend, QuerysetFromSameSchool)
     filterset_class = AssignmentFilter
 
+    def get_week_scope(self, request):
+        return utils.TEACHER, request.user.id
+
     def get_queryset(self):
         # Return all assignments for a teacher in a given time period
         assignments = Assignment.objects.filter(teacher_id=self.request.user.id)
         return assignments
 
 
-class RoomTimetableViewSet(ListModelMixin, GenericViewSet):
+class RoomTimetableViewSet(WeekCacheMixin, EagerLoadingMixin, ListModelMixin, GenericViewSet):
     queryset = Assignment.objects.all()
     serializer_class = AssignmentSerializer
     permission_classes = [IsAuthenticated]
@@ -312,6 +323,9 @@ class RoomTimetableViewSet(ListModelMixin, GenericViewSet):
     filterset_class = AssignmentFilter
     lookup_url_kwarg = ['room_pk']
 
+    def get_week_scope(self, request):
+        return utils.ROOM, int(self.kwargs.get('room_pk'))
+
     def get_queryset(self):
         # Return all assignments for a room in a given time period
         room_pk = self.kwargs.get('room_pk')
@@ -319,10 +333,121 @@ class RoomTimetableViewSet(ListModelMixin, GenericViewSet):
         return assignments
 
 
-class SubstitutionAssignmentsViewSet(ListModelMixin, GenericViewSet):
+class SubstitutionAssignmentsViewSet(EagerLoadingMixin, ListModelMixin, GenericViewSet):
     queryset = Assignment.objects.filter(substitution=True)
     serializer_class = SubstitutionAssignmentSerializer
     filter_backends = (DjangoFilterBackend, OrderingFilter, QuerysetFromSameSchool,)
     filterset_class = SubstitutionAssignmentFilter
     ordering = ['-date', 'hour_start', 'hour_end', 'teacher__last_name', 'teacher__first_name',
                 'course__year', 'course__section', 'subject__name']
+
+
+class WeekBundleViewSet(ViewSet):
+    """
+    Everything the timetable page needs to show a week of a course, in a single response:
+    - the hour slots of the course, and the teachers of the course with their hours (hours_per_teacher_in_class);
+    - the assignments of the course, the holidays and the stages in the week;
+    - for every teacher of the course, the assignments in the week (in any course) and the absence blocks, which are
+      used to mark the conflicts when the teacher is chosen.
+    The school of the user is resolved once, and the assignments of the course and of its teachers are loaded
+    (and serialized) with a single queryset.
+    Query params: school_year, course and monday (YYYY-MM-DD), the first day of the week.
+    """
+    permission_classes = [IsAuthenticated, SchoolAdminCanWriteDelete]
+
+    def list(self, request):
+        school = utils.get_school_from_user(request.user)
+        school_year = request.query_params.get('school_year')
+        course = request.query_params.get('course')
+        monday = request.query_params.get('monday')
+        if not (school_year and school_year.isdigit() and course and course.isdigit() and monday and
+                utils.is_date_string_valid(monday)):
+            return Response(_('school_year, course and monday (YYYY-MM-DD) are required.'),
+                            status=status.HTTP_400_BAD_REQUEST)
+        course = Course.objects.filter(id=course, school=school, school_year=school_year) \
+            .select_related('hour_slots_group').first()
+        if course is None:
+            return Response(status=status.HTTP_404_NOT_FOUND)
+        from_date = datetime.datetime.strptime(monday, '%Y-%m-%d').date()
+        to_date = from_date + datetime.timedelta(days=6)
+        context = {'request': request, 'from_date': from_date, 'to_date': to_date}
+
+        hour_slots = HourSlot.objects.filter(hour_slots_group=course.hour_slots_group_id) \
+            .order_by(*HourSlotViewSet.ordering)
+        hours_per_teacher_in_class = list(
+            HoursPerTeacherInClass.objects.filter(school=school, school_year=school_year, course=course)
+            .select_related(*HoursPerTeacherInClassSerializer.select_related_fields)
+            .order_by(*HoursPerTeacherInClassViewSet.ordering))
+        teachers = {h.teacher_id for h in hours_per_teacher_in_class}
+
+        # The lectures of the course and the ones of its teachers (in any course of the school)
+        assignments = Assignment.objects.filter(Q(course=course) | Q(teacher__in=teachers),
+                                                school=school, school_year=school_year,
+                                                date__gte=from_date, date__lte=to_date) \
+            .select_related(*AssignmentSerializer.select_related_fields) \
+            .order_by(*AssignmentViewSet.ordering)
+        assignments = AssignmentSerializer(assignments, many=True, context=context).data
+        teacher_assignments = {teacher: [] for teacher in teachers}
+        for a in assignments:
+            if a['teacher']['id'] in teacher_assignments:
+                teacher_assignments[a['teacher']['id']].append(a)
+
+        absence_blocks = {teacher: [] for teacher in teachers}
+        for block in AbsenceBlockSerializer(
+                AbsenceBlock.objects.filter(teacher__in=teachers, school_year=school_year)
+                .select_related(*AbsenceBlockSerializer.select_related_fields), many=True, context=context).data:
+            absence_blocks[block['teacher']['id']].append(block)
+
+        holidays = Holiday.objects.filter(school=school, school_year=school_year,
+                                          date_start__lte=to_date, date_end__gte=from_date) \
+            .order_by(*HolidayViewSet.ordering)
+        stages = Stage.objects.filter(course=course, date_start__lte=to_date, date_end__gte=from_date) \
+            .select_related(*StageSerializer.select_related_fields).order_by(*StageViewSet.ordering)
+
+        return Response({
+            'hour_slots': HourSlotSerializer(hour_slots, many=True, context=context).data,
+            'hours_per_teacher_in_class': HoursPerTeacherInClassSerializer(hours_per_teacher_in_class, many=True,
+                                                                           context=context).data,
+            'assignments': [a for a in assignments if a['course']['id'] == course.id],
+            'teacher_assignments': teacher_assignments,
+            'absence_blocks': absence_blocks,
+            'holidays': HolidaySerializer(holidays, many=True, context=context).data,
+            'stages': StageSerializer(stages, many=True, context=context).data,
+        })
+
+
+class WeekFreeRoomsViewSet(ViewSet):
+    """
+    The free rooms of every hour slot of a week, in a single response, read from the occupancy of the rooms in the
+    week (see room_occupancy.RoomOccupancy).
+    Query params: school_year and monday (YYYY-MM-DD), the first day of the week. If the course is given, only its hour
+    slots are returned, and its lectures don't take a place in the rooms (as in RoomFilter).
+    """
+    permission_classes = [IsAuthenticated, SchoolAdminCanWriteDelete]
+
+    def list(self, request):
+        school = utils.get_school_from_user(request.user)
+        school_year = request.query_params.get('school_year')
+        course = request.query_params.get('course')
+        monday = request.query_params.get('monday')
+        if not (school_year and school_year.isdigit() and (not course or course.isdigit()) and monday and
+                utils.is_date_string_valid(monday)):
+            return Response(_('school_year and monday (YYYY-MM-DD) are required.'),
+                            status=status.HTTP_400_BAD_REQUEST)
+        monday = datetime.datetime.strptime(monday, '%Y-%m-%d').date()
+        if school is None or monday.weekday() != 0:
+            return Response(_('The week must start on a Monday.'), status=status.HTTP_400_BAD_REQUEST)
+
+        if course:
+            course = Course.objects.filter(id=course, school=school, school_year=school_year).first()
+            if course is None:
+                return Response(status=status.HTTP_404_NOT_FOUND)
+            hour_slots = HourSlot.objects.filter(hour_slots_group=course.hour_slots_group_id)
+        else:
+            hour_slots = HourSlot.objects.filter(hour_slots_group__school=school,
+                                                 hour_slots_group__school_year=school_year)
+        occupancy = get_room_occupancy(school.id, int(school_year), monday)
+        free_rooms = occupancy.get_week_free_rooms(hour_slots.values_list('day_of_week', 'starts_at', 'ends_at'),
+                                                   course.id if course else None)
+        return Response([{'date': date, 'hour_start': hour_start, 'hour_end': hour_end, 'rooms': rooms}
+                         for date, hour_start, hour_end, rooms in free_rooms])
@@ -0,0 +1,206 @@
+import datetime
+from collections import defaultdict
+
+from django.core.cache import cache
+
+from timetable.models import Assignment, HourSlot, AbsenceBlock, Room
+from timetable import utils
+
+
+# The reasons why a lecture can't be placed at a time.
+TEACHER_CONFLICT = 'teacher'
+COURSE_CONFLICT = 'course'
+ROOM_CONFLICT = 'room'
+ABSENCE_BLOCK = 'absence_block'
+
+
+class WeekState:
+    """
+    In-memory state of the assignments of a week of a school year, to check where a lecture can be placed without
+    reading the assignments again.
+    Every time of the week (day of the week, hour_start, hour_end) is a bit: the occupancy of every teacher, course
+    (normal lectures only: the BES and co-teaching ones are held during the lectures of the course) and room is a
+    bitmap of the times when it is busy (for a room, full), so "can I drop here?" is a few bit tests. The counters
+    behind the bitmaps let a lecture be added or removed as a delta (e.g. the lecture that is moved, see
+    get_drop_targets).
+    As in RoomOccupancy, a room is full when it hosts as many courses as its capacity (the lectures of the same course
+    don't count twice), and the lectures of the course that is placed don't take a place: for every room there is the
+    bitmap of the times when it is full, the one of the times when it hosts more courses than its capacity, and for
+    every course the bitmap of the times when it is in the room.
+    The state is not updated when the assignments are written: every write changes the versions of the week, and the
+    state is read again (see get_week_state).
+    As in AssignmentForm.clean, the lectures conflict when they are held in the same date at the same hours.
+    """
+
+    def __init__(self, monday, hour_slots, rooms, absence_blocks):
+        """
+        :param monday: first day of the week
+        :param hour_slots: iterable of (id, hour_slots_group, day_of_week, starts_at, ends_at) of the hour slots of
+                           the school year
+        :param rooms: dict id of the room -> capacity
+        :param absence_blocks: iterable of (teacher, day_of_week, starts_at, ends_at) of the absence blocks
+        """
+        self.monday = monday
+        self.times = {}
+        # id of the HourSlotsGroup -> list of (day_of_week, starts_at, ends_at, id) of its hour slots
+        self.hour_slots = defaultdict(list)
+        for hour_slot_id, hour_slots_group, *time in sorted(hour_slots, key=lambda hour_slot: hour_slot[2:]):
+            self.times.setdefault(tuple(time), len(self.times))
+            self.hour_slots[hour_slots_group].append((*time, hour_slot_id))
+        self.capacity = rooms
+        self.teachers = defaultdict(int)
+        self.courses = defaultdict(int)
+        self.full_rooms = defaultdict(int)
+        self.crowded_rooms = defaultdict(int)
+        # (room, course) -> bitmap of the times when the course has a lecture in the room
+        self.room_courses = defaultdict(int)
+        # (room, bit) -> number of the courses in the room at the time
+        self.courses_in_room = defaultdict(int)
+        self.blocked = defaultdict(int)
+        for teacher, *time in absence_blocks:
+            self.blocked[teacher] |= 1 << self.get_bit(*time)
+        # (kind, id, bit) -> number of lectures
+        self.counters = defaultdict(int)
+        # id of the assignment -> (teacher, course, room, bit, normal)
+        self.lectures = {}
+
+    @classmethod
+    def load(cls, school_id, school_year_id, monday):
+        """
+        Read the state of a week from the database, with a query for the hour slots, the rooms, the absence blocks and
+        the assignments.
+        """
+        hour_slots = HourSlot.objects.filter(hour_slots_group__school=school_id,
+                                             hour_slots_group__school_year=school_year_id)
+        state = cls(monday,
+                    hour_slots.values_list('id', 'hour_slots_group', 'day_of_week', 'starts_at', 'ends_at'),
+                    dict(Room.objects.filter(school=school_id).values_list('id', 'capacity')),
+                    AbsenceBlock.objects.filter(hour_slot__in=hour_slots)
+                    .values_list('teacher', 'hour_slot__day_of_week', 'hour_slot__starts_at', 'hour_slot__ends_at'))
+        for el in Assignment.objects.filter(school=school_id, school_year=school_year_id, date__gte=monday,
+                                            date__lte=monday + datetime.timedelta(days=6)) \
+                .values('id', 'teacher', 'course', 'room', 'date', 'hour_start', 'hour_end', 'bes', 'co_teaching'):
+            state.add(el['id'], el['teacher'], el['course'], el['room'], el['date'], el['hour_start'], el['hour_end'],
+                      normal=not (el['bes'] or el['co_teaching']))
+        return state
+
+    def get_bit(self, day_of_week, hour_start, hour_end):
+        """
+        :return: the bit of the time in the bitmaps (a time that is not of an hour slot gets a new bit)
+        """
+        return self.times.setdefault((day_of_week, hour_start, hour_end), len(self.times))
+
+    @staticmethod
+    def _set_bit(bitmaps, key, bit, value):
+        if value:
+            bitmaps[key] |= 1 << bit
+        else:
+            bitmaps[key] &= ~(1 << bit)
+
+    def _update(self, kind, key, bit, change):
+        """
+        Change the counter of the lectures of the teacher or course at the time, and its bitmap.
+        """
+        counter = (kind, key, bit)
+        self.counters[counter] += change
+        self._set_bit(self.teachers if kind == TEACHER_CONFLICT else self.courses, key, bit, self.counters[counter] > 0)
+
+    def _update_room(self, room, course, bit, change):
+        """
+        Change the counter of the lectures of the course in the room at the time, and the bitmaps of the room when the
+        course enters or leaves it.
+        """
+        counter = (ROOM_CONFLICT, room, course, bit)
+        self.counters[counter] += change
+        present = self.counters[counter] > 0
+        if present == bool(self.room_courses[(room, course)] & (1 << bit)):
+            return
+        self._set_bit(self.room_courses, (room, course), bit, present)
+        self.courses_in_room[(room, bit)] += 1 if present else -1
+        courses, capacity = self.courses_in_room[(room, bit)], self.capacity.get(room, 1)
+        self._set_bit(self.full_rooms, room, bit, courses >= capacity)
+        self._set_bit(self.crowded_rooms, room, bit, courses > capacity)
+
+    def add(self, assignment_id, teacher, course, room, date, hour_start, hour_end, normal=True):
+        """
+        Add a lecture held in the date (a day of the week) at the given hours.
+        """
+        self._add(assignment_id, teacher, course, room, self.get_bit(date.weekday(), hour_start, hour_end), normal)
+
+    def _add(self, assignment_id, teacher, course, room, bit, normal):
+        self.lectures[assignment_id] = (teacher, course, room, bit, normal)
+        self._update(TEACHER_CONFLICT, teacher, bit, 1)
+        if normal:
+            self._update(COURSE_CONFLICT, course, bit, 1)
+        if room is not None:
+            self._update_room(room, course, bit, 1)
+
+    def remove(self, assignment_id):
+        """
+        Remove a lecture.
+        :return: the (teacher, course, room, bit, normal) of the lecture removed, None if it is not in the week
+        """
+        lecture = self.lectures.pop(assignment_id, None)
+        if lecture is None:
+            return None
+        teacher, course, room, bit, normal = lecture
+        self._update(TEACHER_CONFLICT, teacher, bit, -1)
+        if normal:
+            self._update(COURSE_CONFLICT, course, bit, -1)
+        if room is not None:
+            self._update_room(room, course, bit, -1)
+        return lecture
+
+    def _conflicts(self, teacher, course, room, bit, normal):
+        mask = 1 << bit
+        conflicts = []
+        if self.teachers[teacher] & mask:
+            conflicts.append(TEACHER_CONFLICT)
+        if normal and self.courses[course] & mask:
+            conflicts.append(COURSE_CONFLICT)
+        if room is not None:
+            # The room is full for the course when it is full of other courses
+            present = self.room_courses[(room, course)]
+            if (self.full_rooms[room] & ~present | self.crowded_rooms[room] & present) & mask:
+                conflicts.append(ROOM_CONFLICT)
+        if self.blocked[teacher] & mask:
+            conflicts.append(ABSENCE_BLOCK)
+        return conflicts
+
+    def get_conflicts(self, teacher, course, room, date, hour_start, hour_end, normal=True):
+        """
+        :return: the list of the reasons why the lecture can't be held in the date at the given hours (empty when it
+                 can).
+        """
+        return self._conflicts(teacher, course, room, self.get_bit(date.weekday(), hour_start, hour_end), normal)
+
+    def get_drop_targets(self, teacher, course, hour_slots_group, room=None, normal=True, assignment_id=None):
+        """
+        Check all the hour slots of the week at once.
+        :param hour_slots_group: the HourSlotsGroup of the course, whose hour slots are checked
+        :param assignment_id: the lecture that is moved, if any: it doesn't conflict with itself
+        :return: a list of (hour_slot, date, hour_start, hour_end, list of the conflicts) for every hour slot of the
+                 group in the week
+        """
+        lecture = self.remove(assignment_id) if assignment_id is not None else None
+        targets = [(hour_slot_id, self.monday + datetime.timedelta(days=day_of_week), hour_start, hour_end,
+                    self._conflicts(teacher, course, room, self.times[(day_of_week, hour_start, hour_end)], normal))
+                   for day_of_week, hour_start, hour_end, hour_slot_id in self.hour_slots[hour_slots_group]]
+        if lecture is not None:
+            self._add(assignment_id, *lecture)
+        return targets
+
+
+def get_week_state(school_id, school_year_id, monday):
+    """
+    :return: the WeekState of the week starting on monday, from the cache as long as the assignments, the hour slots
+             and the rooms of the week don't change (see utils.get_week_versions), otherwise it is read again.
+    """
+    versions, _ = utils.get_week_versions(school_id, monday, monday)
+    key = utils.get_week_state_cache_key(school_id, school_year_id, monday)
+    cached = cache.get(key)
+    if cached is not None and cached[0] == versions:
+        return cached[1]
+    state = WeekState.load(school_id, school_year_id, monday)
+    cache.set(key, (versions, state), utils.WEEK_STATE_CACHE_TIMEOUT)
+    return state